@@ -0,0 +1,111 @@
+"""Store spectrum arrays as binary
+
+Revision ID: b7d2e4f1c8a3
+Revises: a3c1f0e9b2d4
+Create Date: 2021-05-31 10:41:52.208817
+
+"""
+import zlib
+
+from alembic import op
+import numpy as np
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7d2e4f1c8a3'
+down_revision = 'a3c1f0e9b2d4'
+branch_labels = None
+depends_on = None
+
+COLUMNS = ['wavelengths', 'fluxes', 'errors']
+NOT_NULL_COLUMNS = ['wavelengths', 'fluxes']
+BATCH_SIZE = 500
+
+# The NumpyBinaryArray storage format, as of this revision: magic, compressed
+# flag, dtype length, dtype, data. Copied here so that the migration does not
+# depend on skyportal.models.
+MAGIC = b'NPA1'
+
+
+def encode(value):
+    if value is None:
+        return None
+    array = np.ascontiguousarray(value, dtype='float64')
+    dtype = array.dtype.str.encode('ascii')
+    return MAGIC + bytes([False, len(dtype)]) + dtype + array.tobytes()
+
+
+def decode(value):
+    if value is None:
+        return None
+    value = memoryview(value)
+    if bytes(value[:4]) != MAGIC:
+        raise ValueError('Value is not a binary-encoded array.')
+    compressed, dtype_length = value[4], value[5]
+    dtype = np.dtype(bytes(value[6 : 6 + dtype_length]).decode('ascii'))
+    data = value[6 + dtype_length :]
+    if compressed:
+        data = zlib.decompress(data)
+    return np.frombuffer(data, dtype=dtype).tolist()
+
+
+def convert(old_type, new_type, convert_value):
+    """Copy the spectrum arrays to new columns of type `new_type`, converting
+    them in batches with `convert_value`, then replace the old columns."""
+    for column in COLUMNS:
+        op.add_column('spectra', sa.Column(f'{column}_new', new_type, nullable=True))
+
+    spectra = sa.Table(
+        'spectra',
+        sa.MetaData(),
+        sa.Column('id', sa.Integer()),
+        *[sa.Column(column, old_type) for column in COLUMNS],
+        *[sa.Column(f'{column}_new', new_type) for column in COLUMNS],
+    )
+    update = (
+        spectra.update()
+        .where(spectra.c.id == sa.bindparam('_id'))
+        .values({f'{column}_new': sa.bindparam(f'_{column}') for column in COLUMNS})
+    )
+
+    connection = op.get_bind()
+    last_id = 0
+    while True:
+        rows = connection.execute(
+            sa.select([spectra.c.id] + [spectra.c[column] for column in COLUMNS])
+            .where(spectra.c.id > last_id)
+            .order_by(spectra.c.id)
+            .limit(BATCH_SIZE)
+        ).fetchall()
+        if len(rows) == 0:
+            break
+        connection.execute(
+            update,
+            [
+                {
+                    '_id': row['id'],
+                    **{f'_{column}': convert_value(row[column]) for column in COLUMNS},
+                }
+                for row in rows
+            ],
+        )
+        last_id = rows[-1]['id']
+
+    for column in COLUMNS:
+        op.drop_column('spectra', column)
+        op.alter_column(
+            'spectra',
+            f'{column}_new',
+            new_column_name=column,
+            nullable=column not in NOT_NULL_COLUMNS,
+        )
+
+
+def upgrade():
+    convert(postgresql.ARRAY(sa.Float()), sa.LargeBinary(), encode)
+
+
+def downgrade():
+    convert(sa.LargeBinary(), postgresql.ARRAY(sa.Float()), decode)
@@ -0,0 +1,127 @@
+"""Keep the weather of all telescopes in use up to date.
+
+A telescope is in use once someone has asked for its weather (which creates
+its `Weather` row). Every `weather.poll_interval` seconds, the weather of
+telescopes not refreshed in the last `weather.refresh_time` seconds is
+fetched from OpenWeatherMap and stored, so that `/api/weather` only reads
+from the database.
+
+Stale rows are claimed with `SELECT ... FOR UPDATE SKIP LOCKED` and stay
+locked until their new weather is committed, so each telescope has at most
+one refresh in flight, even with several refreshers running.
+"""
+import datetime
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+import sqlalchemy as sa
+
+from baselayer.app.env import load_env
+from baselayer.app.flow import Flow
+from baselayer.log import make_log
+from skyportal.models import init_db, DBSession, Weather
+
+env, cfg = load_env()
+log = make_log('weather_refresher')
+
+weather_cfg = cfg.get('weather') or {}
+refresh_time = weather_cfg.get('refresh_time')
+poll_interval = weather_cfg.get('poll_interval', 60)
+openweather_api_key = weather_cfg.get('openweather_api_key')
+openweather_url = weather_cfg.get('openweather_url', 'https://api.openweathermap.org')
+
+# Largest number of telescopes fetched at once
+MAX_CONCURRENT_FETCHES = 8
+
+
+def fetch_weather(lat, lon):
+    """Fetch the weather at a site from OpenWeatherMap. Returns None if it
+    could not be fetched."""
+    url = (
+        f"{openweather_url}/data/2.5/onecall?"
+        f"lat={lat}&lon={lon}&appid={openweather_api_key}"
+    )
+    try:
+        # connect and read timeouts
+        response = requests.get(url, timeout=(6.05, 20))
+    except requests.exceptions.RequestException as e:
+        log(f"Could not fetch weather at lat={lat}, lon={lon}: {e}")
+        return None
+    if response.status_code != 200:
+        log(
+            f"Could not fetch weather at lat={lat}, lon={lon}: "
+            f"{response.status_code} {response.text}"
+        )
+        return None
+    return response.json()
+
+
+def refresh_weather():
+    """Refresh the weather of all telescopes whose weather is stale.
+
+    Returns
+    -------
+    int
+        Number of telescopes whose weather was refreshed
+    """
+    session = DBSession()
+    cutoff = datetime.datetime.utcnow() - datetime.timedelta(seconds=refresh_time)
+    try:
+        stale = (
+            session.query(Weather)
+            .filter(
+                sa.or_(Weather.retrieved_at.is_(None), Weather.retrieved_at < cutoff)
+            )
+            .with_for_update(skip_locked=True)
+            .all()
+        )
+        if len(stale) == 0:
+            session.commit()
+            return 0
+
+        sites = [(weather.telescope.lat, weather.telescope.lon) for weather in stale]
+        with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_FETCHES) as executor:
+            results = list(executor.map(lambda site: fetch_weather(*site), sites))
+
+        retrieved_at = datetime.datetime.utcnow()
+        n_refreshed = 0
+        for weather, weather_info in zip(stale, results):
+            if weather_info is not None:
+                weather.weather_info = weather_info
+                weather.retrieved_at = retrieved_at
+                n_refreshed += 1
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    return n_refreshed
+
+
+def service():
+    if refresh_time is None:
+        log("weather.refresh_time is not set: not refreshing the weather")
+        return
+    if not openweather_api_key:
+        log("weather.openweather_api_key is not set: not refreshing the weather")
+        return
+
+    flow = Flow()
+    while True:
+        try:
+            n_refreshed = refresh_weather()
+        except Exception as e:
+            log(f"Error refreshing the weather: {e}")
+        else:
+            if n_refreshed > 0:
+                log(f"Refreshed the weather of {n_refreshed} telescope(s)")
+                flow.push('*', 'skyportal/FETCH_WEATHER', {})
+        time.sleep(poll_interval)
+
+
+if __name__ == "__main__":
+    init_db(**cfg['database'])
+    service()
+    # keep supervisor from restarting a service with nothing to do
+    while True:
+        time.sleep(3600)
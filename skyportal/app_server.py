@@ -11,6 +11,7 @@ from skyportal.handlers.api import (
     AllocationHandler,
     AssignmentHandler,
     CandidateHandler,
+    CandidateBulkIngestHandler,
     ClassificationHandler,
     CommentHandler,
     CommentAttachmentHandler,
@@ -30,8 +31,10 @@ from skyportal.handlers.api import (
     UserObjListHandler,
     NewsFeedHandler,
     ObservingRunHandler,
+    ObservingRunStarlistHandler,
     PhotometryHandler,
     BulkDeletePhotometryHandler,
+    PhotometryBulkIngestHandler,
     ObjPhotometryHandler,
     ObjClassificationHandler,
     ObjAnnotationHandler,
@@ -75,6 +78,7 @@ from skyportal.handlers.api.internal import (
     RecentSourcesHandler,
     PlotAssignmentAirmassHandler,
     PlotObjTelAirmassHandler,
+    PlotAirmassBatchHandler,
     AnnotationsInfoHandler,
     EphemerisHandler,
     StandardsHandler,
@@ -92,6 +96,7 @@ skyportal_handlers = [
     (r'/api/acls', ACLHandler),
     (r'/api/allocation(/.*)?', AllocationHandler),
     (r'/api/assignment(/.*)?', AssignmentHandler),
+    (r'/api/candidates/bulk_ingest', CandidateBulkIngestHandler),
     (r'/api/candidates(/[0-9A-Za-z-_]+)/([0-9]+)', CandidateHandler),
     (r'/api/candidates(/.*)?', CandidateHandler),
     (r'/api/classification(/[0-9]+)?', ClassificationHandler),
@@ -120,9 +125,11 @@ skyportal_handlers = [
     (r'/api/invitations(/.*)?', InvitationHandler),
     (r'/api/newsfeed', NewsFeedHandler),
     (r'/api/observing_run(/[0-9]+)?', ObservingRunHandler),
+    (r'/api/observing_run/([0-9]+)/starlist', ObservingRunStarlistHandler),
     (r'/api/photometry(/[0-9]+)?', PhotometryHandler),
     (r'/api/sharing', SharingHandler),
     (r'/api/photometry/bulk_delete/(.*)', BulkDeletePhotometryHandler),
+    (r'/api/photometry/bulk_ingest', PhotometryBulkIngestHandler),
     (r'/api/photometry/range(/.*)?', PhotometryRangeHandler),
     (r'/api/roles', RoleHandler),
     (r'/api/sources(/[0-9A-Za-z-_\.]+)/photometry', ObjPhotometryHandler),
@@ -160,6 +167,7 @@ skyportal_handlers = [
     (r'/api/internal/plot/spectroscopy/(.*)', PlotSpectroscopyHandler),
     (r'/api/internal/instrument_forms', RoboticInstrumentsHandler),
     (r'/api/internal/standards', StandardsHandler),
+    (r'/api/internal/plot/airmass/batch', PlotAirmassBatchHandler),
     (r'/api/internal/plot/airmass/assignment/(.*)', PlotAssignmentAirmassHandler),
     (
         r'/api/internal/plot/airmass/objtel/(.*)/([0-9]+)',
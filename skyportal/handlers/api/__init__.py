@@ -1,6 +1,6 @@
 from .acls import ACLHandler, UserACLHandler
 from .allocation import AllocationHandler
-from .candidate import CandidateHandler
+from .candidate import CandidateHandler, CandidateBulkIngestHandler
 from .classification import ClassificationHandler, ObjClassificationHandler
 from .comment import CommentHandler, CommentAttachmentHandler
 from .annotation import AnnotationHandler, ObjAnnotationHandler
@@ -22,11 +22,12 @@ from .instrument import InstrumentHandler
 from .invalid import InvalidEndpointHandler
 from .invitations import InvitationHandler
 from .news_feed import NewsFeedHandler
-from .observingrun import ObservingRunHandler
+from .observingrun import ObservingRunHandler, ObservingRunStarlistHandler
 from .photometry import (
     PhotometryHandler,
     ObjPhotometryHandler,
     BulkDeletePhotometryHandler,
+    PhotometryBulkIngestHandler,
     PhotometryRangeHandler,
 )
 from .color_mag import ObjColorMagHandler
@@ -4,12 +4,19 @@ import re
 import json
 import ast
 import uuid
+import base64
+from concurrent.futures import ThreadPoolExecutor
 
 import arrow
-import numpy as np
+import requests
+from tornado.ioloop import IOLoop
 
-from sqlalchemy.orm import joinedload
-from sqlalchemy.sql.expression import case, func
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import insert as pg_insert, JSONB
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import joinedload, ColumnProperty
+from sqlalchemy.orm.attributes import InstrumentedAttribute
+from sqlalchemy.sql.expression import case, func, and_, or_, ClauseElement, Executable
 from sqlalchemy.types import Float, Boolean
 from marshmallow.exceptions import ValidationError
 
@@ -30,15 +37,19 @@ from ...models import (
     Classification,
     Listing,
     Comment,
+    Thumbnail,
 )
-from ...utils.cache import Cache, array_to_bytes
+from ...utils.cache import IDArray, make_query_result_cache
+from ...utils.thumbnail import image_is_grayscale
 
 
 _, cfg = load_env()
-cache_dir = "cache/candidates_queries"
-cache = Cache(
-    cache_dir=cache_dir,
-    max_age=cfg["misc"]["minutes_to_keep_candidate_query_cache"] * 60,
+# Ordered Obj IDs matched by candidate queries, by query ID, for paging
+query_result_cache = make_query_result_cache(
+    cfg["misc.candidate_query_cache_backend"],
+    max_bytes=cfg["misc.candidate_query_cache_max_megabytes"] * 2 ** 20,
+    max_age=cfg["misc.minutes_to_keep_candidate_query_cache"] * 60,
+    path="cache/candidates_queries.sqlite3",
 )
 
 
@@ -59,6 +70,148 @@ def update_redshift_history_if_relevant(request_data, obj, user):
         obj.redshift_history = redshift_history
 
 
+def get_candidates_nested_data(
+    objs, user, include_photometry=False, include_spectra=False, include_comments=False
+):
+    """Serialize a page of candidate Objs along with their nested data.
+
+    All related rows (saved groups, classifications, passing filters,
+    photometry, spectra, comments, annotations and detections) are fetched
+    for the whole page at once, so the number of queries issued does not
+    depend on the number of candidates on the page. Galactic coordinates and
+    distances are also computed for the whole page at once.
+
+    Parameters
+    ----------
+    objs : list of `skyportal.models.Obj`
+        The candidate Objs on the current page, in display order.
+    user : `baselayer.app.models.User` or `baselayer.app.models.Token`
+        The user or token whose access permissions are applied.
+    include_photometry, include_spectra, include_comments : bool
+        Whether to attach photometry, spectra and comments to each candidate.
+
+    Returns
+    -------
+    candidate_list : list of dict
+        The serialized candidates, in the same order as `objs`.
+    """
+    obj_ids = [obj.id for obj in objs]
+
+    def group_by_obj_id(rows):
+        grouped = {obj_id: [] for obj_id in obj_ids}
+        for row in rows:
+            grouped[row.obj_id].append(row)
+        return grouped
+
+    source_ids = {
+        obj_id
+        for obj_id, in Source.query_records_accessible_by(user, columns=[Source.obj_id])
+        .filter(Source.obj_id.in_(obj_ids))
+        .distinct()
+    }
+
+    saved_group_ids = {obj_id: [] for obj_id in obj_ids}
+    for obj_id, group_id in (
+        Source.query_records_accessible_by(
+            user, columns=[Source.obj_id, Source.group_id]
+        )
+        .filter(Source.obj_id.in_(source_ids))
+        .filter(Source.active.is_(True))
+    ):
+        saved_group_ids[obj_id].append(group_id)
+    groups = {
+        g.id: g
+        for g in Group.query_records_accessible_by(user)
+        .filter(
+            Group.id.in_({gid for gids in saved_group_ids.values() for gid in gids})
+        )
+        .all()
+    }
+
+    classifications = group_by_obj_id(
+        Classification.query_records_accessible_by(user)
+        .filter(Classification.obj_id.in_(source_ids))
+        .all()
+    )
+
+    candidate_filter_ids = {obj_id: set() for obj_id in obj_ids}
+    for obj_id, filter_id in Candidate.query_records_accessible_by(
+        user, columns=[Candidate.obj_id, Candidate.filter_id]
+    ).filter(Candidate.obj_id.in_(obj_ids)):
+        candidate_filter_ids[obj_id].add(filter_id)
+    filter_group_ids = {
+        f.id: f.group_id
+        for f in Filter.query_records_accessible_by(user).filter(
+            Filter.id.in_(set().union(*candidate_filter_ids.values()))
+        )
+    }
+
+    if include_photometry:
+        photometry = group_by_obj_id(
+            Photometry.query_records_accessible_by(
+                user, mode='read', options=[joinedload(Photometry.instrument)]
+            )
+            .filter(Photometry.obj_id.in_(obj_ids))
+            .all()
+        )
+    if include_spectra:
+        spectra = group_by_obj_id(
+            Spectrum.query_records_accessible_by(
+                user, mode='read', options=[joinedload(Spectrum.instrument)]
+            )
+            .filter(Spectrum.obj_id.in_(obj_ids))
+            .all()
+        )
+    if include_comments:
+        comments = group_by_obj_id(
+            Comment.query_records_accessible_by(user)
+            .filter(Comment.obj_id.in_(obj_ids))
+            .all()
+        )
+    annotations = group_by_obj_id(
+        Annotation.query_records_accessible_by(user)
+        .filter(Annotation.obj_id.in_(obj_ids))
+        .all()
+    )
+    detection_stats = Obj.detection_stats(obj_ids, user)
+    coordinates_and_distances = Obj.coordinates_and_distances(objs)
+
+    candidate_list = []
+    for obj, derived in zip(objs, coordinates_and_distances):
+        with DBSession().no_autoflush:
+            obj.is_source = obj.id in source_ids
+            if obj.is_source:
+                obj.saved_groups = [
+                    groups[group_id]
+                    for group_id in saved_group_ids[obj.id]
+                    if group_id in groups
+                ]
+                obj.classifications = classifications[obj.id]
+            obj.passing_group_ids = [
+                filter_group_ids[filter_id]
+                for filter_id in candidate_filter_ids[obj.id]
+                if filter_id in filter_group_ids
+            ]
+            candidate_list.append(recursive_to_dict(obj))
+            if include_photometry:
+                candidate_list[-1]["photometry"] = photometry[obj.id]
+            if include_spectra:
+                candidate_list[-1]["spectra"] = spectra[obj.id]
+            if include_comments:
+                candidate_list[-1]["comments"] = sorted(
+                    comments[obj.id], key=lambda x: x.created_at, reverse=True
+                )
+            candidate_list[-1]["annotations"] = sorted(
+                annotations[obj.id], key=lambda x: x.origin
+            )
+            candidate_list[-1]["last_detected_at"] = detection_stats[obj.id][
+                "last_detected_at"
+            ]
+            candidate_list[-1].update(derived)
+
+    return candidate_list
+
+
 class CandidateHandler(BaseHandler):
     @auth_or_token
     def head(self, obj_id=None):
@@ -153,6 +306,34 @@ class CandidateHandler(BaseHandler):
             description: |
               Used only in the case of paginating query results - if provided, this
               allows for avoiding a potentially expensive query.count() call.
+          - in: query
+            name: useCursor
+            nullable: true
+            schema:
+              type: boolean
+            description: |
+              Paginate with a cursor rather than a page number: the response
+              contains a `nextCursor` to pass as `cursor` to get the next page,
+              without counting and skipping the items of the previous pages.
+              Defaults to false.
+          - in: query
+            name: cursor
+            nullable: true
+            schema:
+              type: string
+            description: |
+              The `nextCursor` of the previous page of candidates, when paginating
+              with a cursor (implies useCursor). The other query parameters
+              must be the same as for the previous page.
+          - in: query
+            name: estimateTotalMatches
+            nullable: true
+            schema:
+              type: boolean
+            description: |
+              When paginating with a cursor, return the database's estimate of
+              the number of matches rather than counting them, which is faster
+              for large result sets. Defaults to false.
           - in: query
             name: savedStatus
             nullable: true
@@ -339,6 +520,17 @@ class CandidateHandler(BaseHandler):
                                 type: integer
                               numPerPage:
                                 type: integer
+                              nextCursor:
+                                type: string
+                                nullable: true
+                                description: |
+                                  Cursor of the next page, when paginating
+                                  with a cursor. Null on the last page.
+                              totalMatchesEstimated:
+                                type: boolean
+                                description: |
+                                  Whether totalMatches is an estimate, when
+                                  paginating with a cursor
             400:
               content:
                 application/json:
@@ -457,6 +649,13 @@ class CandidateHandler(BaseHandler):
         query_id = self.get_query_argument("queryID", None)
         saved_status = self.get_query_argument("savedStatus", "all")
         total_matches = self.get_query_argument("totalMatches", None)
+        cursor = self.get_query_argument("cursor", None)
+        use_cursor = cursor is not None or self.get_query_argument(
+            "useCursor", False
+        ) in ["true", True]
+        estimate_total_matches = self.get_query_argument(
+            "estimateTotalMatches", False
+        ) in ["true", True]
         start_date = self.get_query_argument("startDate", None)
         end_date = self.get_query_argument("endDate", None)
         group_ids = self.get_query_argument("groupIDs", None)
@@ -521,6 +720,11 @@ class CandidateHandler(BaseHandler):
         except ValueError:
             return self.error("Invalid numPerPage value.")
         n_per_page = min(n_per_page, 500)
+        if use_cursor and total_matches is not None:
+            try:
+                total_matches = int(total_matches)
+            except ValueError:
+                return self.error("Invalid totalMatches value.")
 
         initial_candidate_filter_criteria = [Candidate.filter_id.in_(filter_ids)]
         if start_date is not None and start_date.strip() not in [
@@ -561,7 +765,7 @@ class CandidateHandler(BaseHandler):
             # Don't apply the order by just yet. Save it so we can pass it to
             # the LIMT/OFFSET helper function down the line once other query
             # params are set.
-            order_by = [candidate_subquery.c.passed_at.desc().nullslast(), Obj.id]
+            sort_keys = [(candidate_subquery.c.passed_at, True), (Obj.id, False)]
 
         if saved_status in [
             "savedToAllSelected",
@@ -750,122 +954,52 @@ class CandidateHandler(BaseHandler):
                 whens={sort_by_origin: 1},
                 else_=None,
             )
-            annotation_sort_criterion = (
-                Annotation.data[sort_by_key].desc().nullslast()
-                if sort_by_order == "desc"
-                else Annotation.data[sort_by_key].nullslast()
-            )
             # Don't apply the order by just yet. Save it so we can pass it to
             # the LIMT/OFFSET helper function.
-            order_by = [
-                origin_sort_order.nullslast(),
-                annotation_sort_criterion,
-                candidate_subquery.c.passed_at.desc().nullslast(),
-                Obj.id,
+            sort_keys = [
+                (origin_sort_order, False),
+                (Annotation.data[sort_by_key], sort_by_order == "desc"),
+                (candidate_subquery.c.passed_at, True),
+                (Obj.id, False),
             ]
 
-        try:
-            query_results = grab_query_results(
-                q,
-                total_matches,
-                page,
-                n_per_page,
-                "candidates",
-                order_by=order_by,
-                query_id=query_id,
-                use_cache=True,
-            )
-        except ValueError as e:
-            if "Page number out of range" in str(e):
-                return self.error("Page number out of range.")
-            raise
-        matching_source_ids = (
-            Source.query_records_accessible_by(
-                self.current_user, columns=[Source.obj_id]
-            )
-            .filter(Source.obj_id.in_([obj.id for obj in query_results["candidates"]]))
-            .all()
-        )
-        candidate_list = []
-        for obj in query_results["candidates"]:
-            with DBSession().no_autoflush:
-                obj.is_source = (obj.id,) in matching_source_ids
-                if obj.is_source:
-                    source_subquery = (
-                        Source.query_records_accessible_by(self.current_user)
-                        .filter(Source.obj_id == obj.id)
-                        .filter(Source.active.is_(True))
-                        .subquery()
-                    )
-                    obj.saved_groups = (
-                        Group.query_records_accessible_by(self.current_user)
-                        .join(source_subquery, Group.id == source_subquery.c.group_id)
-                        .all()
-                    )
-                    obj.classifications = (
-                        Classification.query_records_accessible_by(self.current_user)
-                        .filter(Classification.obj_id == obj.id)
-                        .all()
-                    )
-                obj.passing_group_ids = [
-                    f.group_id
-                    for f in (
-                        Filter.query_records_accessible_by(self.current_user).filter(
-                            Filter.id.in_(
-                                Candidate.query_records_accessible_by(
-                                    self.current_user, columns=[Candidate.filter_id]
-                                ).filter(Candidate.obj_id == obj.id)
-                            )
-                        )
-                    )
-                ]
-                candidate_list.append(recursive_to_dict(obj))
-                if include_photometry:
-                    candidate_list[-1]["photometry"] = (
-                        Photometry.query_records_accessible_by(
-                            self.current_user,
-                            mode='read',
-                            options=[joinedload(Photometry.instrument)],
-                        )
-                        .filter(Photometry.obj_id == obj.id)
-                        .all()
-                    )
-
-                if include_spectra:
-                    candidate_list[-1]["spectra"] = (
-                        Spectrum.query_records_accessible_by(
-                            self.current_user,
-                            mode='read',
-                            options=[joinedload(Spectrum.instrument)],
-                        )
-                        .filter(Spectrum.obj_id == obj.id)
-                        .all()
-                    )
-
-                if include_comments:
-                    candidate_list[-1]["comments"] = sorted(
-                        Comment.query_records_accessible_by(self.current_user)
-                        .filter(Comment.obj_id == obj.id)
-                        .all(),
-                        key=lambda x: x.created_at,
-                        reverse=True,
-                    )
-                candidate_list[-1]["annotations"] = sorted(
-                    Annotation.query_records_accessible_by(self.current_user)
-                    .filter(Annotation.obj_id == obj.id)
-                    .all(),
-                    key=lambda x: x.origin,
+        if use_cursor:
+            try:
+                query_results = grab_query_results_by_cursor(
+                    q,
+                    sort_keys,
+                    cursor,
+                    n_per_page,
+                    "candidates",
+                    total_matches=total_matches,
+                    estimate_total_matches=estimate_total_matches,
                 )
-                candidate_list[-1]["last_detected_at"] = obj.last_detected_at(
-                    self.current_user
+            except ValueError as e:
+                return self.error(str(e))
+        else:
+            try:
+                query_results = grab_query_results(
+                    q,
+                    total_matches,
+                    page,
+                    n_per_page,
+                    "candidates",
+                    order_by=order_by_from_sort_keys(sort_keys),
+                    query_id=query_id,
+                    use_cache=True,
+                    filter_ids=filter_ids,
                 )
-                candidate_list[-1]["gal_lat"] = obj.gal_lat_deg
-                candidate_list[-1]["gal_lon"] = obj.gal_lon_deg
-                candidate_list[-1]["luminosity_distance"] = obj.luminosity_distance
-                candidate_list[-1]["dm"] = obj.dm
-                candidate_list[-1][
-                    "angular_diameter_distance"
-                ] = obj.angular_diameter_distance
+            except ValueError as e:
+                if "Page number out of range" in str(e):
+                    return self.error("Page number out of range.")
+                raise
+        candidate_list = get_candidates_nested_data(
+            query_results["candidates"],
+            self.current_user,
+            include_photometry=include_photometry,
+            include_spectra=include_spectra,
+            include_comments=include_comments,
+        )
 
         query_results["candidates"] = candidate_list
         query_results = recursive_to_dict(query_results)
@@ -971,6 +1105,8 @@ class CandidateHandler(BaseHandler):
         ]
         DBSession().add_all(candidates)
         self.verify_and_commit()
+        # cached query results of these filters are missing the new candidates
+        query_result_cache.invalidate_filters([filter.id for filter in filters])
         if not obj_already_exists:
             obj.add_linked_thumbnails()
 
@@ -1017,6 +1153,367 @@ class CandidateHandler(BaseHandler):
         return self.success()
 
 
+# Downloading a thumbnail to tell whether it is grayscale is slow, so the
+# thumbnails of bulk-ingested candidates are classified in the background
+thumbnail_executor = ThreadPoolExecutor(max_workers=8)
+
+# Obj columns that are set by the server rather than by the uploader
+OBJ_SERVER_COLUMNS = {'internal_key', 'redshift_history', 'created_at', 'modified'}
+
+
+def thumbnail_is_grayscale(public_url):
+    try:
+        return image_is_grayscale(
+            requests.get(public_url, stream=True, timeout=(6.05, 20)).raw
+        )
+    except requests.exceptions.RequestException:
+        return False
+
+
+def classify_thumbnails_grayscale(thumbnails):
+    """Set `is_grayscale` on the thumbnails given as (ID, public URL) pairs,
+    downloading them concurrently."""
+    try:
+        ids = [id for id, _ in thumbnails]
+        grayscale = thumbnail_executor.map(
+            thumbnail_is_grayscale, [url for _, url in thumbnails]
+        )
+        grayscale_ids = [id for id, is_grayscale in zip(ids, grayscale) if is_grayscale]
+        if len(grayscale_ids) > 0:
+            DBSession().execute(
+                sa.update(Thumbnail.__table__)
+                .where(Thumbnail.id.in_(grayscale_ids))
+                .values(is_grayscale=True)
+            )
+            DBSession().commit()
+    finally:
+        DBSession.remove()
+
+
+class CandidateBulkIngestHandler(BaseHandler):
+    # Number of rows written per INSERT statement
+    CHUNK_SIZE = 1000
+
+    def parse_item(self, item, accessible_filter_ids):
+        """Validate one candidate of the upload. Returns the Obj row, the
+        filter IDs, and the Candidate attributes common to all its filters,
+        or raises a ValidationError."""
+        if not isinstance(item, dict):
+            raise ValidationError("Each candidate must be an object.")
+        item = dict(item)
+        if item.get("id") is None:
+            raise ValidationError("Missing required parameter: `id`.")
+        passing_alert_id = item.pop("passing_alert_id", None)
+        passed_at = item.pop("passed_at", None)
+        if passed_at is None:
+            raise ValidationError("Missing required parameter: `passed_at`.")
+        try:
+            passed_at = arrow.get(passed_at).to('utc').naive
+        except (arrow.parser.ParserError, TypeError, ValueError):
+            raise ValidationError(f"Invalid passed_at: {passed_at}")
+        filter_ids = item.pop("filter_ids", None)
+        if filter_ids is None:
+            raise ValidationError("Missing required filter_ids parameter.")
+        filter_ids = [i for i in filter_ids if i in accessible_filter_ids]
+        if len(filter_ids) == 0:
+            raise ValidationError("At least one valid filter ID must be provided.")
+
+        errors = Obj.__schema__().validate(item)
+        if errors:
+            raise ValidationError(f"Invalid/missing parameters: {errors}")
+        unknown = set(item) - set(Obj.__table__.columns.keys())
+        if unknown or set(item) & OBJ_SERVER_COLUMNS:
+            raise ValidationError(
+                "Invalid parameters: "
+                f"{', '.join(sorted(unknown | (set(item) & OBJ_SERVER_COLUMNS)))}"
+            )
+
+        candidate = {
+            "passed_at": passed_at,
+            "passing_alert_id": passing_alert_id,
+            "uploader_id": self.associated_user_object.id,
+        }
+        return item, filter_ids, candidate
+
+    def upsert_objs(self, rows):
+        """Insert the Objs in `rows` (dicts of Obj columns, one per Obj), or
+        update the given columns of those that already exist, and extend
+        their redshift history. Returns the IDs of the newly created Objs.
+
+        Rows are grouped by the set of columns they provide, so that existing
+        Objs only have those columns updated."""
+        by_columns = {}
+        for row in rows:
+            by_columns.setdefault(tuple(sorted(row)), []).append(row)
+
+        user = self.associated_user_object
+        created_ids = set()
+        for columns, group in by_columns.items():
+            for start in range(0, len(group), self.CHUNK_SIZE):
+                values = []
+                for row in group[start : start + self.CHUNK_SIZE]:
+                    row = dict(row)
+                    if "redshift" in row:
+                        row["redshift_history"] = [
+                            {
+                                "set_by_user_id": user.id,
+                                "set_at_utc": datetime.datetime.utcnow().isoformat(),
+                                "value": row["redshift"],
+                                "uncertainty": row.get("redshift_error", None),
+                            }
+                        ]
+                    values.append(row)
+
+                stmt = pg_insert(Obj.__table__).values(values)
+                update = {
+                    column: stmt.excluded[column]
+                    for column in columns
+                    if column != "id"
+                }
+                update["modified"] = stmt.excluded.modified
+                if "redshift" in columns:
+                    update["redshift_history"] = sa.func.coalesce(
+                        Obj.__table__.c.redshift_history, sa.cast("[]", JSONB)
+                    ).op("||")(stmt.excluded.redshift_history)
+                # xmax is 0 for rows that were inserted rather than updated
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=["id"], set_=update
+                ).returning(Obj.id, sa.literal_column("xmax = 0"))
+                created_ids |= {
+                    id for id, created in DBSession().execute(stmt) if created
+                }
+        return created_ids
+
+    def insert_candidates(self, rows):
+        """Insert the Candidates in `rows`, skipping those that already exist
+        per `candidates_main_index`. Returns a dict mapping the (obj_id,
+        filter_id, passed_at) of each inserted Candidate to its ID."""
+        ids = {}
+        for start in range(0, len(rows), self.CHUNK_SIZE):
+            stmt = (
+                pg_insert(Candidate.__table__)
+                .values(rows[start : start + self.CHUNK_SIZE])
+                .on_conflict_do_nothing(
+                    index_elements=["obj_id", "filter_id", "passed_at"]
+                )
+                .returning(
+                    Candidate.id,
+                    Candidate.obj_id,
+                    Candidate.filter_id,
+                    Candidate.passed_at,
+                )
+            )
+            for id, obj_id, filter_id, passed_at in DBSession().execute(stmt):
+                ids[(obj_id, filter_id, passed_at)] = id
+        return ids
+
+    def insert_linked_thumbnails(self, positions):
+        """Insert the SDSS and DESI DR8 thumbnails of the new Objs, given as a
+        dict of obj_id: (ra, dec). Returns the (ID, public URL) of each
+        thumbnail."""
+        rows = []
+        for obj_id, (ra, dec) in positions.items():
+            obj = Obj(ra=ra, dec=dec)
+            rows.append({"obj_id": obj_id, "public_url": obj.sdss_url, "type": "sdss"})
+            rows.append(
+                {"obj_id": obj_id, "public_url": obj.desi_dr8_url, "type": "dr8"}
+            )
+        thumbnails = []
+        for start in range(0, len(rows), self.CHUNK_SIZE):
+            stmt = (
+                pg_insert(Thumbnail.__table__)
+                .values(rows[start : start + self.CHUNK_SIZE])
+                .returning(Thumbnail.id, Thumbnail.public_url)
+            )
+            thumbnails.extend(tuple(row) for row in DBSession().execute(stmt))
+        return thumbnails
+
+    @permissions(["Upload data"])
+    def post(self):
+        """
+        ---
+        description: |
+          Create candidates for many objects at once. Objs are created, or
+          updated with the given fields if they already exist, and one
+          Candidate is created per filter. The whole upload is written in a
+          single transaction with set-based statements. Candidates that
+          already exist (same object, filter and passed_at) are skipped, and
+          invalid candidates are reported without failing the others.
+        tags:
+          - candidates
+        requestBody:
+          content:
+            application/json:
+              schema:
+                type: array
+                items:
+                  allOf:
+                    - $ref: '#/components/schemas/ObjPost'
+                    - type: object
+                      properties:
+                        filter_ids:
+                          type: array
+                          items:
+                            type: integer
+                          description: List of associated filter IDs
+                        passing_alert_id:
+                          type: integer
+                          description: ID of associated filter that created candidate
+                          nullable: true
+                        passed_at:
+                          type: string
+                          description: Arrow-parseable datetime string indicating when passed filter.
+                      required:
+                        - filter_ids
+                        - passed_at
+        responses:
+          200:
+            content:
+              application/json:
+                schema:
+                  allOf:
+                    - $ref: '#/components/schemas/Success'
+                    - type: object
+                      properties:
+                        data:
+                          type: object
+                          properties:
+                            results:
+                              type: array
+                              description: |
+                                One result per uploaded candidate, in order
+                              items:
+                                type: object
+                                properties:
+                                  obj_id:
+                                    type: string
+                                  status:
+                                    type: string
+                                    enum: [success, duplicate, error]
+                                    description: |
+                                      "duplicate" if all the candidates of
+                                      this object already existed
+                                  ids:
+                                    type: array
+                                    items:
+                                      type: integer
+                                    description: IDs of the new candidates
+                                  duplicate_filter_ids:
+                                    type: array
+                                    items:
+                                      type: integer
+                                    description: |
+                                      Filters for which the candidate
+                                      already existed
+                                  message:
+                                    type: string
+                                    description: Why the candidate is invalid
+          400:
+            content:
+              application/json:
+                schema: Error
+        """
+        items = self.get_json()
+        if not isinstance(items, list):
+            return self.error("Request body must be a list of candidates.")
+
+        requested_filter_ids = {
+            filter_id
+            for item in items
+            if isinstance(item, dict) and isinstance(item.get("filter_ids"), list)
+            for filter_id in item["filter_ids"]
+            if isinstance(filter_id, int)
+        }
+        accessible_filter_ids = {
+            id
+            for id, in Filter.query_records_accessible_by(
+                self.current_user, columns=[Filter.id]
+            ).filter(Filter.id.in_(requested_filter_ids))
+        }
+
+        obj_ids = {
+            item["id"]
+            for item in items
+            if isinstance(item, dict) and isinstance(item.get("id"), str)
+        }
+        existing_obj_ids = set()
+        obj_ids = list(obj_ids)
+        for start in range(0, len(obj_ids), self.CHUNK_SIZE):
+            existing_obj_ids |= {
+                id
+                for id, in DBSession()
+                .query(Obj.id)
+                .filter(Obj.id.in_(obj_ids[start : start + self.CHUNK_SIZE]))
+            }
+
+        results = []
+        parsed = []
+        obj_rows = {}
+        for item in items:
+            obj_id = item.get("id") if isinstance(item, dict) else None
+            try:
+                obj_row, filter_ids, candidate = self.parse_item(
+                    item, accessible_filter_ids
+                )
+                if obj_id not in existing_obj_ids and obj_id not in obj_rows:
+                    if obj_row.get("ra") is None:
+                        raise ValidationError("RA must not be null for a new Obj")
+                    if obj_row.get("dec") is None:
+                        raise ValidationError("Dec must not be null for a new Obj")
+            except ValidationError as e:
+                results.append({"obj_id": obj_id, "status": "error", "message": str(e)})
+                parsed.append(None)
+                continue
+            # an Obj listed several times is upserted once, with the fields of
+            # all its entries
+            obj_rows.setdefault(obj_id, {}).update(obj_row)
+            parsed.append((obj_id, filter_ids, candidate))
+            results.append({"obj_id": obj_id})
+
+        created_obj_ids = self.upsert_objs(list(obj_rows.values()))
+
+        candidate_rows = [
+            {"obj_id": obj_id, "filter_id": filter_id, **candidate}
+            for obj_id, filter_ids, candidate in (e for e in parsed if e is not None)
+            for filter_id in filter_ids
+        ]
+        candidate_ids = self.insert_candidates(candidate_rows)
+        new_candidate_filter_ids = {filter_id for _, filter_id, _ in candidate_ids}
+
+        for result, entry in zip(results, parsed):
+            if entry is None:
+                continue
+            obj_id, filter_ids, candidate = entry
+            result["ids"] = []
+            result["duplicate_filter_ids"] = []
+            for filter_id in filter_ids:
+                # a Candidate listed twice in the upload is created once
+                id = candidate_ids.pop(
+                    (obj_id, filter_id, candidate["passed_at"]), None
+                )
+                if id is None:
+                    result["duplicate_filter_ids"].append(filter_id)
+                else:
+                    result["ids"].append(id)
+            result["status"] = "success" if result["ids"] else "duplicate"
+
+        thumbnails = self.insert_linked_thumbnails(
+            {
+                obj_id: (obj_rows[obj_id].get("ra"), obj_rows[obj_id].get("dec"))
+                for obj_id in created_obj_ids
+            }
+        )
+        self.verify_and_commit()
+        query_result_cache.invalidate_filters(new_candidate_filter_ids)
+
+        if len(thumbnails) > 0:
+            IOLoop.current().run_in_executor(
+                None, classify_thumbnails_grayscale, thumbnails
+            )
+
+        return self.success(data={"results": results})
+
+
 def grab_query_results(
     q,
     total_matches,
@@ -1027,6 +1524,7 @@ def grab_query_results(
     include_thumbnails=True,
     query_id=None,
     use_cache=False,
+    filter_ids=(),
 ):
     # The query will return multiple rows per candidate object if it has multiple
     # annotations associated with it, with rows appearing at the end of the query
@@ -1078,18 +1576,17 @@ def grab_query_results(
 
     if page:
         if use_cache:
-            cache_filename = cache[query_id]
-            if cache_filename is not None:
-                all_ids = np.load(cache_filename)
-            else:
-                # Cache expired/removed/non-existent; create new cache file
+            all_ids = query_result_cache.get(query_id) if query_id is not None else None
+            if all_ids is None:
+                # Cache expired/evicted/invalidated/non-existent; run the query
                 query_id = str(uuid.uuid4())
-                all_ids = ordered_ids.all()
-                cache[query_id] = array_to_bytes(all_ids)
+                all_ids = IDArray.from_ids(id for id, _ in ordered_ids.all())
+                query_result_cache.set(query_id, all_ids, filter_ids=filter_ids)
 
-            results = all_ids[
+            page_ids = all_ids[
                 ((page - 1) * n_items_per_page) : (page * n_items_per_page)
             ]
+            info["totalMatches"] = len(all_ids)
             info["queryID"] = query_id
         else:
             results = (
@@ -1102,8 +1599,9 @@ def grab_query_results(
     else:
         results = ordered_ids.all()
 
-    page_ids = map(lambda x: x[0], results)
-    info["totalMatches"] = int(results[0][1]) if len(results) > 0 else 0
+    if not (page and use_cache):
+        page_ids = [x[0] for x in results]
+        info["totalMatches"] = int(results[0][1]) if len(results) > 0 else 0
 
     if page:
         if (
@@ -1123,9 +1621,199 @@ def grab_query_results(
         ):
             raise ValueError("Page number out of range.")
 
-    items = []
+    info[items_name] = get_objs_in_order(page_ids, include_thumbnails)
+    return info
+
+
+def get_objs_in_order(obj_ids, include_thumbnails=True):
+    """Fetch the Objs with IDs `obj_ids` at once, in the order of `obj_ids`."""
     query_options = [joinedload(Obj.thumbnails)] if include_thumbnails else []
-    for item_id in page_ids:
-        items.append(Obj.query.options(query_options).get(item_id))
-    info[items_name] = items
+    objs_by_id = {
+        obj.id: obj
+        for obj in Obj.query.options(query_options).filter(Obj.id.in_(obj_ids)).all()
+    }
+    return [objs_by_id[obj_id] for obj_id in obj_ids if obj_id in objs_by_id]
+
+
+def order_by_from_sort_keys(sort_keys):
+    """ORDER BY clauses for a list of (expression, descending) sort keys.
+    NULLs are sorted last."""
+    return [
+        (key.desc() if descending else key.asc()).nullslast()
+        for key, descending in sort_keys
+    ]
+
+
+class Explain(Executable, ClauseElement):
+    """EXPLAIN of a statement, returning the query plan as JSON."""
+
+    def __init__(self, statement):
+        self.statement = statement
+
+
+@compiles(Explain, "postgresql")
+def compile_explain(element, compiler, **kw):
+    return "EXPLAIN (FORMAT JSON) " + compiler.process(element.statement, **kw)
+
+
+def encode_cursor(values):
+    """Opaque pagination cursor for the sort key values of an item."""
+    values = [v.isoformat() if isinstance(v, datetime.datetime) else v for v in values]
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+def decode_cursor(cursor, n_values):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor.")
+    if not isinstance(values, list) or len(values) != n_values:
+        raise ValueError("Invalid cursor.")
+    return values
+
+
+def is_obj_column(key):
+    """Whether a sort key is a column of Obj, and thus has the same value on
+    all the rows of an Obj in a query."""
+    return (
+        isinstance(key, InstrumentedAttribute)
+        and key.class_ is Obj
+        and isinstance(key.property, ColumnProperty)
+    )
+
+
+def after_cursor(keys, descending, values):
+    """Filter for the rows that come after the sort key `values` of a cursor:
+    those that are equal to it on the first keys and after it on the next
+    one (with NULLs last)."""
+    clauses = []
+    for i, (key, desc, value) in enumerate(zip(keys, descending, values)):
+        if value is None:
+            continue
+        after = or_(key < value if desc else key > value, key.is_(None))
+        clauses.append(
+            and_(
+                *[k.isnot_distinct_from(v) for k, v in zip(keys[:i], values[:i])],
+                after,
+            )
+        )
+    return or_(*clauses)
+
+
+def grab_query_results_by_cursor(
+    q,
+    sort_keys,
+    cursor,
+    n_items_per_page,
+    items_name,
+    total_matches=None,
+    estimate_total_matches=False,
+    include_thumbnails=True,
+):
+    """Paginate the Objs of a query with keyset (cursor) pagination.
+
+    Each Obj is ranked by the values of `sort_keys` on the first of its rows
+    in the query (as `grab_query_results` does), and the page is the
+    `n_items_per_page` Objs that come after `cursor` in that order.
+
+    When all the sort keys are columns of Obj, the cursor filter and the
+    ordering are applied to the query itself: the rows of the previous pages
+    are excluded by the WHERE clause, and PostgreSQL can stop after the
+    first `n_items_per_page + 1` Objs when it reads them in order from an
+    index on the sort keys. Otherwise (e.g., sorting on annotations or on
+    when candidates passed), the sort keys of an Obj are only known once all
+    its rows are ranked, so every page still sorts all the matching rows;
+    the cursor only saves numbering and skipping the Objs of the previous
+    pages.
+
+    Parameters
+    ----------
+    q : `sqlalchemy.orm.Query`
+        Query on Obj, possibly returning several rows per Obj.
+    sort_keys : list of (expression, bool)
+        The expressions to sort on, and whether each is sorted in descending
+        order. NULLs are sorted last. Obj.id is added as the last key if it
+        is not already, so that the order is total.
+    cursor : str or None
+        The `nextCursor` of the previous page, or None for the first page.
+    n_items_per_page : int
+        Number of Objs per page.
+    items_name : str
+        Key of the Objs in the returned dict.
+    total_matches : int, optional
+        The number of matching Objs, if already known (e.g., from the first
+        page), in which case they are not counted again.
+    estimate_total_matches : bool, optional
+        If True, the number of matching Objs is the query planner's estimate
+        rather than an exact count, which requires reading all matches.
+    include_thumbnails : bool, optional
+        Whether to load the thumbnails of the Objs.
+
+    Returns
+    -------
+    dict
+        The page of Objs, `numPerPage`, `totalMatches`,
+        `totalMatchesEstimated`, and the `nextCursor` of the next page (None
+        on the last page).
+    """
+    sort_keys = list(sort_keys)
+    if len(sort_keys) == 0 or sort_keys[-1][0] is not Obj.id:
+        sort_keys.append((Obj.id, False))
+    descending = [desc for _, desc in sort_keys]
+    values = None if cursor is None else decode_cursor(cursor, len(sort_keys))
+
+    if all(is_obj_column(key) for key, _ in sort_keys):
+        # all the rows of an Obj have its sort key values: rank the rows,
+        # keeping the first of each Obj
+        keys = [key for key, _ in sort_keys]
+        page_query = q.with_entities(*keys)
+        if values is not None:
+            page_query = page_query.filter(after_cursor(keys, descending, values))
+        page_query = page_query.distinct(*keys).order_by(
+            *order_by_from_sort_keys(zip(keys, descending))
+        )
+        matches = q.with_entities(Obj.id).distinct()
+    else:
+        # rank the Objs by the sort key values of their first row
+        labels = [f"sort_key_{i}" for i in range(len(sort_keys))]
+        full_query = q.add_columns(
+            *[key.label(label) for (key, _), label in zip(sort_keys, labels)]
+        ).subquery()
+        keys = [full_query.c[label] for label in labels]
+        per_obj = (
+            DBSession()
+            .query(full_query.c.id, *keys)
+            .distinct(full_query.c.id)
+            .order_by(full_query.c.id, *order_by_from_sort_keys(zip(keys, descending)))
+            .subquery()
+        )
+        keys = [per_obj.c[label] for label in labels]
+        page_query = DBSession().query(*keys)
+        if values is not None:
+            page_query = page_query.filter(after_cursor(keys, descending, values))
+        page_query = page_query.order_by(
+            *order_by_from_sort_keys(zip(keys, descending))
+        )
+        matches = DBSession().query(per_obj.c.id)
+    # Obj.id is the last key
+    rows = page_query.limit(n_items_per_page + 1).all()
+
+    info = {"numPerPage": n_items_per_page}
+    if len(rows) > n_items_per_page:
+        rows = rows[:n_items_per_page]
+        info["nextCursor"] = encode_cursor(rows[-1])
+    else:
+        info["nextCursor"] = None
+
+    info["totalMatchesEstimated"] = False
+    if total_matches is not None:
+        info["totalMatches"] = total_matches
+    elif estimate_total_matches:
+        plan = DBSession().execute(Explain(matches.statement)).scalar()
+        info["totalMatches"] = int(plan[0]["Plan"]["Plan Rows"])
+        info["totalMatchesEstimated"] = True
+    else:
+        info["totalMatches"] = matches.count()
+
+    info[items_name] = get_objs_in_order([row[-1] for row in rows], include_thumbnails)
     return info
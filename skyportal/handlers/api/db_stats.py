@@ -1,5 +1,6 @@
 from baselayer.app.access import permissions
 from ..base import BaseHandler
+from .candidate import query_result_cache
 from ...models import (
     DBSession,
     Obj,
@@ -67,6 +68,13 @@ class StatsHandler(BaseHandler):
                               description: |
                                 Datetime string corresponding to created_at column of
                                 the newest row in the candidates table.
+                            Candidate query cache:
+                              type: object
+                              description: |
+                                Hits, misses, hit rate, evictions and
+                                invalidations of the cache of candidate query
+                                results in the app process answering, and the
+                                number and total size (bytes) of its entries.
         """
         data = {}
         data["Number of candidates"] = Candidate.query.count()
@@ -99,6 +107,7 @@ class StatsHandler(BaseHandler):
         data["Oldest unsaved candidate creation datetime"] = (
             cand.created_at if cand is not None else None
         )
+        data["Candidate query cache"] = query_result_cache.stats
         data["Latest cron job run times & statuses"] = []
         cron_job_scripts = DBSession().query(CronJobRun.script).distinct().all()
         for script in cron_job_scripts:
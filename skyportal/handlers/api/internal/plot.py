@@ -1,10 +1,16 @@
+import json
+
 from baselayer.app.access import auth_or_token
+from baselayer.app.env import load_env
 from ...base import BaseHandler
 from .... import plot
 from ....models import ClassicalAssignment, Obj, Telescope
+from ....utils.cache import MemoryCache
+from ....utils.ephemeris import get_night_frame, pickering_airmass
 
 import numpy as np
 from astropy import time as ap_time
+from astropy.coordinates import SkyCoord
 import pandas as pd
 
 
@@ -16,6 +22,17 @@ device_types = [
     "tablet_portrait",
 ]
 
+_, cfg = load_env()
+
+# Rendered photometry plots, keyed by what determines their content: the
+# object and the version of its data, what the user has access to, and the
+# plot dimensions
+photometry_plot_cache = MemoryCache(
+    max_items=cfg["misc.photometry_plot_cache_max_items"],
+    max_bytes=cfg["misc.photometry_plot_cache_max_megabytes"] * 2 ** 20,
+    sizeof=lambda item: len(json.dumps(item)),
+)
+
 
 class PlotPhotometryHandler(BaseHandler):
     @auth_or_token
@@ -25,12 +42,36 @@ class PlotPhotometryHandler(BaseHandler):
         # Just return browser by default if not one of accepted types
         if device not in device_types:
             device = "browser"
-        json = plot.photometry_plot(
+        # Bin dense light curves down to this many points
+        max_points = self.get_query_argument("maxPoints", None)
+        if max_points is not None:
+            try:
+                max_points = int(max_points)
+            except ValueError:
+                return self.error("maxPoints must be an integer")
+            if max_points < 1:
+                return self.error("maxPoints must be positive")
+        user = self.current_user
+        key = (
             obj_id,
-            self.current_user,
-            width=int(width),
-            device=device,
+            plot.photometry_plot_version(obj_id, self.associated_user_object.id),
+            user.is_system_admin,
+            tuple(sorted(g.id for g in user.accessible_groups)),
+            tuple(sorted(s.id for s in user.accessible_streams)),
+            int(width),
+            device,
+            max_points,
         )
+        json = photometry_plot_cache[key]
+        if json is None:
+            json = plot.photometry_plot(
+                obj_id,
+                self.current_user,
+                width=int(width),
+                device=device,
+                max_points=max_points,
+            )
+            photometry_plot_cache[key] = json
         self.verify_and_commit()
         self.success(data={'bokehJSON': json, 'url': self.request.uri})
 
@@ -44,12 +85,22 @@ class PlotSpectroscopyHandler(BaseHandler):
         if device not in device_types:
             device = "browser"
         spec_id = self.get_query_argument("spectrumID", None)
+        # Resample dense spectra down to this many points
+        max_points = self.get_query_argument("maxPoints", None)
+        if max_points is not None:
+            try:
+                max_points = int(max_points)
+            except ValueError:
+                return self.error("maxPoints must be an integer")
+            if max_points < 1:
+                return self.error("maxPoints must be positive")
         json = plot.spectroscopy_plot(
             obj_id,
             self.associated_user_object,
             spec_id,
             width=int(width),
             device=device,
+            max_points=max_points,
         )
         self.verify_and_commit()
         self.success(data={'bokehJSON': json, 'url': self.request.uri})
@@ -77,11 +128,9 @@ class PlotAssignmentAirmassHandler(AirmassHandler):
         telescope = assignment.run.instrument.telescope
         time = assignment.run.calendar_noon
 
-        sunrise = telescope.next_sunrise(time=time)
-        sunset = telescope.next_sunset(time=time)
-
-        if sunset > sunrise:
-            sunset = telescope.observer.sun_set_time(time, which='previous')
+        night = telescope.night_ephemeris(time)
+        sunrise = night['sunrise']
+        sunset = night['sunset']
 
         json = self.calculate_airmass(obj, telescope, sunrise, sunset)
         self.verify_and_commit()
@@ -111,12 +160,168 @@ class PlotObjTelAirmassHandler(AirmassHandler):
             telescope_id, self.current_user, raise_if_none=True
         )
 
-        sunrise = telescope.next_sunrise(time=time)
-        sunset = telescope.next_sunset(time=time)
-
-        if sunset > sunrise:
-            sunset = telescope.observer.sun_set_time(time, which='previous')
+        night = telescope.night_ephemeris(time)
+        sunrise = night['sunrise']
+        sunset = night['sunset']
 
         json = self.calculate_airmass(obj, telescope, sunrise, sunset)
         self.verify_and_commit()
         return self.success(data=json)
+
+
+class PlotAirmassBatchHandler(BaseHandler):
+    # Largest number of objects x telescopes computed in one request
+    MAX_PAIRS = 10000
+
+    @auth_or_token
+    def get(self):
+        """
+        ---
+        description: |
+          Altitude and airmass of many objects from many telescopes over a
+          night, sampled from sunset to sunrise
+        tags:
+          - sources
+          - telescopes
+        parameters:
+        - in: query
+          name: objIDs
+          required: true
+          schema:
+            type: string
+          description: Comma-separated list of object IDs
+        - in: query
+          name: telescopeIDs
+          required: true
+          schema:
+            type: string
+          description: Comma-separated list of telescope IDs
+        - in: query
+          name: time
+          required: false
+          schema:
+            type: string
+          description: |
+            A time during (or before) the night, in ISO format. Defaults to
+            now.
+        - in: query
+          name: nPoints
+          required: false
+          schema:
+            type: integer
+          description: Number of samples over the night. Defaults to 50.
+        responses:
+          200:
+            content:
+              application/json:
+                schema:
+                  allOf:
+                    - $ref: '#/components/schemas/Success'
+                    - type: object
+                      properties:
+                        data:
+                          type: array
+                          description: One entry per telescope
+                          items:
+                            type: object
+                            properties:
+                              telescope_id:
+                                type: integer
+                              time:
+                                type: array
+                                items:
+                                  type: number
+                                description: Sample times (UNIX ms)
+                              sun_altitude:
+                                type: array
+                                items:
+                                  type: number
+                                description: Altitude of the Sun (deg)
+                              objs:
+                                type: object
+                                description: |
+                                  Altitude (deg) and airmass of each
+                                  object at each sample, by object ID.
+                                  The airmass is null when the object is
+                                  below the horizon.
+          400:
+            content:
+              application/json:
+                schema: Error
+        """
+        obj_ids = [i for i in self.get_query_argument('objIDs', '').split(',') if i]
+        try:
+            telescope_ids = [
+                int(i)
+                for i in self.get_query_argument('telescopeIDs', '').split(',')
+                if i
+            ]
+        except ValueError:
+            return self.error('telescopeIDs must be a list of integers')
+        if len(obj_ids) == 0 or len(telescope_ids) == 0:
+            return self.error('Specify objIDs and telescopeIDs')
+        if len(obj_ids) * len(telescope_ids) > self.MAX_PAIRS:
+            return self.error(
+                f'Too many objects and telescopes: at most {self.MAX_PAIRS} '
+                'object-telescope pairs can be computed per request'
+            )
+
+        time = self.get_query_argument('time', None)
+        if time is not None:
+            try:
+                time = ap_time.Time(time, format='iso')
+            except ValueError as e:
+                return self.error(f'Invalid time format: {e.args[0]}')
+        else:
+            time = ap_time.Time.now()
+
+        try:
+            n_points = int(self.get_query_argument('nPoints', 50))
+        except ValueError:
+            return self.error('nPoints must be an integer')
+        if not 2 <= n_points <= 1000:
+            return self.error('nPoints must be between 2 and 1000')
+
+        objs = (
+            Obj.query_records_accessible_by(self.current_user)
+            .filter(Obj.id.in_(obj_ids))
+            .all()
+        )
+        missing = set(obj_ids) - {obj.id for obj in objs}
+        if len(missing) > 0:
+            return self.error(f'Invalid object IDs: {", ".join(sorted(missing))}')
+        telescopes = [
+            Telescope.get_if_accessible_by(
+                telescope_id, self.current_user, raise_if_none=True
+            )
+            for telescope_id in telescope_ids
+        ]
+
+        coords = SkyCoord(
+            [obj.ra for obj in objs], [obj.dec for obj in objs], unit='deg'
+        )
+
+        data = []
+        for telescope in telescopes:
+            night = get_night_frame(telescope.observer, time, n_points=n_points)
+            # one broadcasted transform for all objects and samples
+            altitude = coords[:, np.newaxis].transform_to(night['frame']).alt.deg
+            airmass = pickering_airmass(altitude, below_horizon=np.nan)
+            airmass = np.where(np.isfinite(airmass), airmass, None)
+            data.append(
+                {
+                    'telescope_id': telescope.id,
+                    'time': (night['time'].unix * 1000).tolist(),
+                    'sun_altitude': night['sun_altitude'].tolist(),
+                    'objs': {
+                        obj.id: {
+                            'altitude': altitude[i].tolist(),
+                            'airmass': airmass[i].tolist(),
+                        }
+                        for i, obj in enumerate(objs)
+                    },
+                }
+            )
+
+        self.verify_and_commit()
+        return self.success(data=data)
@@ -1,6 +1,10 @@
+import functools
+from json.decoder import JSONDecodeError
+
 import numpy as np
 from sqlalchemy.orm import joinedload
 from marshmallow.exceptions import ValidationError
+from tornado.ioloop import IOLoop
 from baselayer.app.access import permissions, auth_or_token, AccessError
 from baselayer.app.model_util import recursive_to_dict
 from ..base import BaseHandler
@@ -11,8 +15,15 @@ from ...models import (
     Obj,
     Instrument,
     Source,
+    Photometry,
 )
 from ...schema import ObservingRunPost, ObservingRunGetWithAssignments
+from ...utils.offset import (
+    facility_parameters,
+    finder_executor,
+    get_offset_starlists,
+    _calculate_best_position_for_offset_stars,
+)
 
 
 class ObservingRunHandler(BaseHandler):
@@ -164,9 +175,9 @@ class ObservingRunHandler(BaseHandler):
         runs_list = []
         for run in runs:
             runs_list.append(run.to_dict())
-            runs_list[-1]["run_end_utc"] = run.instrument.telescope.next_sunrise(
+            runs_list[-1]["run_end_utc"] = run.instrument.telescope.night_ephemeris(
                 run.calendar_noon
-            ).isot
+            )['sunrise'].isot
 
         self.verify_and_commit()
         return self.success(data=runs_list)
@@ -266,3 +277,199 @@ class ObservingRunHandler(BaseHandler):
 
         self.push_all(action="skyportal/FETCH_OBSERVING_RUNS")
         return self.success()
+
+
+class ObservingRunStarlistHandler(BaseHandler):
+    @auth_or_token
+    async def get(self, run_id):
+        """
+        ---
+        description: |
+          Retrieve offset stars for all the targets of an observing run, as
+          one combined starlist. Progress is reported to the requesting user
+          over the websocket with `skyportal/OBSERVING_RUN_STARLIST_PROGRESS`
+          messages.
+        tags:
+          - observing_runs
+        parameters:
+        - in: path
+          name: run_id
+          required: true
+          schema:
+            type: integer
+        - in: query
+          name: facility
+          nullable: true
+          schema:
+            type: string
+            enum: [Keck, Shane, P200]
+          description: Which facility to generate the starlist for
+        - in: query
+          name: num_offset_stars
+          nullable: true
+          schema:
+            type: integer
+            minimum: 0
+            maximum: 10
+          description: |
+            Requested number of offset stars per target (set to zero to get
+            a starlist of just the targets themselves)
+        - in: query
+          name: obstime
+          nullable: True
+          schema:
+            type: string
+          description: |
+            datetime of observation in isoformat (e.g. 2020-12-30T12:34:10).
+            Defaults to noon (local time) of the run's calendar date.
+        - in: query
+          name: use_ztfref
+          required: false
+          schema:
+            type: boolean
+          description: |
+            Use ZTFref catalog for offset star positions, otherwise Gaia DR2
+        responses:
+          200:
+            content:
+              application/json:
+                schema:
+                  allOf:
+                    - $ref: '#/components/schemas/Success'
+                    - type: object
+                      properties:
+                        data:
+                          type: object
+                          properties:
+                            facility:
+                              type: string
+                              enum: [Keck, Shane, P200]
+                              description: Facility queried for starlist
+                            starlist_str:
+                              type: string
+                              description: |
+                                combined starlist of all targets, in facility
+                                format
+                            targets:
+                              type: array
+                              description: |
+                                Offset stars of each target, ordered by RA
+                              items:
+                                type: object
+                                properties:
+                                  obj_id:
+                                    type: string
+                                  starlist_info:
+                                    type: array
+                                    description: |
+                                      list of source and offset star
+                                      information, as returned by
+                                      /api/sources/{obj_id}/offsets
+                                    items:
+                                      type: object
+                                  noffsets:
+                                    type: integer
+                                  error:
+                                    type: string
+                                    description: |
+                                      Why the offset stars of this target
+                                      could not be found, if they could not
+          400:
+            content:
+              application/json:
+                schema: Error
+        """
+        run = ObservingRun.get_if_accessible_by(
+            int(run_id),
+            self.current_user,
+            mode="read",
+            raise_if_none=True,
+            options=[
+                joinedload(ObservingRun.assignments).joinedload(
+                    ClassicalAssignment.obj
+                ),
+                joinedload(ObservingRun.instrument).joinedload(Instrument.telescope),
+            ],
+        )
+
+        facility = self.get_query_argument('facility', 'Keck')
+        if facility not in facility_parameters:
+            return self.error('Invalid facility')
+
+        num_offset_stars = self.get_query_argument('num_offset_stars', '3')
+        try:
+            num_offset_stars = int(num_offset_stars)
+        except ValueError:
+            return self.error('Invalid argument for `num_offset_stars`')
+
+        use_ztfref = self.get_query_argument('use_ztfref', True)
+        if isinstance(use_ztfref, str):
+            use_ztfref = use_ztfref in ['t', 'True', 'true', 'yes', 'y']
+
+        obstime = self.get_query_argument('obstime', None)
+        if obstime is None:
+            obstime = run.calendar_noon.isot
+
+        objs = sorted(
+            {a.obj.id: a.obj for a in run.assignments}.values(), key=lambda o: o.ra
+        )
+        photometry = {obj.id: [] for obj in objs}
+        for phot in (
+            Photometry.query_records_accessible_by(self.current_user)
+            .filter(Photometry.obj_id.in_(list(photometry)))
+            .all()
+        ):
+            photometry[phot.obj_id].append(phot)
+
+        targets = []
+        for obj in objs:
+            try:
+                ra, dec = _calculate_best_position_for_offset_stars(
+                    photometry[obj.id], fallback=(obj.ra, obj.dec), how="snr2"
+                )
+            except JSONDecodeError:
+                ra, dec = obj.ra, obj.dec
+            targets.append((obj.id, ra, dec))
+
+        # do not keep the transaction open while the starlists are generated;
+        # committing expires `run`, which must not be loaded from the worker
+        # threads
+        run_id = run.id
+        self.verify_and_commit()
+
+        loop = IOLoop.current()
+
+        def progress(n_done, n_total):
+            # called from the worker threads
+            loop.add_callback(
+                self.push,
+                action='skyportal/OBSERVING_RUN_STARLIST_PROGRESS',
+                payload={'run_id': run_id, 'done': n_done, 'total': n_total},
+            )
+
+        job = functools.partial(
+            get_offset_starlists,
+            targets,
+            starlist_type=facility,
+            progress=progress,
+            how_many=num_offset_stars,
+            radius_degrees=facility_parameters[facility]["radius_degrees"],
+            mag_limit=facility_parameters[facility]["mag_limit"],
+            mag_min=facility_parameters[facility]["mag_min"],
+            min_sep_arcsec=facility_parameters[facility]["min_sep_arcsec"],
+            obstime=obstime,
+            allowed_queries=2,
+            use_ztfref=use_ztfref,
+        )
+        starlist_str, results = await loop.run_in_executor(finder_executor, job)
+
+        for result in results:
+            result['obj_id'] = result.pop('name')
+
+        return self.success(
+            data={
+                'facility': facility,
+                'starlist_str': starlist_str,
+                'targets': results,
+            }
+        )
@@ -1,5 +1,9 @@
+import io
+import json
 import uuid
 import math
+import functools
+from collections import defaultdict
 
 from astropy.time import Time
 from astropy.table import Table
@@ -13,11 +17,14 @@ import sqlalchemy as sa
 from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.sql.expression import FromClause
 from sqlalchemy.sql import column
-from sqlalchemy.orm import joinedload
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy import and_
 
+import tornado.web
+
 from baselayer.app.access import permissions, auth_or_token
 from baselayer.app.env import load_env
+from baselayer.log import make_log
 from ..base import BaseHandler
 from ...models import (
     DBSession,
@@ -29,6 +36,7 @@ from ...models import (
     PHOT_ZP,
     GroupPhotometry,
     StreamPhotometry,
+    PhotometrySummary,
 )
 
 from ...schema import (
@@ -42,6 +50,28 @@ from ...enum_types import ALLOWED_MAGSYSTEMS
 
 
 _, cfg = load_env()
+log = make_log('api/photometry')
+
+# Columns of the photometry table that are loaded through the staging table
+# by the bulk ingest handler
+STAGING_COLUMNS = [
+    'obj_id',
+    'instrument_id',
+    'origin',
+    'mjd',
+    'flux',
+    'fluxerr',
+    'filter',
+    'ra',
+    'dec',
+    'ra_unc',
+    'dec_unc',
+    'altdata',
+    'original_user_data',
+]
+
+# Columns of the photometry deduplication index
+DEDUPLICATION_COLUMNS = ['obj_id', 'instrument_id', 'origin', 'mjd', 'fluxerr', 'flux']
 
 
 def nan_to_none(value):
@@ -56,6 +86,36 @@ def allscalar(d):
     return all(np.isscalar(v) or v is None for v in d.values())
 
 
+@functools.lru_cache(maxsize=None)
+def get_relative_zp(filter, magsys):
+    """Relative zeropoint of a magnitude system in a given filter.
+
+    These are not the actual zeropoints for magnitudes in the db or packet,
+    just ones that can be used to derive corrections between magnitude
+    systems by taking differences. Results are memoized since there are only
+    a handful of (filter, magsys) pairs.
+    """
+    return 2.5 * np.log10(sncosmo.get_magsystem(magsys).zpbandflux(filter))
+
+
+def copy_format(value):
+    """Format a value as a field of a PostgreSQL COPY text stream."""
+    if value is None:
+        return '\\N'
+    if isinstance(value, (dict, list)):
+        # numpy scalars are not JSON serializable
+        value = json.dumps(value, default=lambda x: x.item())
+    value = str(value)
+    for char, escaped in [
+        ('\\', '\\\\'),
+        ('\t', '\\t'),
+        ('\n', '\\n'),
+        ('\r', '\\r'),
+    ]:
+        value = value.replace(char, escaped)
+    return value
+
+
 def serialize(phot, outsys, format):
 
     return_value = {
@@ -76,16 +136,10 @@ def serialize(phot, outsys, format):
 
     filter = phot.filter
 
-    magsys_db = sncosmo.get_magsystem('ab')
     outsys = sncosmo.get_magsystem(outsys)
 
-    relzp_out = 2.5 * np.log10(outsys.zpbandflux(filter))
-
-    # note: these are not the actual zeropoints for magnitudes in the db or
-    # packet, just ones that can be used to derive corrections when
-    # compared to relzp_out
-
-    relzp_db = 2.5 * np.log10(magsys_db.zpbandflux(filter))
+    relzp_out = get_relative_zp(filter, outsys.name)
+    relzp_db = get_relative_zp(filter, 'ab')
     db_correction = relzp_out - relzp_db
 
     # this is the zeropoint for fluxes in the database that is tied
@@ -97,8 +151,7 @@ def serialize(phot, outsys, format):
             phot.original_user_data is not None
             and 'limiting_mag' in phot.original_user_data
         ):
-            magsys_packet = sncosmo.get_magsystem(phot.original_user_data['magsys'])
-            relzp_packet = 2.5 * np.log10(magsys_packet.zpbandflux(filter))
+            relzp_packet = get_relative_zp(filter, phot.original_user_data['magsys'])
             packet_correction = relzp_out - relzp_packet
             maglimit = phot.original_user_data['limiting_mag']
             maglimit_out = maglimit + packet_correction
@@ -135,10 +188,132 @@ def serialize(phot, outsys, format):
     return return_value
 
 
+def serialize_photometry(query, outsys, format):
+    """Columnar equivalent of calling `serialize` on each Photometry record
+    returned by `query`.
+
+    The photometry is pulled into a DataFrame with a single query, and the
+    magnitude system conversions are applied with NumPy using one memoized
+    zeropoint correction per (filter, magsys) pair, rather than per point.
+
+    Parameters
+    ----------
+    query : `sqlalchemy.orm.Query`
+        Query returning `skyportal.models.Photometry` records.
+    outsys : str
+        Name of the output magnitude system.
+    format : str
+        Output format, either 'mag' or 'flux'.
+
+    Returns
+    -------
+    output : list of dict
+        One dictionary per photometry point, identical to the output of
+        `serialize`.
+    """
+    if format not in ['mag', 'flux']:
+        raise ValueError(
+            'Invalid output format specified. Must be one of '
+            f"['flux', 'mag'], got '{format}'."
+        )
+
+    df = pd.read_sql(query.statement, DBSession().connection())
+    df = df.drop_duplicates(subset='id')
+    if len(df) == 0:
+        return []
+
+    outsys = sncosmo.get_magsystem(outsys)
+    ids = df['id'].tolist()
+
+    instrument_names = dict(
+        DBSession()
+        .query(Instrument.id, Instrument.name)
+        .filter(Instrument.id.in_(df['instrument_id'].unique().tolist()))
+        .all()
+    )
+    groups = defaultdict(list)
+    for photometry_id, group in (
+        DBSession()
+        .query(GroupPhotometry.photometr_id, Group)
+        .join(Group, Group.id == GroupPhotometry.group_id)
+        .filter(GroupPhotometry.photometr_id.in_(ids))
+    ):
+        groups[photometry_id].append(group)
+
+    filters = df['filter'].to_numpy()
+    relzp_out = {f: get_relative_zp(f, outsys.name) for f in set(filters)}
+    db_correction = np.array(
+        [relzp_out[f] - get_relative_zp(f, 'ab') for f in filters], dtype=float
+    )
+    corrected_db_zp = PHOT_ZP + db_correction
+
+    flux = df['flux'].to_numpy(dtype=float)
+    fluxerr = df['fluxerr'].to_numpy(dtype=float)
+
+    def to_list(values):
+        return [nan_to_none(v) for v in values.tolist()]
+
+    columns = {
+        'obj_id': df['obj_id'].tolist(),
+        'ra': to_list(df['ra'].to_numpy(dtype=float)),
+        'dec': to_list(df['dec'].to_numpy(dtype=float)),
+        'filter': filters.tolist(),
+        'mjd': df['mjd'].tolist(),
+        'instrument_id': df['instrument_id'].tolist(),
+        'instrument_name': [instrument_names[i] for i in df['instrument_id']],
+        'ra_unc': to_list(df['ra_unc'].to_numpy(dtype=float)),
+        'dec_unc': to_list(df['dec_unc'].to_numpy(dtype=float)),
+        'origin': df['origin'].tolist(),
+        'id': ids,
+        'groups': [groups[i] for i in ids],
+        'altdata': df['altdata'].tolist(),
+    }
+
+    if format == 'mag':
+        with np.errstate(divide='ignore', invalid='ignore'):
+            detected = ~np.isnan(flux) & (flux > 0)
+            mag = np.where(detected, -2.5 * np.log10(flux) + PHOT_ZP, np.nan)
+            magerr = np.where(
+                detected & (fluxerr > 0), (2.5 / np.log(10)) * (fluxerr / flux), np.nan
+            )
+            maglimit_out = -2.5 * np.log10(5 * fluxerr) + corrected_db_zp
+
+        # points uploaded in magnitude space keep their original limiting mag,
+        # converted from the magnitude system they were uploaded in
+        for i, user_data in enumerate(df['original_user_data']):
+            if user_data is not None and 'limiting_mag' in user_data:
+                packet_correction = relzp_out[filters[i]] - get_relative_zp(
+                    filters[i], user_data['magsys']
+                )
+                maglimit_out[i] = user_data['limiting_mag'] + packet_correction
+
+        columns.update(
+            {
+                'mag': to_list(mag + db_correction),
+                'magerr': to_list(magerr),
+                'magsys': [outsys.name] * len(df),
+                'limiting_mag': maglimit_out.tolist(),
+            }
+        )
+    else:
+        columns.update(
+            {
+                'flux': to_list(flux),
+                'magsys': [outsys.name] * len(df),
+                'zp': corrected_db_zp.tolist(),
+                'fluxerr': fluxerr.tolist(),
+            }
+        )
+
+    keys = list(columns)
+    return [dict(zip(keys, values)) for values in zip(*columns.values())]
+
+
 class PhotometryHandler(BaseHandler):
-    def standardize_photometry_data(self):
+    def standardize_photometry_data(self, data=None):
 
-        data = self.get_json()
+        if data is None:
+            data = self.get_json()
 
         if not isinstance(data, dict):
             raise ValidationError(
@@ -465,22 +640,18 @@ class PhotometryHandler(BaseHandler):
     def insert_new_photometry_data(
         self, df, instrument_cache, group_ids, stream_ids, validate=True
     ):
-        # check for existing photometry and error if any is found
+        """Insert the photometry in `df`, skipping points that already exist.
 
-        if validate:
-            values_table, condition = self.get_values_table_and_condition(df)
-
-            duplicated_photometry = (
-                DBSession().query(Photometry).join(values_table, condition)
-            )
+        Duplicates are resolved by the database with ``INSERT ... ON
+        CONFLICT DO NOTHING`` against the unique deduplication index, so
+        concurrent uploads do not need to lock the photometry table.
 
-            dict_rep = [d.to_dict() for d in duplicated_photometry]
+        If `validate` is True, a ValidationError listing the existing
+        photometry is raised if any point of `df` is a duplicate.
 
-            if len(dict_rep) > 0:
-                raise ValidationError(
-                    'The following photometry already exists '
-                    f'in the database: {dict_rep}.'
-                )
+        Returns a dictionary mapping the index of each newly inserted row of
+        `df` to its photometry ID, and the upload ID.
+        """
 
         # pre-fetch the photometry PKs. these are not guaranteed to be
         # gapless (e.g., 1, 2, 3, 4, 5, ...) but they are guaranteed
@@ -496,13 +667,76 @@ class PhotometryHandler(BaseHandler):
 
         # cache this as list for response
         ids = [i[0] for i in proxy]
-        df['id'] = ids
+        upload_id = str(uuid.uuid4())
+
+        params = self.get_photometry_rows(df, instrument_cache, upload_id)
+        for phot, id in zip(params, ids):
+            phot['id'] = id
+
+        #  actually do the insert; rows that conflict with existing
+        #  photometry (or with an earlier row of the same upload) are skipped
+        query = (
+            pg_insert(Photometry.__table__)
+            .values(params)
+            .on_conflict_do_nothing(index_elements=DEDUPLICATION_COLUMNS)
+            .returning(Photometry.id)
+        )
+        inserted_ids = {r[0] for r in DBSession().execute(query)}
+
+        if validate and len(inserted_ids) < len(ids):
+            duplicates = df.loc[
+                [idx for idx, id in zip(df.index, ids) if id not in inserted_ids]
+            ]
+            values_table, condition = self.get_values_table_and_condition(duplicates)
+            duplicated_photometry = (
+                DBSession().query(Photometry).join(values_table, condition)
+            )
+
+            dict_rep = [d.to_dict() for d in duplicated_photometry]
+            raise ValidationError(
+                'The following photometry already exists '
+                f'in the database: {dict_rep}.'
+            )
+
+        id_map = {idx: id for idx, id in zip(df.index, ids) if id in inserted_ids}
+        ids = list(id_map.values())
+
+        self.insert_photometry_links(ids, group_ids, stream_ids)
+        return id_map, upload_id
+
+    def insert_photometry_links(self, ids, group_ids, stream_ids):
+        """Share the photometry with IDs `ids` with the groups `group_ids` and
+        streams `stream_ids`, with one set-based statement per join table.
+        Links that already exist are left untouched."""
+        if len(ids) == 0:
+            return
+
+        for table, link_column, link_ids in [
+            (GroupPhotometry.__tablename__, 'group_id', group_ids),
+            (StreamPhotometry.__tablename__, 'stream_id', stream_ids),
+        ]:
+            if not link_ids:
+                continue
+            DBSession().execute(
+                sa.text(
+                    f'INSERT INTO {table} '
+                    f'(photometr_id, {link_column}, created_at, modified) '
+                    f"SELECT p, l, timezone('UTC', now()), timezone('UTC', now()) "
+                    f'FROM unnest(:ids) AS p CROSS JOIN unnest(:link_ids) AS l '
+                    f'ON CONFLICT DO NOTHING'
+                ),
+                {'ids': list(set(ids)), 'link_ids': list(link_ids)},
+            )
+
+    def get_photometry_rows(self, df, instrument_cache, upload_id):
+        """Convert a photometry dataframe returned by
+        `standardize_photometry_data` into a list of rows ready to be
+        inserted in the photometry table (without their IDs)."""
 
         df = df.where(pd.notnull(df), None)
         df.loc[df['standardized_flux'].isna(), 'standardized_flux'] = np.nan
 
         rows = df.to_dict('records')
-        upload_id = str(uuid.uuid4())
 
         params = []
         for packet in rows:
@@ -526,7 +760,6 @@ class PhotometryHandler(BaseHandler):
                 original_user_data = None
 
             phot = dict(
-                id=packet['id'],
                 original_user_data=original_user_data,
                 upload_id=upload_id,
                 flux=flux,
@@ -546,37 +779,20 @@ class PhotometryHandler(BaseHandler):
 
             params.append(phot)
 
-        #  actually do the insert
-        query = Photometry.__table__.insert()
-        DBSession().execute(query, params)
+        return params
 
-        groupquery = GroupPhotometry.__table__.insert()
-        params = []
-        for id in ids:
-            for group_id in group_ids:
-                params.append({'photometr_id': id, 'group_id': group_id})
-        DBSession().execute(groupquery, params)
-
-        if stream_ids:
-            stream_query = StreamPhotometry.__table__.insert()
-            params = []
-            for id in ids:
-                for stream_id in stream_ids:
-                    params.append({'photometr_id': id, 'stream_id': stream_id})
-            DBSession().execute(stream_query, params)
-        return ids, upload_id
-
-    def get_group_ids(self):
-        data = self.get_json()
+    def get_group_ids(self, data=None):
+        if data is None:
+            data = self.get_json()
         group_ids = data.pop("group_ids", [])
         if isinstance(group_ids, (list, tuple)):
+            try:
+                group_ids = [int(group_id) for group_id in group_ids]
+            except (TypeError, ValueError):
+                raise ValidationError(
+                    f"Invalid format for group ids {group_ids}, must be integers."
+                )
             for group_id in group_ids:
-                try:
-                    group_id = int(group_id)
-                except TypeError:
-                    raise ValidationError(
-                        f"Invalid format for group id {group_id}, must be an integer."
-                    )
                 group = Group.query.get(group_id)
                 if group is None:
                     raise ValidationError(f'No group with ID {group_id}')
@@ -599,17 +815,18 @@ class PhotometryHandler(BaseHandler):
         group_ids = list(set(group_ids))
         return group_ids
 
-    def get_stream_ids(self):
-        data = self.get_json()
+    def get_stream_ids(self, data=None):
+        if data is None:
+            data = self.get_json()
         stream_ids = data.pop("stream_ids", [])
         if isinstance(stream_ids, (list, tuple)):
+            try:
+                stream_ids = [int(stream_id) for stream_id in stream_ids]
+            except (TypeError, ValueError):
+                raise ValidationError(
+                    f"Invalid format for stream ids {stream_ids}, must be integers."
+                )
             for stream_id in stream_ids:
-                try:
-                    stream_id = int(stream_id)
-                except TypeError:
-                    raise ValidationError(
-                        f"Invalid format for stream id {stream_id}, must be an integer."
-                    )
                 stream = Stream.get_if_accessible_by(stream_id, self.current_user)
                 if stream is None:
                     raise ValidationError(f'No stream with ID {stream_id}')
@@ -674,22 +891,16 @@ class PhotometryHandler(BaseHandler):
         except ValidationError as e:
             return self.error(e.args[0])
 
-        # This lock ensures that the Photometry table data are not modified in any way
-        # between when the query for duplicate photometry is first executed and
-        # when the insert statement with the new photometry is performed.
-        # From the psql docs: This mode protects a table against concurrent
-        # data changes, and is self-exclusive so that only one session can
-        # hold it at a time.
-        DBSession().execute(
-            f'LOCK TABLE {Photometry.__tablename__} IN SHARE ROW EXCLUSIVE MODE'
-        )
         try:
-            ids, upload_id = self.insert_new_photometry_data(
+            id_map, upload_id = self.insert_new_photometry_data(
                 df, instrument_cache, group_ids, stream_ids
             )
         except ValidationError as e:
+            DBSession().rollback()
             return self.error(e.args[0])
+        ids = list(id_map.values())
 
+        PhotometrySummary.refresh(df['obj_id'].unique())
         self.verify_and_commit()
         return self.success(data={'ids': ids, 'upload_id': upload_id})
 
@@ -747,84 +958,37 @@ class PhotometryHandler(BaseHandler):
         except ValidationError as e:
             return self.error(e.args[0])
 
-        values_table, condition = self.get_values_table_and_condition(df)
-
-        # This lock ensures that the Photometry table data are not modified
-        # in any way between when the query for duplicate photometry is first
-        # executed and when the insert statement with the new photometry is
-        # performed. From the psql docs: This mode protects a table against
-        # concurrent data changes, and is self-exclusive so that only one
-        # session can hold it at a time.
-        DBSession().execute(
-            f'LOCK TABLE {Photometry.__tablename__} IN SHARE ROW EXCLUSIVE MODE'
-        )
-
-        new_photometry_query = (
-            DBSession()
-            .query(values_table.c.pdidx)
-            .outerjoin(Photometry, condition)
-            .filter(Photometry.id.is_(None))
-        )
-
-        new_photometry_df_idxs = [g[0] for g in new_photometry_query]
-
-        id_map = {}
-
-        duplicated_photometry = (
-            DBSession()
-            .query(values_table.c.pdidx, Photometry)
-            .join(Photometry, condition)
-            .options(joinedload(Photometry.groups))
-            .options(joinedload(Photometry.streams))
-        )
+        try:
+            id_map, _ = self.insert_new_photometry_data(
+                df,
+                instrument_cache,
+                group_ids,
+                stream_ids,
+                validate=False,
+            )
+        except ValidationError as e:
+            return self.error(e.args[0])
 
-        for df_index, duplicate in duplicated_photometry:
-            id_map[df_index] = duplicate.id
-            duplicate_group_ids = set([g.id for g in duplicate.groups])
-            duplicate_stream_ids = set([s.id for s in duplicate.streams])
-
-            # posting to new groups?
-            if len(set(group_ids) - duplicate_group_ids) > 0:
-                # select old + new groups
-                group_ids_update = set(group_ids).union(duplicate_group_ids)
-                groups = (
-                    DBSession()
-                    .query(Group)
-                    .filter(Group.id.in_(group_ids_update))
-                    .all()
-                )
-                # update the corresponding photometry entry in the db
-                duplicate.groups = groups
-
-            # posting to new streams?
-            if stream_ids:
-                # Add new stream_photometry rows if not already present
-                stream_ids_update = set(stream_ids) - duplicate_stream_ids
-                if len(stream_ids_update) > 0:
-                    for id in stream_ids_update:
-                        DBSession().add(
-                            StreamPhotometry(photometr_id=duplicate.id, stream_id=id)
-                        )
+        # the rows that were not inserted already exist in the database
+        duplicates = df.loc[[idx for idx in df.index if idx not in id_map]]
 
-        # now safely drop the duplicates:
-        new_photometry = df.loc[new_photometry_df_idxs]
+        if len(duplicates) > 0:
+            values_table, condition = self.get_values_table_and_condition(duplicates)
 
-        if len(new_photometry) > 0:
-            try:
-                ids, _ = self.insert_new_photometry_data(
-                    new_photometry,
-                    instrument_cache,
-                    group_ids,
-                    stream_ids,
-                    validate=False,
-                )
-            except ValidationError as e:
-                return self.error(e.args[0])
+            duplicated_photometry = (
+                DBSession()
+                .query(values_table.c.pdidx, Photometry.id)
+                .join(Photometry, condition)
+            )
+            duplicate_ids = []
+            for df_index, duplicate_id in duplicated_photometry:
+                id_map[df_index] = duplicate_id
+                duplicate_ids.append(duplicate_id)
 
-            for (df_index, _), id in zip(new_photometry.iterrows(), ids):
-                id_map[df_index] = id
+            # add the duplicates to any new groups and streams
+            self.insert_photometry_links(duplicate_ids, group_ids, stream_ids)
 
-        # release the lock
+        PhotometrySummary.refresh(df['obj_id'].unique())
         self.verify_and_commit()
 
         # get ids in the correct order
@@ -945,6 +1109,7 @@ class PhotometryHandler(BaseHandler):
                         )
                     )
 
+        PhotometrySummary.refresh([photometry.obj_id, phot.obj_id])
         self.verify_and_commit()
         return self.success()
 
@@ -975,7 +1140,9 @@ class PhotometryHandler(BaseHandler):
             photometry_id, self.current_user, mode="delete", raise_if_none=True
         )
 
+        obj_id = photometry.obj_id
         DBSession().delete(photometry)
+        PhotometrySummary.refresh([obj_id])
         self.verify_and_commit()
 
         return self.success()
@@ -990,10 +1157,9 @@ class ObjPhotometryHandler(BaseHandler):
         )
         format = self.get_query_argument('format', 'mag')
         outsys = self.get_query_argument('magsys', 'ab')
+        output = serialize_photometry(photometry, outsys, format)
         self.verify_and_commit()
-        return self.success(
-            data=[serialize(phot, outsys, format) for phot in photometry]
-        )
+        return self.success(data=output)
 
 
 class BulkDeletePhotometryHandler(BaseHandler):
@@ -1030,13 +1196,298 @@ class BulkDeletePhotometryHandler(BaseHandler):
         if n == 0:
             return self.error('Invalid bulk upload id.')
 
+        obj_ids = {phot.obj_id for phot in photometry_to_delete}
         for phot in photometry_to_delete:
             DBSession().delete(phot)
 
+        PhotometrySummary.refresh(obj_ids)
         self.verify_and_commit()
         return self.success(f"Deleted {n} photometry points.")
 
 
+@tornado.web.stream_request_body
+class PhotometryBulkIngestHandler(PhotometryHandler):
+    """The request body is streamed: it is split into chunks of `chunkSize`
+    lines as it arrives, and each chunk is ingested and committed before the
+    rest of the body is read."""
+
+    def prepare(self):
+        super().prepare()
+        if not self._finished and self.start_upload() is not True:
+            if not self._finished:
+                self.finish()
+
+    def reject(self, message):
+        """Finish the request with an error before its body is read."""
+        self.error(message)
+        self.finish()
+
+    @permissions(['Upload data'])
+    def start_upload(self):
+        """Check the upload parameters before the body is read. Returns True
+        if the upload can proceed."""
+        format = self.get_query_argument('format', None)
+        if format is None:
+            content_type = self.request.headers.get('Content-Type', '')
+            format = 'csv' if 'csv' in content_type else 'ndjson'
+        if format not in ['csv', 'ndjson']:
+            return self.reject('Invalid format: must be one of csv or ndjson.')
+
+        try:
+            chunk_size = int(self.get_query_argument('chunkSize', 10000))
+        except ValueError:
+            return self.reject('chunkSize must be an integer.')
+        if chunk_size <= 0:
+            return self.reject('chunkSize must be positive.')
+
+        group_ids = self.get_query_argument('groupIDs', None)
+        stream_ids = self.get_query_argument('streamIDs', None)
+        if group_ids != 'all':
+            group_ids = [g for g in (group_ids or '').split(',') if g != '']
+        stream_ids = [s for s in (stream_ids or '').split(',') if s != '']
+        try:
+            self.group_ids = self.get_group_ids({'group_ids': group_ids})
+            self.stream_ids = self.get_stream_ids({'stream_ids': stream_ids})
+        except ValidationError as e:
+            return self.reject(e.args[0])
+
+        self.request.connection.set_max_body_size(
+            cfg['misc.photometry_bulk_ingest_max_megabytes'] * 2 ** 20
+        )
+        self.format = format
+        self.chunk_size = chunk_size
+        self.upload_id = str(uuid.uuid4())
+        self.ids = []
+        self.chunks = []
+        self.failure = None
+        self.header = None
+        self.partial_line = b''
+        self.lines = []
+        return True
+
+    def data_received(self, data):
+        if self._finished:
+            return
+        lines = (self.partial_line + data).split(b'\n')
+        self.partial_line = lines.pop()
+        for line in lines:
+            self.add_line(line)
+
+    def add_line(self, line):
+        if self.failure is not None or line.strip() == b'':
+            return
+        if self.format == 'csv' and self.header is None:
+            self.header = line
+            return
+        self.lines.append(line)
+        if len(self.lines) >= self.chunk_size:
+            self.ingest_lines()
+
+    def parse_lines(self, lines):
+        """Parse lines of the body (newline-delimited JSON or CSV rows) into a
+        dictionary of lists in the format accepted by
+        `standardize_photometry_data`."""
+        if self.format == 'csv':
+            df = pd.read_csv(io.BytesIO(b'\n'.join([self.header] + lines)))
+        else:
+            df = pd.read_json(io.BytesIO(b'\n'.join(lines)), lines=True)
+        return df.astype(object).where(pd.notnull(df), None).to_dict('list')
+
+    def ingest_lines(self):
+        """Ingest and commit the lines received since the previous chunk. On
+        error, the rest of the body is ignored."""
+        lines, self.lines = self.lines, []
+        if len(lines) == 0:
+            return
+
+        i = len(self.chunks)
+        try:
+            df, instrument_cache = self.standardize_photometry_data(
+                self.parse_lines(lines)
+            )
+            chunk_ids, n_duplicates = self.ingest_chunk(
+                df, instrument_cache, self.group_ids, self.stream_ids, self.upload_id
+            )
+            PhotometrySummary.refresh(df['obj_id'].unique())
+            self.verify_and_commit()
+        except (ValidationError, ValueError) as e:
+            DBSession().rollback()
+            message = e.args[0] if len(e.args) > 0 else str(e)
+            self.failure = (
+                f'Error in chunk {i}: {message} '
+                f'{len(self.ids)} points from previous chunks were committed '
+                f'with upload_id {self.upload_id}.'
+            )
+            return
+
+        self.ids.extend(chunk_ids)
+        self.chunks.append(
+            {'chunk': i, 'inserted': len(chunk_ids), 'duplicates': n_duplicates}
+        )
+        log(
+            f'Bulk upload {self.upload_id}: chunk {i} inserted {len(chunk_ids)} '
+            f'points ({n_duplicates} duplicates skipped)'
+        )
+        self.push(
+            action='skyportal/PHOTOMETRY_UPLOAD_PROGRESS',
+            payload={'upload_id': self.upload_id, **self.chunks[-1]},
+        )
+
+    def ingest_chunk(self, df, instrument_cache, group_ids, stream_ids, upload_id):
+        """COPY a standardized chunk of photometry into a temporary staging
+        table and insert the points that are not already in the photometry
+        table with a single set-based statement.
+
+        Returns the IDs of the inserted photometry and the number of
+        duplicates that were skipped.
+        """
+        rows = self.get_photometry_rows(df, instrument_cache, upload_id)
+
+        session = DBSession()
+        session.execute(
+            f'CREATE TEMP TABLE photometry_staging ON COMMIT DROP AS '
+            f'SELECT {", ".join(STAGING_COLUMNS)} '
+            f'FROM {Photometry.__tablename__} WITH NO DATA'
+        )
+        session.execute('ALTER TABLE photometry_staging ADD COLUMN pdidx SERIAL')
+
+        buffer = io.StringIO()
+        for row in rows:
+            buffer.write(
+                '\t'.join(copy_format(row[column]) for column in STAGING_COLUMNS)
+            )
+            buffer.write('\n')
+        buffer.seek(0)
+        with session.connection().connection.cursor() as cursor:
+            cursor.copy_expert(
+                f'COPY photometry_staging ({", ".join(STAGING_COLUMNS)}) FROM STDIN',
+                buffer,
+            )
+
+        staged = ', '.join(f's.{c}' for c in STAGING_COLUMNS)
+        result = session.execute(
+            sa.text(
+                f'INSERT INTO {Photometry.__tablename__} '
+                f'({", ".join(STAGING_COLUMNS)}, upload_id, owner_id, '
+                f'created_at, modified) '
+                f"SELECT {staged}, :upload_id, :owner_id, "
+                f"timezone('UTC', now()), timezone('UTC', now()) "
+                f'FROM photometry_staging AS s ORDER BY s.pdidx '
+                f'ON CONFLICT ({", ".join(DEDUPLICATION_COLUMNS)}) DO NOTHING '
+                f'RETURNING id'
+            ),
+            {'upload_id': upload_id, 'owner_id': self.associated_user_object.id},
+        )
+        ids = [r[0] for r in result]
+
+        self.insert_photometry_links(ids, group_ids, stream_ids)
+
+        return ids, len(rows) - len(ids)
+
+    @permissions(['Upload data'])
+    def post(self):
+        """
+        ---
+        description: |
+          Bulk upload photometry from newline-delimited JSON or CSV.
+          Each line (or CSV row) is a single photometry point with the fields
+          of PhotMagFlexible or PhotFluxFlexible. The upload is processed in
+          chunks, each committed separately as it is received, and points
+          that already exist in the database are skipped. Progress is pushed
+          to the uploading user after each chunk. CSV rows cannot contain
+          line breaks. The size of the upload is limited by the
+          misc.photometry_bulk_ingest_max_megabytes setting (1 GB by
+          default).
+        tags:
+          - photometry
+        parameters:
+          - in: query
+            name: format
+            required: false
+            schema:
+              type: string
+              enum: [ndjson, csv]
+            description: |
+              Format of the request body. Defaults to csv if the Content-Type
+              header contains "csv", ndjson otherwise.
+          - in: query
+            name: groupIDs
+            required: false
+            schema:
+              type: string
+            description: |
+              Comma-separated IDs of the groups to share the photometry with,
+              or "all" for the sitewide group.
+          - in: query
+            name: streamIDs
+            required: false
+            schema:
+              type: string
+            description: Comma-separated IDs of the streams of the photometry
+          - in: query
+            name: chunkSize
+            required: false
+            schema:
+              type: integer
+            description: Number of points processed per chunk. Defaults to 10000.
+        requestBody:
+          content:
+            application/x-ndjson:
+              schema:
+                type: string
+            text/csv:
+              schema:
+                type: string
+        responses:
+          200:
+            content:
+              application/json:
+                schema:
+                  allOf:
+                    - $ref: '#/components/schemas/Success'
+                    - type: object
+                      properties:
+                        data:
+                          type: object
+                          properties:
+                            ids:
+                              type: array
+                              items:
+                                type: integer
+                              description: List of new photometry IDs
+                            upload_id:
+                              type: string
+                              description: |
+                                Upload ID associated with all photometry points
+                                added in request. Can be used to later delete all
+                                points in a single request.
+                            chunks:
+                              type: array
+                              items:
+                                type: object
+                                properties:
+                                  chunk:
+                                    type: integer
+                                  inserted:
+                                    type: integer
+                                  duplicates:
+                                    type: integer
+          400:
+            content:
+              application/json:
+                schema: Error
+        """
+        # the body may not end with a newline
+        self.add_line(self.partial_line)
+        self.partial_line = b''
+        self.ingest_lines()
+        if self.failure is not None:
+            return self.error(self.failure)
+        return self.success(
+            data={'ids': self.ids, 'upload_id': self.upload_id, 'chunks': self.chunks}
+        )
+
+
 class PhotometryRangeHandler(BaseHandler):
     @auth_or_token
     def get(self):
@@ -1084,7 +1535,7 @@ class PhotometryRangeHandler(BaseHandler):
             group_phot_subquery, Photometry.id == group_phot_subquery.c.photometr_id
         )
 
-        output = [serialize(p, magsys, format) for p in query]
+        output = serialize_photometry(query, magsys, format)
         self.verify_and_commit()
         return self.success(data=output)
 
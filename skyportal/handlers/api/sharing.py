@@ -1,6 +1,6 @@
 from baselayer.app.access import auth_or_token
 from ..base import BaseHandler
-from ...models import Group, Photometry, Spectrum
+from ...models import Group, Photometry, PhotometrySummary, Spectrum
 
 
 class SharingHandler(BaseHandler):
@@ -111,6 +111,8 @@ class SharingHandler(BaseHandler):
                 # Grab obj_id for use in websocket message below
                 spec_obj_ids.append(spec.obj_id)
 
+        # the newly shared groups' detection summaries
+        PhotometrySummary.refresh(phot_obj_ids)
         self.verify_and_commit()
 
         spec_obj_ids = set(spec_obj_ids)
@@ -1,4 +1,6 @@
+import asyncio
 import datetime
+from concurrent.futures import ThreadPoolExecutor
 from json.decoder import JSONDecodeError
 import python_http_client.exceptions
 from twilio.base.exceptions import TwilioException
@@ -16,7 +18,9 @@ import functools
 import healpix_alchemy as ha
 from baselayer.app.access import permissions, auth_or_token
 from baselayer.app.env import load_env
+from baselayer.app.flow import Flow
 from baselayer.app.model_util import recursive_to_dict
+from baselayer.log import make_log
 from ..base import BaseHandler
 from ...models import (
     DBSession,
@@ -38,6 +42,8 @@ from ...models import (
     Listing,
     Spectrum,
     SourceView,
+    PhotometrySummary,
+    Thumbnail,
 )
 from ...utils.offset import (
     get_nearby_offset_stars,
@@ -45,14 +51,21 @@ from ...utils.offset import (
     source_image_parameters,
     get_finding_chart,
     _calculate_best_position_for_offset_stars,
+    finder_executor,
 )
-from .candidate import grab_query_results, update_redshift_history_if_relevant
-from .photometry import serialize
+from .candidate import (
+    grab_query_results,
+    grab_query_results_by_cursor,
+    order_by_from_sort_keys,
+    update_redshift_history_if_relevant,
+)
+from .photometry import serialize_photometry
 from .color_mag import get_color_mag
 
 SOURCES_PER_PAGE = 100
 
 _, cfg = load_env()
+log = make_log('api/source')
 
 
 def apply_active_or_requested_filtering(query, include_requested, requested_only):
@@ -67,22 +80,232 @@ def apply_active_or_requested_filtering(query, include_requested, requested_only
     return query
 
 
-def add_ps1_thumbnail_and_push_ws_msg(obj_id, request_handler):
+def get_objs_missing_ps1_thumbnail(obj_ids):
+    """Return the (ID, internal key) of the Objs in `obj_ids` that do not
+    have a PS1 thumbnail yet."""
     try:
-        obj = Obj.get_if_accessible_by(obj_id, request_handler.current_user)
-        obj.add_ps1_thumbnail()
-        request_handler.push_all(
-            action="skyportal/REFRESH_SOURCE", payload={"obj_key": obj.internal_key}
-        )
-        request_handler.push_all(
-            action="skyportal/REFRESH_CANDIDATE", payload={"id": obj.internal_key}
+        return (
+            DBSession()
+            .query(Obj.id, Obj.internal_key)
+            .filter(Obj.id.in_(obj_ids))
+            .filter(~Obj.thumbnails.any(Thumbnail.type == "ps1"))
+            .all()
         )
-    except Exception as e:
-        return request_handler.error(f"Unable to generate PS1 thumbnail URL: {e}")
     finally:
         DBSession.remove()
 
 
+def add_ps1_thumbnail(obj_id):
+    try:
+        DBSession().query(Obj).get(obj_id).add_ps1_thumbnail()
+    finally:
+        DBSession.remove()
+
+
+class PS1ThumbnailQueue:
+    """Generates PS1 thumbnails in the background.
+
+    Finding the URL of a PS1 cutout takes a request to STScI, so Objs are
+    queued here instead of being handled on the IOLoop. An Obj that is
+    already queued or being processed is not queued again. The queue is
+    drained in batches: the Objs of a batch that still lack a PS1 thumbnail
+    are looked up with a single query, then their thumbnails are generated
+    on a bounded thread pool. Clients are notified as each thumbnail is
+    added.
+    """
+
+    def __init__(self, max_workers, batch_size=50):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.batch_size = batch_size
+        self.queued = []
+        # queued or in progress
+        self.pending = set()
+        self.draining = False
+
+    def add(self, obj_id):
+        """Queue an Obj. Must be called from the IOLoop."""
+        if obj_id in self.pending:
+            return
+        self.pending.add(obj_id)
+        self.queued.append(obj_id)
+        if not self.draining:
+            self.draining = True
+            IOLoop.current().spawn_callback(self.drain)
+
+    async def drain(self):
+        loop = IOLoop.current()
+        flow = Flow()
+
+        async def process(obj_id, internal_key):
+            try:
+                await loop.run_in_executor(self.executor, add_ps1_thumbnail, obj_id)
+            except Exception as e:
+                log(f"Unable to generate PS1 thumbnail URL for {obj_id}: {e}")
+                return
+            finally:
+                self.pending.discard(obj_id)
+            flow.push(
+                '*', "skyportal/REFRESH_SOURCE", payload={"obj_key": internal_key}
+            )
+            flow.push('*', "skyportal/REFRESH_CANDIDATE", payload={"id": internal_key})
+
+        try:
+            while len(self.queued) > 0:
+                batch = self.queued[: self.batch_size]
+                self.queued = self.queued[self.batch_size :]
+                try:
+                    objs = await loop.run_in_executor(
+                        self.executor, get_objs_missing_ps1_thumbnail, batch
+                    )
+                except Exception as e:
+                    log(f"Unable to look up PS1 thumbnails: {e}")
+                    objs = []
+                missing = {obj_id for obj_id, _ in objs}
+                self.pending -= set(batch) - missing
+                await asyncio.gather(
+                    *[process(obj_id, internal_key) for obj_id, internal_key in objs]
+                )
+        finally:
+            self.draining = False
+
+
+ps1_thumbnail_queue = PS1ThumbnailQueue(
+    max_workers=cfg["misc.ps1_thumbnail_max_workers"]
+)
+
+
+def get_sources_nested_data(
+    obj_ids,
+    user,
+    include_comments=False,
+    include_photometry=False,
+    include_photometry_exists=False,
+    include_spectrum_exists=False,
+    include_requested=False,
+    requested_only=False,
+    remove_nested=False,
+):
+    """Load the nested data of a page of sources with one query per
+    relationship (rather than one per source), and group it by Obj ID.
+
+    Returns a dictionary mapping each Obj ID to a dictionary containing the
+    same nested keys the sources listing attaches to each source.
+    """
+    obj_ids = list(obj_ids)
+    nested = {obj_id: {} for obj_id in obj_ids}
+    if len(obj_ids) == 0:
+        return nested
+
+    if include_comments:
+        for obj_id in obj_ids:
+            nested[obj_id]["comments"] = []
+        comments = (
+            Comment.query_records_accessible_by(user)
+            .filter(Comment.obj_id.in_(obj_ids))
+            .all()
+        )
+        for c in comments:
+            nested[c.obj_id]["comments"].append(
+                {k: v for k, v in c.to_dict().items() if k != "attachment_bytes"}
+            )
+        for obj_id in obj_ids:
+            nested[obj_id]["comments"].sort(key=lambda x: x["created_at"], reverse=True)
+
+    if not remove_nested:
+        for obj_id in obj_ids:
+            nested[obj_id]["classifications"] = []
+            nested[obj_id]["annotations"] = []
+            nested[obj_id]["groups"] = []
+
+        classifications = (
+            Classification.query_records_accessible_by(
+                user, options=[joinedload(Classification.groups)]
+            )
+            .filter(Classification.obj_id.in_(obj_ids))
+            .all()
+        )
+        for classification in classifications:
+            classification_dict = classification.to_dict()
+            classification_dict['groups'] = [g.to_dict() for g in classification.groups]
+            nested[classification.obj_id]["classifications"].append(classification_dict)
+
+        annotations = (
+            Annotation.query_records_accessible_by(user)
+            .filter(Annotation.obj_id.in_(obj_ids))
+            .all()
+        )
+        for annotation in annotations:
+            nested[annotation.obj_id]["annotations"].append(annotation)
+        for obj_id in obj_ids:
+            nested[obj_id]["annotations"].sort(key=lambda x: x.origin)
+
+        source_query = Source.query_records_accessible_by(
+            user, options=[joinedload(Source.saved_by)]
+        ).filter(Source.obj_id.in_(obj_ids))
+        source_query = apply_active_or_requested_filtering(
+            source_query, include_requested, requested_only
+        )
+        source_rows = source_query.all()
+        groups = {
+            g.id: g
+            for g in Group.query_records_accessible_by(user)
+            .filter(Group.id.in_({s.group_id for s in source_rows}))
+            .all()
+        }
+        for source_row in source_rows:
+            group = groups.get(source_row.group_id)
+            if group is None:
+                continue
+            group_dict = group.to_dict()
+            group_dict["active"] = source_row.active
+            group_dict["requested"] = source_row.requested
+            group_dict["saved_at"] = source_row.saved_at
+            group_dict["saved_by"] = (
+                source_row.saved_by.to_dict()
+                if source_row.saved_by is not None
+                else None
+            )
+            nested[source_row.obj_id]["groups"].append(group_dict)
+
+    for obj_id, stats in Obj.detection_stats(obj_ids, user).items():
+        nested[obj_id].update(stats)
+
+    if include_photometry:
+        for obj_id in obj_ids:
+            nested[obj_id]["photometry"] = []
+        photometry = Photometry.query_records_accessible_by(user).filter(
+            Photometry.obj_id.in_(obj_ids)
+        )
+        for phot in serialize_photometry(photometry, 'ab', 'flux'):
+            nested[phot["obj_id"]]["photometry"].append(phot)
+
+    if include_photometry_exists:
+        with_photometry = {
+            obj_id
+            for obj_id, in Photometry.query_records_accessible_by(
+                user, columns=[Photometry.obj_id]
+            )
+            .filter(Photometry.obj_id.in_(obj_ids))
+            .distinct()
+        }
+        for obj_id in obj_ids:
+            nested[obj_id]["photometry_exists"] = obj_id in with_photometry
+
+    if include_spectrum_exists:
+        with_spectra = {
+            obj_id
+            for obj_id, in Spectrum.query_records_accessible_by(
+                user, columns=[Spectrum.obj_id]
+            )
+            .filter(Spectrum.obj_id.in_(obj_ids))
+            .distinct()
+        }
+        for obj_id in obj_ids:
+            nested[obj_id]["spectrum_exists"] = obj_id in with_spectra
+
+    return nested
+
+
 class SourceHandler(BaseHandler):
     @auth_or_token
     def head(self, obj_id=None):
@@ -259,6 +482,35 @@ class SourceHandler(BaseHandler):
             description: |
               Used only in the case of paginating query results - if provided, this
               allows for avoiding a potentially expensive query.count() call.
+          - in: query
+            name: useCursor
+            nullable: true
+            schema:
+              type: boolean
+            description: |
+              Paginate with a cursor rather than a page number: the response
+              contains a `nextCursor` to pass as `cursor` to get the next page,
+              without counting and skipping the items of the previous pages.
+              Cannot be used with `saveSummary`.
+              Defaults to false.
+          - in: query
+            name: cursor
+            nullable: true
+            schema:
+              type: string
+            description: |
+              The `nextCursor` of the previous page of sources, when paginating
+              with a cursor (implies useCursor). The other query parameters
+              must be the same as for the previous page.
+          - in: query
+            name: estimateTotalMatches
+            nullable: true
+            schema:
+              type: boolean
+            description: |
+              When paginating with a cursor, return the database's estimate of
+              the number of matches rather than counting them, which is faster
+              for large result sets. Defaults to false.
           - in: query
             name: startDate
             nullable: true
@@ -499,6 +751,17 @@ class SourceHandler(BaseHandler):
                                 type: integer
                               numPerPage:
                                 type: integer
+                              nextCursor:
+                                type: string
+                                nullable: true
+                                description: |
+                                  Cursor of the next page, when paginating
+                                  with a cursor. Null on the last page.
+                              totalMatchesEstimated:
+                                type: boolean
+                                description: |
+                                  Whether totalMatches is an estimate, when
+                                  paginating with a cursor
             400:
               content:
                 application/json:
@@ -606,6 +869,20 @@ class SourceHandler(BaseHandler):
         origin = self.get_query_argument('origin', None)
         has_tns_name = self.get_query_argument('hasTNSname', None)
         total_matches = self.get_query_argument('totalMatches', None)
+        cursor = self.get_query_argument('cursor', None)
+        use_cursor = cursor is not None or self.get_query_argument(
+            'useCursor', False
+        ) in ["true", True]
+        estimate_total_matches = self.get_query_argument(
+            'estimateTotalMatches', False
+        ) in ["true", True]
+        if use_cursor and save_summary:
+            return self.error("useCursor cannot be used with saveSummary.")
+        if use_cursor and total_matches is not None:
+            try:
+                total_matches = int(total_matches)
+            except ValueError:
+                return self.error("Invalid totalMatches value.")
         is_token_request = isinstance(self.current_user, Token)
         if obj_id is not None:
             if include_thumbnails:
@@ -661,9 +938,7 @@ class SourceHandler(BaseHandler):
 
             if include_thumbnails:
                 if "ps1" not in [thumb.type for thumb in s.thumbnails]:
-                    IOLoop.current().add_callback(
-                        lambda: add_ps1_thumbnail_and_push_ws_msg(obj_id, self)
-                    )
+                    ps1_thumbnail_queue.add(obj_id)
             if include_comments:
                 comments = (
                     Comment.query_records_accessible_by(
@@ -728,14 +1003,12 @@ class SourceHandler(BaseHandler):
             source_info["angular_diameter_distance"] = s.angular_diameter_distance
 
             if include_photometry:
-                photometry = (
-                    Photometry.query_records_accessible_by(self.current_user)
-                    .filter(Photometry.obj_id == obj_id)
-                    .all()
+                photometry = Photometry.query_records_accessible_by(
+                    self.current_user
+                ).filter(Photometry.obj_id == obj_id)
+                source_info["photometry"] = serialize_photometry(
+                    photometry, 'ab', 'flux'
                 )
-                source_info["photometry"] = [
-                    serialize(phot, 'ab', 'flux') for phot in photometry
-                ]
             if include_photometry_exists:
                 source_info["photometry_exists"] = (
                     len(
@@ -853,15 +1126,40 @@ class SourceHandler(BaseHandler):
                 )
             other = ha.Point(ra=ra, dec=dec)
             obj_query = obj_query.filter(Obj.within(other, radius))
+        if (
+            start_date
+            or end_date
+            or any(
+                mag is not None
+                for mag in [
+                    min_peak_magnitude,
+                    max_peak_magnitude,
+                    min_latest_magnitude,
+                    max_latest_magnitude,
+                ]
+            )
+        ):
+            # Detection-based filters read the per-group photometry summaries
+            # rather than aggregating over the photometry table
+            detection_summary = PhotometrySummary.query_by_obj(
+                self.current_user
+            ).subquery()
+            obj_query = obj_query.join(
+                detection_summary, Obj.id == detection_summary.c.obj_id
+            )
         if start_date:
-            start_date = arrow.get(start_date.strip()).datetime
+            start_date = (
+                arrow.get(start_date.strip()).datetime.timestamp() / 86400.0 + 40_587
+            )
             obj_query = obj_query.filter(
-                Obj.last_detected_at(self.current_user) >= start_date
+                detection_summary.c.last_detected_mjd >= start_date
             )
         if end_date:
-            end_date = arrow.get(end_date.strip()).datetime
+            end_date = (
+                arrow.get(end_date.strip()).datetime.timestamp() / 86400.0 + 40_587
+            )
             obj_query = obj_query.filter(
-                Obj.last_detected_at(self.current_user) <= end_date
+                detection_summary.c.last_detected_mjd <= end_date
             )
         if saved_before:
             source_query = source_query.filter(Source.saved_at <= saved_before)
@@ -914,7 +1212,7 @@ class SourceHandler(BaseHandler):
                     "Invalid values for minPeakMagnitude - could not convert to float"
                 )
             obj_query = obj_query.filter(
-                Obj.peak_detected_mag(self.current_user) >= min_peak_magnitude
+                detection_summary.c.peak_detected_mag >= min_peak_magnitude
             )
         if max_peak_magnitude is not None:
             try:
@@ -924,7 +1222,7 @@ class SourceHandler(BaseHandler):
                     "Invalid values for maxPeakMagnitude - could not convert to float"
                 )
             obj_query = obj_query.filter(
-                Obj.peak_detected_mag(self.current_user) <= max_peak_magnitude
+                detection_summary.c.peak_detected_mag <= max_peak_magnitude
             )
         if min_latest_magnitude is not None:
             try:
@@ -934,7 +1232,7 @@ class SourceHandler(BaseHandler):
                     "Invalid values for minLatestMagnitude - could not convert to float"
                 )
             obj_query = obj_query.filter(
-                Obj.last_detected_mag(self.current_user) >= min_latest_magnitude
+                detection_summary.c.last_detected_mag >= min_latest_magnitude
             )
         if max_latest_magnitude is not None:
             try:
@@ -944,7 +1242,7 @@ class SourceHandler(BaseHandler):
                     "Invalid values for maxLatestMagnitude - could not convert to float"
                 )
             obj_query = obj_query.filter(
-                Obj.last_detected_mag(self.current_user) <= max_latest_magnitude
+                detection_summary.c.last_detected_mag <= max_latest_magnitude
             )
         if classifications is not None:
             if isinstance(classifications, str) and "," in classifications:
@@ -980,54 +1278,32 @@ class SourceHandler(BaseHandler):
 
         source_subquery = source_query.subquery()
         query = obj_query.join(source_subquery, Obj.id == source_subquery.c.obj_id)
-        order_by = None
+        sort_keys = []
         if sort_by is not None:
-            if sort_by == "id":
-                order_by = [Obj.id] if sort_order == "asc" else [Obj.id.desc()]
-            elif sort_by == "alias":
-                order_by = (
-                    [Obj.alias.nullslast()]
-                    if sort_order == "asc"
-                    else [Obj.alias.desc().nullslast()]
-                )
-            elif sort_by == "origin":
-                order_by = (
-                    [Obj.origin.nullslast()]
-                    if sort_order == "asc"
-                    else [Obj.origin.desc().nullslast()]
-                )
-            elif sort_by == "ra":
-                order_by = (
-                    [Obj.ra.nullslast()]
-                    if sort_order == "asc"
-                    else [Obj.ra.desc().nullslast()]
-                )
-            elif sort_by == "dec":
-                order_by = (
-                    [Obj.dec.nullslast()]
-                    if sort_order == "asc"
-                    else [Obj.dec.desc().nullslast()]
-                )
-            elif sort_by == "redshift":
-                order_by = (
-                    [Obj.redshift.nullslast()]
-                    if sort_order == "asc"
-                    else [Obj.redshift.desc().nullslast()]
-                )
+            descending = sort_order != "asc"
+            if sort_by in ["id", "alias", "origin", "ra", "dec", "redshift"]:
+                sort_keys = [(getattr(Obj, sort_by), descending)]
             elif sort_by == "saved_at":
-                order_by = (
-                    [source_subquery.c.saved_at]
-                    if sort_order == "asc"
-                    else [source_subquery.c.saved_at.desc()]
-                )
+                sort_keys = [(source_subquery.c.saved_at, descending)]
             elif sort_by == "classification":
-                order_by = (
-                    [classification_subquery.c.classification.nullslast()]
-                    if sort_order == "asc"
-                    else [classification_subquery.c.classification.desc().nullslast()]
-                )
+                sort_keys = [(classification_subquery.c.classification, descending)]
+        order_by = order_by_from_sort_keys(sort_keys) if sort_keys else None
 
-        if page_number:
+        if use_cursor:
+            try:
+                query_results = grab_query_results_by_cursor(
+                    query,
+                    sort_keys,
+                    cursor,
+                    num_per_page,
+                    "sources",
+                    total_matches=total_matches,
+                    estimate_total_matches=estimate_total_matches,
+                    include_thumbnails=include_thumbnails and not remove_nested,
+                )
+            except ValueError as e:
+                return self.error(str(e))
+        elif page_number:
             try:
                 page_number = int(page_number)
             except ValueError:
@@ -1062,126 +1338,26 @@ class SourceHandler(BaseHandler):
         if not save_summary:
             # Records are Objs, not Sources
             obj_list = []
-            for obj in query_results["sources"]:
+            nested_data = get_sources_nested_data(
+                [obj.id for obj in query_results["sources"]],
+                self.current_user,
+                include_comments=include_comments,
+                include_photometry=include_photometry,
+                include_photometry_exists=include_photometry_exists,
+                include_spectrum_exists=include_spectrum_exists,
+                include_requested=include_requested,
+                requested_only=requested_only,
+                remove_nested=remove_nested,
+            )
+            coordinates_and_distances = Obj.coordinates_and_distances(
+                query_results["sources"]
+            )
+            for obj, derived in zip(
+                query_results["sources"], coordinates_and_distances
+            ):
                 obj_list.append(obj.to_dict())
-                if include_comments:
-                    obj_list[-1]["comments"] = sorted(
-                        [
-                            {
-                                k: v
-                                for k, v in c.to_dict().items()
-                                if k != "attachment_bytes"
-                            }
-                            for c in Comment.query_records_accessible_by(
-                                self.current_user
-                            )
-                            .filter(Comment.obj_id == obj.id)
-                            .all()
-                        ],
-                        key=lambda x: x["created_at"],
-                        reverse=True,
-                    )
-
-                if not remove_nested:
-                    readable_classifications = (
-                        Classification.query_records_accessible_by(self.current_user)
-                        .filter(Classification.obj_id == obj.id)
-                        .all()
-                    )
-
-                    readable_classifications_json = []
-                    for classification in readable_classifications:
-                        classification_dict = classification.to_dict()
-                        classification_dict['groups'] = [
-                            g.to_dict() for g in classification.groups
-                        ]
-                        readable_classifications_json.append(classification_dict)
-
-                    obj_list[-1]["classifications"] = readable_classifications_json
-
-                    obj_list[-1]["annotations"] = sorted(
-                        Annotation.query_records_accessible_by(
-                            self.current_user
-                        ).filter(Annotation.obj_id == obj.id),
-                        key=lambda x: x.origin,
-                    )
-                obj_list[-1]["last_detected_at"] = obj.last_detected_at(
-                    self.current_user
-                )
-                obj_list[-1]["last_detected_mag"] = obj.last_detected_mag(
-                    self.current_user
-                )
-                obj_list[-1]["peak_detected_at"] = obj.peak_detected_at(
-                    self.current_user
-                )
-                obj_list[-1]["peak_detected_mag"] = obj.peak_detected_mag(
-                    self.current_user
-                )
-                obj_list[-1]["gal_lon"] = obj.gal_lon_deg
-                obj_list[-1]["gal_lat"] = obj.gal_lat_deg
-                obj_list[-1]["luminosity_distance"] = obj.luminosity_distance
-                obj_list[-1]["dm"] = obj.dm
-                obj_list[-1][
-                    "angular_diameter_distance"
-                ] = obj.angular_diameter_distance
-                if include_photometry:
-                    photometry = Photometry.query_records_accessible_by(
-                        self.current_user
-                    ).filter(Photometry.obj_id == obj.id)
-                    obj_list[-1]["photometry"] = [
-                        serialize(phot, 'ab', 'flux') for phot in photometry
-                    ]
-                if include_photometry_exists:
-                    obj_list[-1]["photometry_exists"] = (
-                        len(
-                            Photometry.query_records_accessible_by(self.current_user)
-                            .filter(Photometry.obj_id == obj.id)
-                            .all()
-                        )
-                        > 0
-                    )
-                if include_spectrum_exists:
-                    obj_list[-1]["spectrum_exists"] = (
-                        len(
-                            Spectrum.query_records_accessible_by(self.current_user)
-                            .filter(Spectrum.obj_id == obj.id)
-                            .all()
-                        )
-                        > 0
-                    )
-
-                if not remove_nested:
-                    source_query = Source.query_records_accessible_by(
-                        self.current_user
-                    ).filter(Source.obj_id == obj_list[-1]["id"])
-                    source_query = apply_active_or_requested_filtering(
-                        source_query, include_requested, requested_only
-                    )
-                    source_subquery = source_query.subquery()
-                    groups = (
-                        Group.query_records_accessible_by(self.current_user)
-                        .join(source_subquery, Group.id == source_subquery.c.group_id)
-                        .all()
-                    )
-                    obj_list[-1]["groups"] = [g.to_dict() for g in groups]
-                    for group in obj_list[-1]["groups"]:
-                        source_table_row = (
-                            Source.query_records_accessible_by(self.current_user)
-                            .filter(
-                                Source.obj_id == obj_list[-1]["id"],
-                                Source.group_id == group["id"],
-                            )
-                            .first()
-                        )
-                        if source_table_row is not None:
-                            group["active"] = source_table_row.active
-                            group["requested"] = source_table_row.requested
-                            group["saved_at"] = source_table_row.saved_at
-                            group["saved_by"] = (
-                                source_table_row.saved_by.to_dict()
-                                if source_table_row.saved_by is not None
-                                else None
-                            )
+                obj_list[-1].update(nested_data[obj.id])
+                obj_list[-1].update(derived)
                 if include_color_mag:
                     obj_list[-1]["color_magnitude"] = get_color_mag(
                         obj_list[-1]["annotations"]
@@ -1591,7 +1767,7 @@ class SourceOffsetsHandler(BaseHandler):
                 queries_issued,
                 noffsets,
                 used_ztfref,
-            ) = await IOLoop.current().run_in_executor(None, offset_func)
+            ) = await IOLoop.current().run_in_executor(finder_executor, offset_func)
         except ValueError:
             return self.error("Error querying for nearby offset stars")
 
@@ -1783,7 +1959,7 @@ class SourceFinderHandler(BaseHandler):
         self.push_notification(
             'Finding chart generation in progress. Download will start soon.'
         )
-        rez = await IOLoop.current().run_in_executor(None, finder)
+        rez = await IOLoop.current().run_in_executor(finder_executor, finder)
 
         filename = rez["name"]
         image = io.BytesIO(rez["data"])
@@ -1981,7 +2157,7 @@ class PS1ThumbnailHandler(BaseHandler):
         obj_id = data.get("objID")
         if obj_id is None:
             return self.error("Missing required paramter objID")
-        IOLoop.current().add_callback(
-            lambda: add_ps1_thumbnail_and_push_ws_msg(obj_id, self)
-        )
+        Obj.get_if_accessible_by(obj_id, self.current_user, raise_if_none=True)
+        self.verify_and_commit()
+        ps1_thumbnail_queue.add(obj_id)
         return self.success()
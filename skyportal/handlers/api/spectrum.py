@@ -23,6 +23,7 @@ from ...schema import (
     SpectrumPost,
     SpectrumAsciiFileParseJSON,
 )
+from ...utils.spectrum import resample_spectrum
 
 _, cfg = load_env()
 
@@ -482,6 +483,35 @@ class ObjSpectraHandler(BaseHandler):
               If omitted, returns the original spectrum.
               Options for normalization are:
               - median: normalize the flux to have median==1
+          - in: query
+            name: smoothing
+            required: false
+            schema:
+              type: integer
+            description: |
+              Width, in samples, of a boxcar to smooth the fluxes with
+              before resampling.
+          - in: query
+            name: minWavelength
+            required: false
+            schema:
+              type: number
+            description: Only return the part of the spectra above this wavelength.
+          - in: query
+            name: maxWavelength
+            required: false
+            schema:
+              type: number
+            description: Only return the part of the spectra below this wavelength.
+          - in: query
+            name: maxPoints
+            required: false
+            schema:
+              type: integer
+            description: |
+              Maximum number of samples to return per spectrum. Spectra with
+              more samples (in the requested wavelength range) are averaged
+              onto a regular grid of this many wavelength bins.
 
         responses:
           200:
@@ -512,6 +542,23 @@ class ObjSpectraHandler(BaseHandler):
         if obj is None:
             return self.error('Invalid object ID.')
 
+        resampling = {}
+        for argument, name, type_ in [
+            ('smoothing', 'smoothing', int),
+            ('minWavelength', 'min_wavelength', float),
+            ('maxWavelength', 'max_wavelength', float),
+            ('maxPoints', 'max_points', int),
+        ]:
+            value = self.get_query_argument(argument, None)
+            if value is not None:
+                try:
+                    value = type_(value)
+                except ValueError:
+                    return self.error(f'Invalid value for {argument}: {value}')
+                if type_ is int and value < 1:
+                    return self.error(f'{argument} must be positive')
+                resampling[name] = value
+
         spectra = (
             Spectrum.query_records_accessible_by(self.current_user)
             .filter(Spectrum.obj_id == obj_id)
@@ -520,6 +567,12 @@ class ObjSpectraHandler(BaseHandler):
         return_values = []
         for spec in spectra:
             spec_dict = recursive_to_dict(spec)
+            if resampling:
+                (
+                    spec_dict["wavelengths"],
+                    spec_dict["fluxes"],
+                    spec_dict["errors"],
+                ) = resample_spectrum(spec, **resampling)
             spec_dict["instrument_name"] = spec.instrument.name
             spec_dict["groups"] = spec.groups
             spec_dict["reducers"] = spec.reducers
@@ -5,6 +5,7 @@ import itertools
 from baselayer.app.env import load_env
 from baselayer.app.access import auth_or_token
 from ..base import BaseHandler
+from .internal.plot import photometry_plot_cache
 
 from skyportal.models import cosmo
 from skyportal.utils.gitlog import get_gitlog, parse_gitlog
@@ -56,6 +57,11 @@ class SysInfoHandler(BaseHandler):
                             cosmoref:
                                 type: string
                                 description: Reference for the cosmology used.
+                            photometryPlotCache:
+                                type: object
+                                description: |
+                                  Hits, misses and size of the photometry plot
+                                  cache of the app process serving the request.
         """
         # if another build system has written a gitlog file, use it
         gitlogs = []
@@ -81,5 +87,6 @@ class SysInfoHandler(BaseHandler):
                 "cosmology": str(cosmo),
                 "cosmoref": cosmo.__doc__,
                 "gitlog": parsed_log,
+                "photometryPlotCache": photometry_plot_cache.stats,
             }
         )
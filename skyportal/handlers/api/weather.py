@@ -1,17 +1,13 @@
-import datetime
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 
 from baselayer.app.access import auth_or_token
 from baselayer.app.env import load_env
-from ...utils.offset import get_url
 
 from ..base import BaseHandler
 from ...models import DBSession, Telescope, Weather
 
 _, cfg = load_env()
 weather_refresh = cfg["weather"].get("refresh_time") if cfg.get("weather") else None
-openweather_api_key = (
-    cfg["weather"].get("openweather_api_key") if cfg.get("weather") else None
-)
 
 default_prefs = {'telescopeID': 1}
 
@@ -72,35 +68,21 @@ class WeatherHandler(BaseHandler):
             )
         weather = Weather.query.filter(Weather.telescope_id == telescope_id).first()
         if weather is None:
-            weather = Weather(telescope=telescope)
-            DBSession().add(weather)
-
-        # Should we call the API again?
-        refresh = weather_refresh is not None
-        if refresh and weather.retrieved_at is not None:
-            if (
-                weather.retrieved_at + datetime.timedelta(seconds=weather_refresh)
-                >= datetime.datetime.utcnow()
-            ):
-                # it is too soon to refresh
-                refresh = False
-        elif weather.retrieved_at is None:
-            refresh = True
+            # start tracking this telescope; the weather refresher service
+            # fetches its weather shortly
+            DBSession().execute(
+                pg_insert(Weather.__table__)
+                .values(telescope_id=telescope_id)
+                .on_conflict_do_nothing(index_elements=['telescope_id'])
+            )
+            weather = Weather.query.filter(Weather.telescope_id == telescope_id).first()
 
         message = ""
-        if refresh:
-            response = get_url(
-                "https://api.openweathermap.org/data/2.5/onecall?"
-                f"lat={telescope.lat}&lon={telescope.lon}&appid={openweather_api_key}"
-            )
-            if response is not None:
-                if response.status_code == 200:
-                    data = response.json()
-                    weather.weather_info = data
-                    weather.retrieved_at = datetime.datetime.utcnow()
-                    self.verify_and_commit()
-                else:
-                    message = response.text
+        if weather.weather_info is None:
+            if weather_refresh is None:
+                message = "Weather refresh is not configured"
+            else:
+                message = "Weather has not been retrieved yet"
 
         self.verify_and_commit()
         return self.success(
@@ -2,6 +2,7 @@ import json
 import re
 import uuid
 import warnings
+import zlib
 from datetime import datetime, timezone, timedelta
 
 import arrow
@@ -10,7 +11,6 @@ import healpix_alchemy as ha
 import numpy as np
 import requests
 import sqlalchemy as sa
-import timezonefinder
 import yaml
 from astropy import coordinates as ap_coord
 from astropy import time as ap_time
@@ -67,7 +67,8 @@ from .enum_types import (
     api_classnames,
     listener_classnames,
 )
-from .utils.cosmology import establish_cosmology
+from .utils.cosmology import establish_cosmology, LuminosityDistanceTable
+from .utils.ephemeris import get_observer, get_ephemeris, pickering_airmass
 from .utils.thumbnail import image_is_grayscale
 
 # In the AB system, a brightness of 23.9 mag corresponds to 1 microJy.
@@ -79,11 +80,37 @@ utcnow = func.timezone('UTC', func.current_timestamp())
 
 _, cfg = load_env()
 cosmo = establish_cosmology(cfg)
+luminosity_distance_table = LuminosityDistanceTable(cosmo)
 
 # The minimum signal-to-noise ratio to consider a photometry point as a detection
 PHOT_DETECTION_THRESHOLD = cfg["misc.photometry_detection_threshold_nsigma"]
 
 
+def altdata_luminosity_distance(altdata):
+    """The luminosity distance in Mpc given by the `dm`, `parallax`,
+    `dist_kpc`, `dist_Mpc`, `dist_pc` or `dist_cm` fields of an Obj's
+    `altdata` (in that order), or None."""
+    if not altdata:
+        return None
+    if altdata.get("dm") is not None:
+        # see eq (24) of https://ned.ipac.caltech.edu/level5/Hogg/Hogg7.html
+        return ((10 ** (float(altdata.get("dm")) / 5.0)) * 1e-5 * u.Mpc).value
+    if altdata.get("parallax") is not None:
+        if float(altdata.get("parallax")) > 0:
+            # assume parallax in arcsec
+            return (1e-6 * u.Mpc / float(altdata.get("parallax"))).value
+
+    if altdata.get("dist_kpc") is not None:
+        return (float(altdata.get("dist_kpc")) * 1e-3 * u.Mpc).value
+    if altdata.get("dist_Mpc") is not None:
+        return (float(altdata.get("dist_Mpc")) * u.Mpc).value
+    if altdata.get("dist_pc") is not None:
+        return (float(altdata.get("dist_pc")) * 1e-6 * u.Mpc).value
+    if altdata.get("dist_cm") is not None:
+        return (float(altdata.get("dist_cm")) * u.Mpc / 3.085e18).value
+    return None
+
+
 def get_app_base_url():
     ports_to_ignore = {True: 443, False: 80}  # True/False <-> server.ssl=True/False
     return f"{'https' if cfg['server.ssl'] else 'http'}:" f"//{cfg['server.host']}" + (
@@ -227,6 +254,62 @@ class NumpyArray(sa.types.TypeDecorator):
         return np.array(value)
 
 
+class NumpyBinaryArray(sa.types.TypeDecorator):
+    """SQLAlchemy representation of a 1-d NumPy array, stored as its raw bytes.
+
+    Values are stored as `bytea`: a short header holding the dtype of the
+    array (so the stored data can always be decoded, whatever `dtype` is
+    later configured) followed by the array data, optionally compressed
+    with zlib. Uncompressed arrays are decoded without copying with
+    `np.frombuffer`, so the arrays read from the database are read-only.
+    """
+
+    impl = sa.LargeBinary
+
+    MAGIC = b'NPA1'
+
+    def __init__(self, dtype='float64', compress=False, *args, **kwargs):
+        """
+        Parameters
+        ----------
+        dtype : str or `numpy.dtype`, optional
+            Data type the arrays are stored as.
+        compress : bool, optional
+            Whether to compress the array data with zlib.
+        """
+        super().__init__(*args, **kwargs)
+        self.dtype = np.dtype(dtype)
+        self.compress = compress
+
+    @property
+    def python_type(self):
+        # arrays are exchanged as lists through the API schemas
+        return list
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        array = np.ascontiguousarray(value, dtype=self.dtype)
+        data = array.tobytes()
+        if self.compress:
+            data = zlib.compress(data)
+        dtype = array.dtype.str.encode('ascii')
+        return self.MAGIC + bytes([self.compress, len(dtype)]) + dtype + data
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        value = memoryview(value)
+        if bytes(value[:4]) != self.MAGIC:
+            raise ValueError('Value is not a binary-encoded array.')
+        compressed, dtype_length = value[4], value[5]
+        dtype = np.dtype(bytes(value[6 : 6 + dtype_length]).decode('ascii'))
+        data = value[6 + dtype_length :]
+        if compressed:
+            data = zlib.decompress(data)
+        return np.frombuffer(data, dtype=dtype)
+
+
 def delete_group_access_logic(cls, user_or_token):
     """User can delete a group that is not the sitewide public group, is not
     a single user group, and that they are an admin member of."""
@@ -810,6 +893,64 @@ class Obj(Base, ha.Point):
             .label('peak_detected_mag')
         )
 
+    @classmethod
+    def detection_stats(cls, obj_ids, user):
+        """Compute `last_detected_at`, `last_detected_mag`, `peak_detected_at`
+        and `peak_detected_mag` for many objects with a single query.
+
+        Parameters
+        ----------
+        obj_ids : list of str
+            IDs of the objects to compute detection statistics for.
+        user : `baselayer.app.models.User` or `baselayer.app.models.Token`
+            The user or token whose photometry access is used.
+
+        Returns
+        -------
+        stats : dict
+            Dictionary mapping each requested object ID to a dictionary with
+            the four keys above. Objects without detections map to None values.
+        """
+        stats = {
+            obj_id: {
+                "last_detected_at": None,
+                "last_detected_mag": None,
+                "peak_detected_at": None,
+                "peak_detected_mag": None,
+            }
+            for obj_id in obj_ids
+        }
+        if len(stats) == 0:
+            return stats
+
+        detections = (
+            Photometry.query_records_accessible_by(
+                user,
+                columns=[Photometry.obj_id, Photometry.mjd, Photometry.mag],
+                mode="read",
+            )
+            .filter(Photometry.obj_id.in_(list(stats)))
+            .filter(Photometry.snr.isnot(None))
+            .filter(Photometry.snr > PHOT_DETECTION_THRESHOLD)
+            .all()
+        )
+
+        last, peak = {}, {}
+        for obj_id, mjd, mag in detections:
+            if obj_id not in last or mjd > last[obj_id][0]:
+                last[obj_id] = (mjd, mag)
+            if mag is not None and (obj_id not in peak or mag > peak[obj_id][1]):
+                peak[obj_id] = (mjd, mag)
+
+        for obj_id, (mjd, mag) in last.items():
+            stats[obj_id]["last_detected_at"] = arrow.get((mjd - 40_587) * 86400.0)
+            stats[obj_id]["last_detected_mag"] = mag
+        for obj_id, (mjd, mag) in peak.items():
+            stats[obj_id]["peak_detected_at"] = arrow.get((mjd - 40_587) * 86400.0)
+            stats[obj_id]["peak_detected_mag"] = mag
+
+        return stats
+
     def add_linked_thumbnails(self):
         """Determine the URLs of the SDSS and DESI DR8 thumbnails of the object,
         insert them into the Thumbnails table, and link them to the object."""
@@ -853,7 +994,7 @@ class Obj(Base, ha.Point):
             f"?pos={self.ra}+{self.dec}&filter=color&filter=g"
             f"&filter=r&filter=i&filetypes=stack&size=250"
         )
-        response = requests.get(ps_query_url)
+        response = requests.get(ps_query_url, timeout=(6.05, 20))
         match = re.search('src="//ps1images.stsci.edu.*?"', response.content.decode())
         return match.group().replace('src="', 'http:').replace('"', '')
 
@@ -891,25 +1032,9 @@ class Obj(Base, ha.Point):
 
         # there may be a non-redshift based measurement of distance
         # for nearby sources
-        if self.altdata:
-            if self.altdata.get("dm") is not None:
-                # see eq (24) of https://ned.ipac.caltech.edu/level5/Hogg/Hogg7.html
-                return (
-                    (10 ** (float(self.altdata.get("dm")) / 5.0)) * 1e-5 * u.Mpc
-                ).value
-            if self.altdata.get("parallax") is not None:
-                if float(self.altdata.get("parallax")) > 0:
-                    # assume parallax in arcsec
-                    return (1e-6 * u.Mpc / float(self.altdata.get("parallax"))).value
-
-            if self.altdata.get("dist_kpc") is not None:
-                return (float(self.altdata.get("dist_kpc")) * 1e-3 * u.Mpc).value
-            if self.altdata.get("dist_Mpc") is not None:
-                return (float(self.altdata.get("dist_Mpc")) * u.Mpc).value
-            if self.altdata.get("dist_pc") is not None:
-                return (float(self.altdata.get("dist_pc")) * 1e-6 * u.Mpc).value
-            if self.altdata.get("dist_cm") is not None:
-                return (float(self.altdata.get("dist_cm")) * u.Mpc / 3.085e18).value
+        distance = altdata_luminosity_distance(self.altdata)
+        if distance is not None:
+            return distance
 
         if self.redshift:
             if self.redshift * 2.99e5 * u.km / u.s < 350 * u.km / u.s:
@@ -940,6 +1065,84 @@ class Obj(Base, ha.Point):
             return dl
         return None
 
+    @classmethod
+    def coordinates_and_distances(cls, objs):
+        """Compute `gal_lat`, `gal_lon`, `luminosity_distance`, `dm` and
+        `angular_diameter_distance` (as given by `gal_lat_deg`,
+        `gal_lon_deg` and the properties of the same names) for many
+        objects at once.
+
+        The galactic coordinates of all objects are computed with a single
+        coordinate transformation, and redshift-based distances are
+        interpolated from `luminosity_distance_table`.
+
+        Parameters
+        ----------
+        objs : list of `skyportal.models.Obj`
+            The objects to compute the values for.
+
+        Returns
+        -------
+        list of dict
+            The values of each object, in the same order as `objs`.
+        """
+        if len(objs) == 0:
+            return []
+
+        ra = np.array([obj.ra for obj in objs], dtype=float)
+        dec = np.array([obj.dec for obj in objs], dtype=float)
+        galactic = ap_coord.SkyCoord(ra, dec, unit="deg").galactic
+        gal_lat = galactic.b.deg
+        gal_lon = galactic.l.deg
+
+        redshift = np.array(
+            [obj.redshift if obj.redshift else np.nan for obj in objs], dtype=float
+        )
+        # see `luminosity_distance` and `angular_diameter_distance`
+        with np.errstate(invalid="ignore"):
+            in_hubble_flow = redshift * 2.99e5 >= 350
+            beyond_hubble_flow_limit = redshift * 2.99e5 > 350
+
+        distance = np.full(len(objs), np.nan)
+        distance[in_hubble_flow] = luminosity_distance_table.luminosity_distance(
+            redshift[in_hubble_flow]
+        )
+        for i, obj in enumerate(objs):
+            altdata_distance = altdata_luminosity_distance(obj.altdata)
+            if altdata_distance is not None:
+                distance[i] = altdata_distance
+
+        has_distance = np.isfinite(distance) & (distance != 0)
+        dm = np.full(len(objs), np.nan)
+        angular_diameter_distance = np.full(len(objs), np.nan)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            dm[has_distance] = 5.0 * np.log10(distance[has_distance] * 1e5)
+            angular_diameter_distance[has_distance] = np.where(
+                beyond_hubble_flow_limit[has_distance],
+                distance[has_distance] / (1 + redshift[has_distance]) ** 2,
+                distance[has_distance],
+            )
+
+        def to_list(values):
+            return [float(v) if np.isfinite(v) else None for v in values]
+
+        return [
+            {
+                "gal_lat": lat,
+                "gal_lon": lon,
+                "luminosity_distance": dl,
+                "dm": m,
+                "angular_diameter_distance": da,
+            }
+            for lat, lon, dl, m, da in zip(
+                to_list(gal_lat),
+                to_list(gal_lon),
+                to_list(distance),
+                to_list(dm),
+                to_list(angular_diameter_distance),
+            )
+        ]
+
     def airmass(self, telescope, time, below_horizon=np.inf):
         """Return the airmass of the object at a given time. Uses the Pickering
         (2002) interpolation of the Rayleigh (molecular atmosphere) airmass.
@@ -967,21 +1170,8 @@ class Obj(Base, ha.Point):
         output_shape = time.shape
         time = np.atleast_1d(time)
         altitude = self.altitude(telescope, time).to('degree').value
-        above = altitude > 0
-
-        # use Pickering (2002) interpolation to calculate the airmass
-        # The Pickering interpolation tends toward 38.7494 as the altitude
-        # approaches zero.
-        sinarg = np.zeros_like(altitude)
-        airmass = np.ones_like(altitude) * np.inf
-        sinarg[above] = altitude[above] + 244 / (165 + 47 * altitude[above] ** 1.1)
-        airmass[above] = 1.0 / np.sin(np.deg2rad(sinarg[above]))
-
-        # set objects below the horizon to an airmass of infinity
-        airmass[~above] = below_horizon
-        airmass = airmass.reshape(output_shape)
-
-        return airmass
+        airmass = pickering_airmass(altitude, below_horizon=below_horizon)
+        return airmass.reshape(output_shape)
 
     def altitude(self, telescope, time):
         """Return the altitude of the object at a given time.
@@ -1287,21 +1477,9 @@ class Telescope(Base):
     def observer(self):
         """Return an `astroplan.Observer` representing an observer at this
         facility, accounting for the latitude, longitude, elevation, and
-        local time zone of the observatory (if ground based)."""
-        try:
-            return self._observer
-        except AttributeError:
-            tf = timezonefinder.TimezoneFinder(in_memory=True)
-            local_tz = tf.closest_timezone_at(
-                lng=self.lon, lat=self.lat, delta_degree=5
-            )
-            self._observer = astroplan.Observer(
-                longitude=self.lon * u.deg,
-                latitude=self.lat * u.deg,
-                elevation=self.elevation * u.m,
-                timezone=local_tz,
-            )
-        return self._observer
+        local time zone of the observatory (if ground based). Observers are
+        shared by all Telescopes at the same location."""
+        return get_observer(self.lon, self.lat, self.elevation)
 
     def next_sunset(self, time=None):
         """The astropy timestamp of the next sunset after `time` at this site.
@@ -1351,24 +1529,20 @@ class Telescope(Base):
         observer = self.observer
         return observer.twilight_morning_astronomical(time, which='next')
 
-    def ephemeris(self, time):
-
-        sunrise = self.next_sunrise(time=time)
-        sunset = self.next_sunset(time=time)
+    def night_ephemeris(self, time):
+        """Sunset, sunrise and twilights (as astropy timestamps) of the night
+        `time` falls in, or of the next night if `time` is during the day.
+        Results are cached per site and night."""
+        return get_ephemeris(self.observer, time)
 
-        if sunset > sunrise:
-            sunset = self.observer.sun_set_time(time, which='previous')
-            time = sunset - ap_time.TimeDelta(30, format='sec')
-
-        twilight_morning_astronomical = self.next_twilight_morning_astronomical(
-            time=time
-        )
-        twilight_evening_astronomical = self.next_twilight_evening_astronomical(
-            time=time
-        )
-
-        twilight_morning_nautical = self.next_twilight_morning_nautical(time=time)
-        twilight_evening_nautical = self.next_twilight_evening_nautical(time=time)
+    def ephemeris(self, time):
+        night = self.night_ephemeris(time)
+        sunset = night['sunset']
+        sunrise = night['sunrise']
+        twilight_morning_astronomical = night['twilight_morning_astronomical']
+        twilight_evening_astronomical = night['twilight_evening_astronomical']
+        twilight_morning_nautical = night['twilight_morning_nautical']
+        twilight_evening_nautical = night['twilight_evening_nautical']
 
         return {
             'sunset_utc': sunset.isot,
@@ -1377,7 +1551,9 @@ class Telescope(Base):
             'twilight_evening_astronomical_utc': twilight_evening_astronomical.isot,
             'twilight_morning_nautical_utc': twilight_morning_nautical.isot,
             'twilight_evening_nautical_utc': twilight_evening_nautical.isot,
-            'utc_offset_hours': self.observer.timezone.utcoffset(time.datetime)
+            'utc_offset_hours': self.observer.timezone.utcoffset(
+                min(time, sunset).datetime
+            )
             / timedelta(hours=1),
             'sunset_unix_ms': sunset.unix * 1000,
             'sunrise_unix_ms': sunrise.unix * 1000,
@@ -2232,6 +2408,219 @@ StreamPhotometry.__doc__ = "Join table mapping Streams to Photometry."
 StreamPhotometry.create = accessible_by_stream_members
 
 
+class PhotometrySummary(Base):
+    """Summary of the detections of an Obj among the photometry shared with a
+    given Group or Stream. Kept up to date whenever an Obj's photometry is added,
+    modified, deleted or shared with other groups or streams, so that
+    detection-based
+    filters do not have to scan the photometry table.
+
+    Changes made through the ORM are summarized before each commit (see
+    `refresh_changed_photometry_summaries`); code writing the photometry
+    tables with bulk SQL must call `refresh` itself."""
+
+    __tablename__ = 'photometry_summaries'
+
+    create = update = delete = restricted
+    read = accessible_by_group_members | accessible_by_stream_members
+
+    obj_id = sa.Column(
+        sa.ForeignKey('objs.id', ondelete='CASCADE'),
+        nullable=False,
+        index=True,
+        doc="ID of the summarized Obj.",
+    )
+    obj = relationship('Obj', doc="The summarized Obj.")
+    group_id = sa.Column(
+        sa.ForeignKey('groups.id', ondelete='CASCADE'),
+        nullable=True,
+        index=True,
+        doc="ID of the Group whose photometry is summarized, if any.",
+    )
+    group = relationship('Group', doc="The Group whose photometry is summarized.")
+    stream_id = sa.Column(
+        sa.ForeignKey('streams.id', ondelete='CASCADE'),
+        nullable=True,
+        index=True,
+        doc="ID of the Stream whose photometry is summarized, if any.",
+    )
+    stream = relationship('Stream', doc="The Stream whose photometry is summarized.")
+    last_detected_mjd = sa.Column(
+        sa.Float,
+        nullable=False,
+        index=True,
+        doc="MJD of the latest detection above a given S/N (3.0 by default).",
+    )
+    last_detected_mag = sa.Column(
+        sa.Float,
+        nullable=True,
+        index=True,
+        doc="Magnitude of the latest detection above a given S/N (3.0 by default).",
+    )
+    peak_detected_mjd = sa.Column(
+        sa.Float,
+        nullable=True,
+        doc="MJD of the peak magnitude detection above a given S/N (3.0 by default).",
+    )
+    peak_detected_mag = sa.Column(
+        sa.Float,
+        nullable=True,
+        index=True,
+        doc="Peak magnitude of the detections above a given S/N (3.0 by default).",
+    )
+
+    __table_args__ = (
+        UniqueConstraint('obj_id', 'group_id'),
+        UniqueConstraint('obj_id', 'stream_id'),
+        sa.CheckConstraint(
+            'num_nonnulls(group_id, stream_id) = 1',
+            name='photometry_summaries_group_or_stream',
+        ),
+    )
+
+    @classmethod
+    def refresh(cls, obj_ids):
+        """Recompute the summaries of the given Objs from their photometry.
+
+        Only the rows of the given Objs are rewritten, so this is cheap to call
+        after each photometry write. Pending ORM changes are flushed first so
+        that they are taken into account.
+        """
+        obj_ids = list(set(obj_ids))
+        if len(obj_ids) == 0:
+            return
+
+        session = DBSession()
+        session.flush()
+        session.info.get('photometry_summary_obj_ids', set()).difference_update(obj_ids)
+
+        def detections(join_model, column):
+            window = {'partition_by': [Photometry.obj_id, column]}
+            group_id, stream_id = (
+                (column, sa.null())
+                if join_model is GroupPhotometry
+                else (sa.null(), column)
+            )
+            return (
+                sa.select(
+                    [
+                        Photometry.obj_id,
+                        group_id,
+                        stream_id,
+                        sa.func.max(Photometry.mjd).over(**window),
+                        sa.func.first_value(Photometry.mag).over(
+                            order_by=Photometry.mjd.desc(), **window
+                        ),
+                        sa.func.first_value(Photometry.mjd).over(
+                            order_by=Photometry.mag.desc().nullslast(), **window
+                        ),
+                        sa.func.max(Photometry.mag).over(**window),
+                        sa.func.timezone('UTC', sa.func.now()),
+                        sa.func.timezone('UTC', sa.func.now()),
+                    ]
+                )
+                .select_from(
+                    sa.join(
+                        Photometry.__table__,
+                        join_model.__table__,
+                        Photometry.id == join_model.photometr_id,
+                    )
+                )
+                .where(Photometry.obj_id.in_(obj_ids))
+                .where(Photometry.snr.isnot(None))
+                .where(Photometry.snr > PHOT_DETECTION_THRESHOLD)
+                .distinct()
+            )
+
+        session.execute(cls.__table__.delete().where(cls.obj_id.in_(obj_ids)))
+        session.execute(
+            cls.__table__.insert().from_select(
+                [
+                    'obj_id',
+                    'group_id',
+                    'stream_id',
+                    'last_detected_mjd',
+                    'last_detected_mag',
+                    'peak_detected_mjd',
+                    'peak_detected_mag',
+                    'created_at',
+                    'modified',
+                ],
+                sa.union_all(
+                    detections(GroupPhotometry, GroupPhotometry.group_id),
+                    detections(StreamPhotometry, StreamPhotometry.stream_id),
+                ),
+            )
+        )
+
+    @classmethod
+    def query_by_obj(cls, user_or_token):
+        """Combine the summaries of the Groups and Streams accessible to a user
+        into a single row per Obj, with columns `obj_id`, `last_detected_mjd`,
+        `last_detected_mag` and `peak_detected_mag`."""
+        return cls.query_records_accessible_by(
+            user_or_token,
+            columns=[
+                cls.obj_id,
+                sa.func.max(cls.last_detected_mjd).label('last_detected_mjd'),
+                psql.array_agg(
+                    psql.aggregate_order_by(
+                        cls.last_detected_mag, cls.last_detected_mjd.desc()
+                    )
+                )[1].label('last_detected_mag'),
+                sa.func.max(cls.peak_detected_mag).label('peak_detected_mag'),
+            ],
+        ).group_by(cls.obj_id)
+
+
+@event.listens_for(DBSession, 'after_flush')
+def record_photometry_summary_changes(session, flush_context):
+    """Remember the Objs whose photometry or its sharing with groups or streams
+    was changed through the ORM, so that their summaries are refreshed before the
+    transaction commits."""
+    obj_ids = set()
+    photometry_ids = set()
+    for instance in set(session.new) | set(session.dirty) | set(session.deleted):
+        if isinstance(instance, Photometry):
+            # read the state directly: expired attributes of deleted rows
+            # cannot be loaded anymore
+            state = sa.inspect(instance)
+            obj_ids.add(state.dict.get('obj_id'))
+            # an Obj that photometry was moved away from
+            obj_ids.update(state.attrs.obj_id.history.deleted)
+            if 'obj_id' not in state.dict and state.identity is not None:
+                photometry_ids.add(state.identity[0])
+        elif isinstance(instance, (GroupPhotometry, StreamPhotometry)):
+            photometry_ids.add(instance.photometr_id)
+    if len(photometry_ids) > 0:
+        obj_ids.update(
+            obj_id
+            for obj_id, in session.execute(
+                sa.select([Photometry.obj_id]).where(Photometry.id.in_(photometry_ids))
+            )
+        )
+    obj_ids.discard(None)
+    if len(obj_ids) > 0:
+        session.info.setdefault('photometry_summary_obj_ids', set()).update(obj_ids)
+
+
+@event.listens_for(DBSession, 'before_commit')
+def refresh_changed_photometry_summaries(session):
+    """Refresh the summaries of the Objs recorded by
+    `record_photometry_summary_changes` that were not refreshed explicitly
+    (e.g. by the photometry API) in this transaction."""
+    session.flush()
+    obj_ids = session.info.get('photometry_summary_obj_ids')
+    while obj_ids:
+        PhotometrySummary.refresh(list(obj_ids))
+
+
+@event.listens_for(DBSession, 'after_transaction_end')
+def forget_photometry_summary_changes(session, transaction):
+    if transaction.parent is None:
+        session.info.pop('photometry_summary_obj_ids', None)
+
+
 class Spectrum(Base):
     """Wavelength-dependent measurement of the flux of an object through a
     dispersive element."""
@@ -2240,17 +2629,18 @@ class Spectrum(Base):
     update = delete = accessible_by_owner
 
     __tablename__ = 'spectra'
-    # TODO better numpy integration
     wavelengths = sa.Column(
-        NumpyArray, nullable=False, doc="Wavelengths of the spectrum [Angstrom]."
+        NumpyBinaryArray,
+        nullable=False,
+        doc="Wavelengths of the spectrum [Angstrom].",
     )
     fluxes = sa.Column(
-        NumpyArray,
+        NumpyBinaryArray,
         nullable=False,
         doc="Flux of the Spectrum [F_lambda, arbitrary units].",
     )
     errors = sa.Column(
-        NumpyArray,
+        NumpyBinaryArray,
         doc="Errors on the fluxes of the spectrum [F_lambda, same units as `fluxes`.]",
     )
 
@@ -2976,10 +3366,9 @@ class ObservingRun(Base):
     def rise_time(self, target_or_targets, altitude=30 * u.degree):
         """The rise time of the specified targets as an astropy.time.Time."""
         observer = self.instrument.telescope.observer
-        sunset = self.instrument.telescope.next_sunset(self.calendar_noon).reshape((1,))
-        sunrise = self.instrument.telescope.next_sunrise(self.calendar_noon).reshape(
-            (1,)
-        )
+        night = self.instrument.telescope.night_ephemeris(self.calendar_noon)
+        sunset = night['sunset'].reshape((1,))
+        sunrise = night['sunrise'].reshape((1,))
         original_shape = np.asarray(target_or_targets).shape
         target_array = (
             [target_or_targets] if len(original_shape) == 0 else target_or_targets
@@ -3005,7 +3394,7 @@ class ObservingRun(Base):
     def set_time(self, target_or_targets, altitude=30 * u.degree):
         """The set time of the specified targets as an astropy.time.Time."""
         observer = self.instrument.telescope.observer
-        sunset = self.instrument.telescope.next_sunset(self.calendar_noon)
+        sunset = self.instrument.telescope.night_ephemeris(self.calendar_noon)['sunset']
         original_shape = np.asarray(target_or_targets).shape
         return observer.target_set_time(
             sunset, target_or_targets, which='next', horizon=altitude
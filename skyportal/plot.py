@@ -3,6 +3,7 @@ import math
 
 import numpy as np
 import pandas as pd
+import sqlalchemy as sa
 
 from bokeh.core.properties import List, String
 from bokeh.layouts import row, column
@@ -40,7 +41,11 @@ from skyportal.models import (
     Telescope,
     PHOT_ZP,
     Spectrum,
+    GroupPhotometry,
+    StreamPhotometry,
+    GroupSpectrum,
 )
+from skyportal.utils.spectrum import resample_spectrum, smooth
 
 import sncosmo
 
@@ -365,13 +370,137 @@ def add_plot_legend(plot, legend_items, width, legend_orientation, legend_loc):
         )
 
 
-def photometry_plot(obj_id, user, width=600, device="browser"):
+def errorbar_segments(x, y, err):
+    """Return the `xs` and `ys` of vertical error bars centered on (`x`, `y`)
+    with half-length `err`, for use with `multi_line`."""
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    err = np.asarray(err, dtype=float)
+    return (
+        np.column_stack([x, x]).tolist(),
+        np.column_stack([y - err, y + err]).tolist(),
+    )
+
+
+def bin_photometry(data, max_points):
+    """Bin a light curve in time so that it has at most about `max_points`
+    points.
+
+    Points are binned separately for each label (instrument/filter/origin),
+    and detections and non-detections are never combined. Within a bin,
+    fluxes and MJDs are averaged with inverse-variance weights, and the
+    other columns are taken from the first point of the bin. Points that
+    are the combination of several measurements are marked as `stacked`.
+
+    Parameters
+    ----------
+    data : `pandas.DataFrame`
+        Photometry with at least the columns 'label', 'mjd', 'flux',
+        'fluxerr' and 'stacked'.
+    max_points : int
+        Target maximum number of points.
+
+    Returns
+    -------
+    `pandas.DataFrame`
+        The binned photometry, with the same columns as `data`.
+    """
+    columns = list(data.columns)
+    hasflux = data['flux'].notnull()
+    n_groups = data.groupby(['label', hasflux]).ngroups
+    n_bins = max(1, max_points // n_groups)
+
+    mjd_min = data['mjd'].min()
+    binsize = (data['mjd'].max() - mjd_min) / n_bins or 1.0
+    weight = 1.0 / data['fluxerr'] ** 2
+    data = data.assign(
+        _bin=np.minimum(np.floor((data['mjd'] - mjd_min) / binsize), n_bins - 1),
+        _hasflux=hasflux,
+        _w=weight,
+        _wflux=weight * data['flux'].fillna(0.0),
+        _wmjd=weight * data['mjd'],
+    )
+
+    grouped = data.groupby(['label', '_bin', '_hasflux'], sort=False)
+    sums = grouped[['_w', '_wflux', '_wmjd']].sum()
+    binned = grouped.first()
+    binned['mjd'] = sums['_wmjd'] / sums['_w']
+    binned['fluxerr'] = 1.0 / np.sqrt(sums['_w'])
+    binned['flux'] = (sums['_wflux'] / sums['_w']).where(
+        binned.index.get_level_values('_hasflux')
+    )
+    binned['stacked'] = grouped.size() > 1
+
+    return binned.reset_index()[columns]
+
+
+def photometry_plot_version(obj_id, owner_id):
+    """Fingerprint of the data shown on the photometry plot of an object.
+
+    Any write to the photometry, spectra or annotations of the object, to the
+    groups or streams they are shared with, or to the object itself changes
+    the fingerprint, so it can be used to key cached plots.
+
+    Parameters
+    ----------
+    obj_id : str
+        ID of the Obj.
+    owner_id : int
+        ID of the User requesting the plot; whether they own any of the
+        photometry (which is then visible to them regardless of groups) is
+        part of the fingerprint.
+
+    Returns
+    -------
+    tuple
+        The fingerprint.
+    """
+
+    def stamp(table, link_table=None, link_column=None):
+        if link_table is None:
+            return (
+                f'(SELECT row(count(*), max(id), max(modified))::text '
+                f'FROM {table} WHERE obj_id = :obj_id)'
+            )
+        return (
+            f'(SELECT row(count(*), max(l.id), max(l.modified))::text '
+            f'FROM {link_table} AS l JOIN {table} AS t ON t.id = l.{link_column} '
+            f'WHERE t.obj_id = :obj_id)'
+        )
+
+    photometry = Photometry.__tablename__
+    spectra = Spectrum.__tablename__
+    query = sa.text(
+        'SELECT '
+        + ', '.join(
+            [
+                stamp(photometry),
+                stamp(photometry, GroupPhotometry.__tablename__, 'photometr_id'),
+                stamp(photometry, StreamPhotometry.__tablename__, 'photometr_id'),
+                stamp(spectra),
+                stamp(spectra, GroupSpectrum.__tablename__, 'spectr_id'),
+                stamp(Annotation.__tablename__),
+                f'(SELECT modified::text FROM {Obj.__tablename__} WHERE id = :obj_id)',
+                f'EXISTS (SELECT 1 FROM {photometry} '
+                f'WHERE obj_id = :obj_id AND owner_id = :owner_id)',
+            ]
+        )
+    )
+    return tuple(
+        DBSession().execute(query, {'obj_id': obj_id, 'owner_id': owner_id}).first()
+    )
+
+
+def photometry_plot(obj_id, user, width=600, device="browser", max_points=None):
     """Create object photometry scatter plot.
 
     Parameters
     ----------
     obj_id : str
         ID of Obj to be plotted.
+    max_points : int, optional
+        If given, light curves with more points are binned in time (see
+        `bin_photometry`) to keep the size of the plot bounded.
 
     Returns
     -------
@@ -407,8 +536,20 @@ def photometry_plot(obj_id, user, width=600, device="browser"):
         .all()
     )
 
-    data['effwave'] = [get_effective_wavelength(f) for f in data['filter']]
-    data['color'] = [get_color(w) for w in data['effwave']]
+    # look up the wavelength and color of each filter only once
+    filters = list(data['filter'].unique())
+    ewaves = [get_effective_wavelength(f) for f in filters]
+    colors = [get_color(w) for w in ewaves]
+    data['effwave'] = data['filter'].map(dict(zip(filters, ewaves)))
+    data['color'] = data['filter'].map(dict(zip(filters, colors)))
+
+    data['label'] = data['instrument'] + '/' + data['filter']
+    has_origin = data['origin'].notnull()
+    data.loc[has_origin, 'label'] += '/' + data.loc[has_origin, 'origin']
+    data['stacked'] = False
+
+    if max_points is not None and len(data) > max_points:
+        data = bin_photometry(data, max_points)
 
     data.sort_values(by=['effwave'], inplace=True)
 
@@ -418,21 +559,9 @@ def photometry_plot(obj_id, user, width=600, device="browser"):
     for i, inst in enumerate(instruments):
         markers.append(phot_markers[i % len(phot_markers)])
 
-    filters = list(set(data['filter']))
-    ewaves = [get_effective_wavelength(f) for f in filters]
-    colors = [get_color(w) for w in ewaves]
-
     color_mapper = CategoricalColorMapper(factors=filters, palette=colors)
     color_dict = {'field': 'filter', 'transform': color_mapper}
 
-    labels = []
-    for i, datarow in data.iterrows():
-        label = f'{datarow["instrument"]}/{datarow["filter"]}'
-        if datarow['origin'] is not None:
-            label += f'/{datarow["origin"]}'
-        labels.append(label)
-
-    data['label'] = labels
     data['zp'] = PHOT_ZP
     data['magsys'] = 'ab'
     data['alpha'] = 1.0
@@ -463,7 +592,6 @@ def photometry_plot(obj_id, user, width=600, device="browser"):
     magerrs = np.abs(coeff * data[obsind]['fluxerr'] / data[obsind]['flux'])
     data.loc[obsind, 'magerr'] = magerrs
     data['obs'] = obsind
-    data['stacked'] = False
 
     split = data.groupby('label', sort=False)
 
@@ -600,16 +728,7 @@ def photometry_plot(obj_id, user, width=600, device="browser"):
         imhover.renderers.append(model_dict[key])
 
         key = 'obserr' + str(i)
-        y_err_x = []
-        y_err_y = []
-
-        for d, ro in df.iterrows():
-            px = ro['mjd']
-            py = ro['flux']
-            err = ro['fluxerr']
-
-            y_err_x.append((px, px))
-            y_err_y.append((py - err, py + err))
+        y_err_x, y_err_y = errorbar_segments(df['mjd'], df['flux'], df['fluxerr'])
 
         model_dict[key] = plot.multi_line(
             xs='xs',
@@ -866,16 +985,8 @@ def photometry_plot(obj_id, user, width=600, device="browser"):
         imhover.renderers.append(model_dict[key])
 
         key = 'obserr' + str(i)
-        y_err_x = []
-        y_err_y = []
-
-        for d, ro in df[df['obs']].iterrows():
-            px = ro['mjd']
-            py = ro['mag']
-            err = ro['magerr']
-
-            y_err_x.append((px, px))
-            y_err_y.append((py - err, py + err))
+        obs = df[df['obs']]
+        y_err_x, y_err_y = errorbar_segments(obs['mjd'], obs['mag'], obs['magerr'])
 
         model_dict[key] = plot.multi_line(
             xs='xs',
@@ -1069,8 +1180,9 @@ def photometry_plot(obj_id, user, width=600, device="browser"):
         for i, (label, df) in enumerate(split):
             renderers = []
             # fold x-axis on period in days
-            df['mjd_folda'] = (df['mjd'] % period) / period
+            df = df.assign(mjd_folda=(df['mjd'] % period) / period)
             df['mjd_foldb'] = df['mjd_folda'] + 1.0
+            obs = df[df['obs']]
 
             # phase plotting
             for ph in ['a', 'b']:
@@ -1091,17 +1203,9 @@ def photometry_plot(obj_id, user, width=600, device="browser"):
 
                 # errorbars for phases
                 key = 'fold' + ph + f'err{i}'
-                y_err_x = []
-                y_err_y = []
-
-                # get each visible error value
-                for d, ro in df[df['obs']].iterrows():
-                    px = ro['mjd_fold' + ph]
-                    py = ro['mag']
-                    err = ro['magerr']
-                    # set up error tuples
-                    y_err_x.append((px, px))
-                    y_err_y.append((py - err, py + err))
+                y_err_x, y_err_y = errorbar_segments(
+                    obs['mjd_fold' + ph], obs['mag'], obs['magerr']
+                )
                 # plot phase errors
                 period_model_dict[key] = period_plot.multi_line(
                     xs='xs',
@@ -1244,7 +1348,9 @@ def photometry_plot(obj_id, user, width=600, device="browser"):
     return bokeh_embed.json_item(tabs)
 
 
-def spectroscopy_plot(obj_id, user, spec_id=None, width=600, device="browser"):
+def spectroscopy_plot(
+    obj_id, user, spec_id=None, width=600, device="browser", max_points=None
+):
     obj = Obj.get_if_accessible_by(obj_id, user)
     spectra = (
         Spectrum.query_records_accessible_by(user)
@@ -1262,16 +1368,19 @@ def spectroscopy_plot(obj_id, user, spec_id=None, width=600, device="browser"):
     color_map = dict(zip([s.id for s in spectra], palette))
 
     data = []
+    dfs = []
     for i, s in enumerate(spectra):
+        # send at most max_points samples of each spectrum to the browser
+        wavelengths, fluxes, _ = resample_spectrum(s, max_points=max_points)
 
         # normalize spectra to a median flux of 1 for easy comparison
-        normfac = np.nanmedian(np.abs(s.fluxes))
+        normfac = np.nanmedian(np.abs(fluxes))
         normfac = normfac if normfac != 0.0 else 1e-20
 
         df = pd.DataFrame(
             {
-                'wavelength': s.wavelengths,
-                'flux': s.fluxes / normfac,
+                'wavelength': wavelengths,
+                'flux': fluxes / normfac,
                 'id': s.id,
                 'telescope': s.instrument.telescope.name,
                 'instrument': s.instrument.name,
@@ -1288,21 +1397,13 @@ def spectroscopy_plot(obj_id, user, spec_id=None, width=600, device="browser"):
             }
         )
         data.append(df)
+
+        # Smooth the spectrum by using a rolling average
+        dfs.append(pd.DataFrame({'flux': smooth(fluxes, 2)}).dropna())
     data = pd.concat(data)
 
     data.sort_values(by=['date_observed', 'wavelength'], inplace=True)
 
-    dfs = []
-    for i, s in enumerate(spectra):
-        # Smooth the spectrum by using a rolling average
-        df = (
-            pd.DataFrame({'wavelength': s.wavelengths, 'flux': s.fluxes})
-            .rolling(2)
-            .mean(numeric_only=True)
-            .dropna()
-        )
-        dfs.append(df)
-
     smoothed_data = pd.concat(dfs)
 
     split = data.groupby('id', sort=False)
@@ -460,9 +460,47 @@ class TestRouteHandler(tornado.web.RequestHandler):
                 self.write("Could not find test route redirect")
 
 
+class OpenWeatherMapStubHandler(tornado.web.RequestHandler):
+    """
+    Stands in for the OpenWeatherMap One Call API, returning fixed weather
+    for the requested site
+    """
+
+    def get(self):
+        lat = float(self.get_query_argument("lat"))
+        lon = float(self.get_query_argument("lon"))
+        now = int(datetime.datetime.utcnow().timestamp())
+        self.write(
+            {
+                "lat": lat,
+                "lon": lon,
+                "timezone": "UTC",
+                "timezone_offset": 0,
+                "current": {
+                    "dt": now,
+                    "sunrise": now - 3600 * 12,
+                    "sunset": now - 3600,
+                    "temp": 285.0,
+                    "humidity": 20,
+                    "clouds": 0,
+                    "wind_speed": 2.0,
+                    "weather": [
+                        {
+                            "id": 800,
+                            "main": "Clear",
+                            "description": "clear sky",
+                            "icon": "01n",
+                        }
+                    ],
+                },
+            }
+        )
+
+
 def make_app():
     return tornado.web.Application(
         [
+            ("/data/2.5/onecall", OpenWeatherMapStubHandler),
             (".*", TestRouteHandler),
         ]
     )
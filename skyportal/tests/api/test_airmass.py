@@ -0,0 +1,49 @@
+import numpy as np
+import numpy.testing as npt
+from astropy.time import Time
+
+from skyportal.tests import api
+
+
+def test_batch_airmass(
+    view_only_token, public_source, public_source_two_groups, keck1_telescope
+):
+    obj_ids = [public_source.id, public_source_two_groups.id]
+    status, data = api(
+        'GET',
+        'internal/plot/airmass/batch',
+        params={
+            'objIDs': ','.join(obj_ids),
+            'telescopeIDs': str(keck1_telescope.id),
+            'time': '2020-07-22 22:00:00',
+            'nPoints': 20,
+        },
+        token=view_only_token,
+    )
+    assert status == 200
+    assert data['status'] == 'success'
+    assert len(data['data']) == 1
+
+    night = data['data'][0]
+    assert night['telescope_id'] == keck1_telescope.id
+    assert len(night['time']) == 20
+    assert len(night['sun_altitude']) == 20
+    assert set(night['objs']) == set(obj_ids)
+
+    # same airmass as computed for one object at a time
+    time = Time(np.array(night['time']) / 1000, format='unix')
+    expected = public_source.airmass(keck1_telescope, time, below_horizon=np.nan)
+    airmass = np.array(
+        [np.nan if a is None else a for a in night['objs'][public_source.id]['airmass']]
+    )
+    npt.assert_allclose(airmass, expected, rtol=1e-6)
+
+
+def test_batch_airmass_invalid_obj(view_only_token, keck1_telescope):
+    status, data = api(
+        'GET',
+        'internal/plot/airmass/batch',
+        params={'objIDs': 'notanobj', 'telescopeIDs': str(keck1_telescope.id)},
+        token=view_only_token,
+    )
+    assert status == 400
@@ -2,7 +2,10 @@ import time
 import datetime
 import uuid
 import numpy.testing as npt
+from sqlalchemy import event
 
+from skyportal.handlers.api.candidate import get_candidates_nested_data
+from skyportal.models import DBSession
 from skyportal.tests import api
 
 from tdtax import taxonomy, __version__
@@ -1500,3 +1503,172 @@ def test_candidate_list_pagination(
     )
     assert status == 400
     assert "Page number out of range" in data["message"]
+
+
+def test_candidate_list_cursor_pagination(
+    view_only_token, upload_data_token, public_group, public_filter
+):
+    # Candidates that passed far in the future come first in the default
+    # (descending passed_at) order
+    obj_ids = [str(uuid.uuid4()) for _ in range(3)]
+    for i, obj_id in enumerate(obj_ids):
+        status, data = api(
+            "POST",
+            "candidates",
+            data={
+                "id": obj_id,
+                "ra": 234.22,
+                "dec": -22.33,
+                "filter_ids": [public_filter.id],
+                "passed_at": str(
+                    datetime.datetime.utcnow() + datetime.timedelta(days=1000 - i)
+                ),
+            },
+            token=upload_data_token,
+        )
+        assert status == 200
+
+    params = {"numPerPage": 1, "groupIDs": f"{public_group.id}"}
+    status, data = api(
+        "GET", "candidates", params={**params, "pageNumber": 1}, token=view_only_token
+    )
+    assert status == 200
+    total_matches = data["data"]["totalMatches"]
+
+    cursor_params = {**params, "useCursor": True}
+    for obj_id in obj_ids:
+        status, data = api(
+            "GET", "candidates", params=cursor_params, token=view_only_token
+        )
+        assert status == 200
+        assert [c["id"] for c in data["data"]["candidates"]] == [obj_id]
+        assert data["data"]["totalMatches"] == total_matches
+        assert data["data"]["nextCursor"] is not None
+        cursor_params = {**params, "cursor": data["data"]["nextCursor"]}
+
+    # the rest of the candidates, in one page
+    status, data = api(
+        "GET",
+        "candidates",
+        params={**cursor_params, "numPerPage": 500, "estimateTotalMatches": True},
+        token=view_only_token,
+    )
+    assert status == 200
+    assert len(data["data"]["candidates"]) == total_matches - 3
+    assert data["data"]["nextCursor"] is None
+    assert data["data"]["totalMatchesEstimated"]
+    assert isinstance(data["data"]["totalMatches"], int)
+
+    status, data = api(
+        "GET",
+        "candidates",
+        params={**params, "cursor": "not-a-cursor"},
+        token=view_only_token,
+    )
+    assert status == 400
+    assert "Invalid cursor" in data["message"]
+
+
+def test_candidate_list_nested_data_query_count(
+    user, public_candidate, public_candidate2, public_source
+):
+    def count_queries(objs):
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        # Start from a clean session state so that lazy loads of the user's
+        # permissions are counted identically for each page size
+        DBSession().rollback()
+        for obj in objs:
+            obj.id
+
+        engine = DBSession().get_bind()
+        event.listen(engine, "before_cursor_execute", before_cursor_execute)
+        try:
+            candidate_list = get_candidates_nested_data(
+                objs,
+                user,
+                include_photometry=True,
+                include_spectra=True,
+                include_comments=True,
+            )
+        finally:
+            event.remove(engine, "before_cursor_execute", before_cursor_execute)
+            DBSession().rollback()
+
+        assert [c["id"] for c in candidate_list] == [obj.id for obj in objs]
+        assert all(len(c["photometry"]) > 0 for c in candidate_list)
+        return len(statements)
+
+    one_candidate = count_queries([public_candidate])
+    three_candidates = count_queries(
+        [public_candidate, public_candidate2, public_source]
+    )
+    assert one_candidate == three_candidates
+
+
+def test_candidate_bulk_ingest(upload_data_token, view_only_token, public_filter):
+    obj_ids = [str(uuid.uuid4()) for _ in range(3)]
+    passed_at = str(datetime.datetime.utcnow())
+    candidates = [
+        {
+            "id": obj_id,
+            "ra": 234.22 + i,
+            "dec": -22.33,
+            "redshift": 3,
+            "transient": False,
+            "ra_dis": 2.3,
+            "filter_ids": [public_filter.id],
+            "passed_at": passed_at,
+        }
+        for i, obj_id in enumerate(obj_ids)
+    ]
+    # listed twice: only one candidate is created
+    candidates.append(dict(candidates[0]))
+    # a new Obj needs a position
+    candidates.append(
+        {
+            "id": str(uuid.uuid4()),
+            "filter_ids": [public_filter.id],
+            "passed_at": passed_at,
+        }
+    )
+
+    status, data = api(
+        "POST", "candidates/bulk_ingest", data=candidates, token=upload_data_token
+    )
+    assert status == 200
+    results = data["data"]["results"]
+    assert [r["status"] for r in results] == [
+        "success",
+        "success",
+        "success",
+        "duplicate",
+        "error",
+    ]
+    assert all(len(r["ids"]) == 1 for r in results[:3])
+    assert results[3]["duplicate_filter_ids"] == [public_filter.id]
+    assert "RA must not be null" in results[4]["message"]
+
+    for i, obj_id in enumerate(obj_ids):
+        status, data = api("GET", f"candidates/{obj_id}", token=view_only_token)
+        assert status == 200
+        assert data["data"]["id"] == obj_id
+        npt.assert_almost_equal(data["data"]["ra"], 234.22 + i)
+        assert {t["type"] for t in data["data"]["thumbnails"]} >= {"sdss", "dr8"}
+
+    # uploading again updates the Objs and skips the existing candidates
+    for candidate in candidates[:3]:
+        candidate["redshift"] = 0.1
+    status, data = api(
+        "POST", "candidates/bulk_ingest", data=candidates[:3], token=upload_data_token
+    )
+    assert status == 200
+    assert [r["status"] for r in data["data"]["results"]] == ["duplicate"] * 3
+
+    status, data = api("GET", f"candidates/{obj_ids[0]}", token=view_only_token)
+    assert status == 200
+    npt.assert_almost_equal(data["data"]["redshift"], 0.1)
+    assert [h["value"] for h in data["data"]["redshift_history"]] == [3, 0.1]
@@ -14,6 +14,9 @@ def test_db_stats(
     arrow.get(data['data']['Oldest candidate creation datetime'])
     assert isinstance(data['data']['Newest candidate creation datetime'], str)
     arrow.get(data['data']['Newest candidate creation datetime'])
+    assert {'hits', 'misses', 'hit_rate', 'evictions', 'size'} <= set(
+        data['data']['Candidate query cache']
+    )
 
 
 def test_db_stats_access_denied(
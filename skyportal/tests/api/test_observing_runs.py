@@ -180,3 +180,38 @@ def test_observing_run_assignment_group_names(
         public_group2.name
         not in data['data']["assignments"][0]["accessible_group_names"]
     )
+
+
+def test_observing_run_starlist(public_assignment, public_source, upload_data_token):
+    status, data = api(
+        "PATCH",
+        f"sources/{public_source.id}",
+        data={"ra": 234.22, "dec": 22.33},
+        token=upload_data_token,
+    )
+    assert status == 200
+
+    status, data = api(
+        'GET',
+        f'observing_run/{public_assignment.run.id}/starlist',
+        params={"facility": "P200", "num_offset_stars": "1"},
+        token=upload_data_token,
+    )
+    assert status == 200
+    assert data['status'] == 'success'
+    assert data['data']['facility'] == 'P200'
+    assert len(data['data']['targets']) == 1
+
+    target = data['data']['targets'][0]
+    assert target['obj_id'] == public_source.id
+    assert target['noffsets'] == 1
+    for star in target['starlist_info']:
+        assert star['str'] in data['data']['starlist_str']
+
+    status, data = api(
+        'GET',
+        f'observing_run/{public_assignment.run.id}/starlist',
+        params={"facility": "Nowhere"},
+        token=upload_data_token,
+    )
+    assert status == 400
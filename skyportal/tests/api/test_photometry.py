@@ -1,8 +1,11 @@
+import json
 import math
+import uuid
 
 import numpy as np
 import sncosmo
 import pytest
+import requests
 
 from baselayer.app.env import load_env
 from skyportal.models import DBSession, Token
@@ -1439,6 +1442,60 @@ def test_token_user_retrieve_null_photometry(
     assert data['data']['magerr'] is None
 
 
+def test_source_photometry_matches_single_point_serialization(
+    upload_data_token, public_source, ztf_camera, public_group
+):
+    status, data = api(
+        'POST',
+        'photometry',
+        data={
+            'obj_id': str(public_source.id),
+            'mjd': [58000.0, 58001.0, 58002.0],
+            'instrument_id': ztf_camera.id,
+            'mag': [21.2, None, 19.5],
+            'magerr': [0.1, None, 0.05],
+            'limiting_mag': [22.3, 22.0, 21.8],
+            'magsys': 'vega',
+            'filter': ['ztfg', 'ztfr', 'ztfi'],
+            'group_ids': [public_group.id],
+        },
+        token=upload_data_token,
+    )
+    assert status == 200
+    assert data['status'] == 'success'
+
+    for format in ['mag', 'flux']:
+        for magsys in ['ab', 'vega']:
+            status, data = api(
+                'GET',
+                f'sources/{public_source.id}/photometry',
+                params={'format': format, 'magsys': magsys},
+                token=upload_data_token,
+            )
+            assert status == 200
+            assert data['status'] == 'success'
+
+            for point in data['data']:
+                status, single = api(
+                    'GET',
+                    f'photometry/{point["id"]}',
+                    params={'format': format, 'magsys': magsys},
+                    token=upload_data_token,
+                )
+                assert status == 200
+                single = single['data']
+                assert set(point) == set(single)
+                for key, value in single.items():
+                    if key == 'groups':
+                        assert sorted(g['id'] for g in point[key]) == sorted(
+                            g['id'] for g in value
+                        )
+                    elif isinstance(value, float):
+                        np.testing.assert_allclose(point[key], value)
+                    else:
+                        assert point[key] == value
+
+
 @pytest.mark.skip(reason="This is consistently timing out on GA")
 def test_token_user_big_post(
     upload_data_token, public_source, ztf_camera, public_group
@@ -2607,3 +2664,129 @@ def test_photometry_stream_patch_access(
     )
     assert status == 200
     assert data['status'] == 'success'
+
+
+def test_bulk_ingest_photometry_ndjson(
+    upload_data_token, public_source, ztf_camera, public_group
+):
+    mjds = [59410 + np.random.random() for _ in range(5)]
+    body = "\n".join(
+        json.dumps(
+            {
+                'obj_id': str(public_source.id),
+                'mjd': mjd,
+                'instrument_id': ztf_camera.id,
+                'flux': 12.24,
+                'fluxerr': 0.031,
+                'zp': 25.0,
+                'magsys': 'ab',
+                'filter': 'ztfg',
+            }
+        )
+        for mjd in mjds + mjds[:1]
+    )
+
+    url = f'http://localhost:{cfg["ports.app"]}/api/photometry/bulk_ingest'
+    headers = {'Authorization': f'token {upload_data_token}'}
+    response = requests.post(
+        url,
+        data=body,
+        params={'groupIDs': str(public_group.id), 'chunkSize': 2},
+        headers=headers,
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert data['status'] == 'success'
+    # the repeated point is skipped
+    assert len(data['data']['ids']) == 5
+    # chunks of 2 points; the last chunk repeats the first point
+    assert data['data']['chunks'] == [
+        {'chunk': 0, 'inserted': 2, 'duplicates': 0},
+        {'chunk': 1, 'inserted': 2, 'duplicates': 0},
+        {'chunk': 2, 'inserted': 1, 'duplicates': 1},
+    ]
+    upload_id = data['data']['upload_id']
+    uuid.UUID(upload_id)
+
+    # re-posting the same body inserts nothing
+    response = requests.post(
+        url, data=body, params={'groupIDs': str(public_group.id)}, headers=headers
+    )
+    assert response.status_code == 200
+    assert len(response.json()['data']['ids']) == 0
+
+    status, data = api(
+        'GET', f'photometry/{data["data"]["ids"][0]}', token=upload_data_token
+    )
+    assert status == 200
+    assert data['data']['obj_id'] == public_source.id
+    assert data['data']['groups'][0]['id'] == public_group.id
+
+    status, data = api(
+        'DELETE', f'photometry/bulk_delete/{upload_id}', token=upload_data_token
+    )
+    assert status == 200
+    assert data['status'] == 'success'
+
+
+def test_bulk_ingest_photometry_csv_streams(
+    upload_data_token,
+    view_only_token_no_groups,
+    view_only_token_no_groups_no_streams,
+    public_source,
+    public_stream,
+    ztf_camera,
+):
+    mjds = [59420 + np.random.random() for _ in range(3)]
+    body = 'obj_id,mjd,instrument_id,flux,fluxerr,zp,magsys,filter\n' + '\n'.join(
+        f'{public_source.id},{mjd},{ztf_camera.id},12.24,0.031,25.0,ab,ztfg'
+        for mjd in mjds
+    )
+
+    def pieces():
+        # send the body in pieces that split lines, as a chunked upload
+        for i in range(0, len(body), 7):
+            yield body[i : i + 7].encode()
+
+    response = requests.post(
+        f'http://localhost:{cfg["ports.app"]}/api/photometry/bulk_ingest',
+        data=pieces(),
+        params={'streamIDs': str(public_stream.id), 'chunkSize': 2},
+        headers={
+            'Authorization': f'token {upload_data_token}',
+            'Content-Type': 'text/csv',
+        },
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert data['status'] == 'success'
+    assert data['data']['chunks'] == [
+        {'chunk': 0, 'inserted': 2, 'duplicates': 0},
+        {'chunk': 1, 'inserted': 1, 'duplicates': 0},
+    ]
+
+    # the points are only shared through the stream
+    photometry_id = data['data']['ids'][0]
+    status, data = api(
+        'GET', f'photometry/{photometry_id}', token=view_only_token_no_groups
+    )
+    assert status == 200
+    assert data['data']['mjd'] == pytest.approx(mjds[0])
+    status, data = api(
+        'GET', f'photometry/{photometry_id}', token=view_only_token_no_groups_no_streams
+    )
+    assert status == 400
+
+
+@pytest.mark.parametrize('params', [{'groupIDs': 'abc'}, {'streamIDs': '1,x'}])
+def test_bulk_ingest_photometry_invalid_ids(upload_data_token, public_source, params):
+    response = requests.post(
+        f'http://localhost:{cfg["ports.app"]}/api/photometry/bulk_ingest',
+        data=json.dumps({'obj_id': public_source.id}),
+        params=params,
+        headers={'Authorization': f'token {upload_data_token}'},
+    )
+    assert response.status_code == 400
+    data = response.json()
+    assert data['status'] == 'error'
+    assert 'must be integers' in data['message']
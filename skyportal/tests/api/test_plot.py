@@ -0,0 +1,61 @@
+import json
+
+from skyportal.tests import api
+
+
+def test_photometry_plot_includes_new_photometry(
+    upload_data_token, view_only_token, public_source, public_group, ztf_camera
+):
+    origin = 'plot_cache_test'
+    endpoint = f'internal/plot/photometry/{public_source.id}'
+
+    status, data = api('GET', endpoint, token=view_only_token)
+    assert status == 200
+    assert origin not in json.dumps(data['data']['bokehJSON'])
+
+    # the plot is cached, and the cached copy is served again
+    status, cached = api('GET', endpoint, token=view_only_token)
+    assert status == 200
+    assert cached['data']['bokehJSON'] == data['data']['bokehJSON']
+
+    status, data = api(
+        'POST',
+        'photometry',
+        data={
+            'obj_id': str(public_source.id),
+            'mjd': 59000.0,
+            'instrument_id': ztf_camera.id,
+            'flux': 12.24,
+            'fluxerr': 0.031,
+            'zp': 25.0,
+            'magsys': 'ab',
+            'filter': 'ztfg',
+            'origin': origin,
+            'group_ids': [public_group.id],
+        },
+        token=upload_data_token,
+    )
+    assert status == 200
+
+    # the new point invalidates the cached plot
+    status, data = api('GET', endpoint, token=view_only_token)
+    assert status == 200
+    assert origin in json.dumps(data['data']['bokehJSON'])
+
+
+def test_photometry_plot_max_points(view_only_token, public_source):
+    endpoint = f'internal/plot/photometry/{public_source.id}'
+
+    status, data = api('GET', endpoint, params={'maxPoints': 2}, token=view_only_token)
+    assert status == 200
+    assert data['status'] == 'success'
+
+    status, data = api('GET', endpoint, params={'maxPoints': 0}, token=view_only_token)
+    assert status == 400
+    assert data['message'] == 'maxPoints must be positive'
+
+    status, data = api(
+        'GET', endpoint, params={'maxPoints': 'abc'}, token=view_only_token
+    )
+    assert status == 400
+    assert data['message'] == 'maxPoints must be an integer'
@@ -64,6 +64,56 @@ def test_sharing_photometry(
     assert data["data"]["obj_id"] == public_source.id
 
 
+def test_sharing_photometry_updates_detection_filters(
+    upload_data_token_two_groups,
+    public_source_two_groups,
+    public_group,
+    public_group2,
+    view_only_token,
+    ztf_camera,
+):
+    upload_data_token = upload_data_token_two_groups
+    public_source = public_source_two_groups
+    status, data = api(
+        "POST",
+        "photometry",
+        data={
+            "obj_id": str(public_source.id),
+            "mjd": 58000.0,
+            "instrument_id": ztf_camera.id,
+            "mag": 55,
+            "magerr": 0.1,
+            "limiting_mag": 22.3,
+            "magsys": "ab",
+            "filter": "ztfg",
+            "group_ids": [public_group2.id],
+        },
+        token=upload_data_token,
+    )
+    assert status == 200
+    assert data["status"] == "success"
+    photometry_id = data["data"]["ids"][0]
+
+    params = {"minPeakMagnitude": 54, "group_ids": f"{public_group.id}"}
+    status, data = api("GET", "sources", params=params, token=view_only_token)
+    assert status == 200
+    assert public_source.id not in [s["id"] for s in data["data"]["sources"]]
+
+    status, data = api(
+        "POST",
+        "sharing",
+        data={"photometryIDs": [photometry_id], "groupIDs": [public_group.id]},
+        token=upload_data_token,
+    )
+    assert status == 200
+    assert data["status"] == "success"
+
+    # the point now counts among the detections of `public_group`
+    status, data = api("GET", "sources", params=params, token=view_only_token)
+    assert status == 200
+    assert public_source.id in [s["id"] for s in data["data"]["sources"]]
+
+
 def test_sharing_photometry_with_foreign_group(
     upload_data_token,
     public_source_two_groups,
@@ -1190,6 +1190,53 @@ def test_sources_filter_by_peak_mag(
     assert data["data"]["sources"][0]["id"] == obj_id2
 
 
+def test_sources_filter_by_peak_mag_stream_photometry(
+    upload_data_token, view_only_token, public_group, public_stream, ztf_camera
+):
+    obj_id = str(uuid.uuid4())
+    status, data = api(
+        "POST",
+        "sources",
+        data={
+            "id": obj_id,
+            "ra": 234.22,
+            "dec": -22.33,
+            "group_ids": [public_group.id],
+        },
+        token=upload_data_token,
+    )
+    assert status == 200
+
+    # the photometry is only visible to view_only_token through the stream
+    status, data = api(
+        'POST',
+        'photometry',
+        data={
+            'obj_id': obj_id,
+            'mjd': 58000.0,
+            'instrument_id': ztf_camera.id,
+            'mag': 50,
+            'magerr': 0.1,
+            'limiting_mag': 22.3,
+            'magsys': 'ab',
+            'filter': 'ztfg',
+            'stream_ids': [public_stream.id],
+        },
+        token=upload_data_token,
+    )
+    assert status == 200
+    assert data['status'] == 'success'
+
+    status, data = api(
+        "GET",
+        "sources",
+        params={"maxPeakMagnitude": 51, "group_ids": f"{public_group.id}"},
+        token=view_only_token,
+    )
+    assert status == 200
+    assert [source["id"] for source in data["data"]["sources"]] == [obj_id]
+
+
 def test_sources_filter_by_latest_mag(
     upload_data_token, view_only_token, public_group, ztf_camera
 ):
@@ -1286,6 +1333,64 @@ def test_sources_filter_by_latest_mag(
     assert data["data"]["sources"][0]["id"] == obj_id2
 
 
+def test_sources_filter_by_latest_mag_after_photometry_changes(
+    upload_data_token, view_only_token, public_group, ztf_camera
+):
+    obj_id = str(uuid.uuid4())
+    status, data = api(
+        "POST",
+        "sources",
+        data={
+            "id": obj_id,
+            "ra": 234.22,
+            "dec": -22.33,
+            "group_ids": [public_group.id],
+        },
+        token=upload_data_token,
+    )
+    assert status == 200
+
+    status, data = api(
+        'POST',
+        'photometry',
+        data={
+            'obj_id': obj_id,
+            'mjd': [59000.0, 59001.0],
+            'instrument_id': ztf_camera.id,
+            'mag': [22, 25],
+            'magerr': [0.1, 0.1],
+            'limiting_mag': [22.3, 22.3],
+            'magsys': 'ab',
+            'filter': 'ztfg',
+            'group_ids': [public_group.id],
+        },
+        token=upload_data_token,
+    )
+    assert status == 200
+    assert data['status'] == 'success'
+    latest_photometry_id = data['data']['ids'][1]
+
+    params = {"minLatestMagnitude": 24, "group_ids": f"{public_group.id}"}
+    status, data = api("GET", "sources", params=params, token=view_only_token)
+    assert status == 200
+    assert obj_id in [s["id"] for s in data["data"]["sources"]]
+
+    # Deleting the latest point makes the mag 22 point the latest detection
+    status, data = api(
+        'DELETE', f'photometry/{latest_photometry_id}', token=upload_data_token
+    )
+    assert status == 200
+
+    status, data = api("GET", "sources", params=params, token=view_only_token)
+    assert status == 200
+    assert obj_id not in [s["id"] for s in data["data"]["sources"]]
+
+    params = {"maxLatestMagnitude": 23, "group_ids": f"{public_group.id}"}
+    status, data = api("GET", "sources", params=params, token=view_only_token)
+    assert status == 200
+    assert obj_id in [s["id"] for s in data["data"]["sources"]]
+
+
 def test_sources_filter_by_has_tns_name(
     upload_data_token, view_only_token, public_group
 ):
@@ -1411,3 +1516,77 @@ def test_sources_hidden_photometry_not_leaked(
     assert data["data"]["id"] == obj_id
     assert len(public_source.photometry) - 1 == len(data["data"]["photometry"])
     assert photometry_id not in map(lambda x: x["id"], data["data"]["photometry"])
+
+
+def test_source_list_distances(upload_data_token, public_source):
+    status, data = api(
+        "PATCH",
+        f"sources/{public_source.id}",
+        data={"ra": 234.22, "dec": -22.33, "redshift": 0.5},
+        token=upload_data_token,
+    )
+    assert status == 200
+
+    status, data = api(
+        "GET", "sources", params={"sourceID": public_source.id}, token=upload_data_token
+    )
+    assert status == 200
+    source = data["data"]["sources"][0]
+    luminosity_distance = cosmo.luminosity_distance(0.5).value
+    npt.assert_allclose(source["luminosity_distance"], luminosity_distance, rtol=1e-6)
+    npt.assert_allclose(
+        source["angular_diameter_distance"], luminosity_distance / 1.5 ** 2, rtol=1e-6
+    )
+    npt.assert_allclose(
+        source["dm"], 5 * np.log10(luminosity_distance * 1e5), rtol=1e-6
+    )
+    npt.assert_almost_equal(source["gal_lat"], 26.4013, decimal=3)
+
+
+def test_sources_cursor_pagination(
+    view_only_token, public_source, public_source_two_groups
+):
+    params = {"sortBy": "ra", "sortOrder": "desc"}
+    status, data = api(
+        "GET",
+        "sources",
+        params={**params, "pageNumber": 1, "numPerPage": 100},
+        token=view_only_token,
+    )
+    assert status == 200
+    expected_ids = [s["id"] for s in data["data"]["sources"]]
+    assert len(expected_ids) >= 2
+
+    sources = []
+    cursor_params = {**params, "numPerPage": 1, "useCursor": True}
+    while True:
+        status, data = api(
+            "GET", "sources", params=cursor_params, token=view_only_token
+        )
+        assert status == 200
+        sources.extend(data["data"]["sources"])
+        if data["data"]["nextCursor"] is None:
+            break
+        cursor_params = {
+            **params,
+            "numPerPage": 1,
+            "cursor": data["data"]["nextCursor"],
+        }
+
+    # every source exactly once, in the requested order
+    ids = [s["id"] for s in sources]
+    assert len(ids) == len(set(ids))
+    assert set(ids) == set(expected_ids)
+    ras = [s["ra"] for s in sources if s["ra"] is not None]
+    assert ras == sorted(ras, reverse=True)
+
+
+def test_sources_cursor_pagination_not_with_save_summary(view_only_token):
+    status, data = api(
+        "GET",
+        "sources",
+        params={"useCursor": True, "saveSummary": True},
+        token=view_only_token,
+    )
+    assert status == 400
+    assert "saveSummary" in data["message"]
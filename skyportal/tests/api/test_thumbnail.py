@@ -1,8 +1,14 @@
+import asyncio
 import os
+import time
 import uuid
 import base64
+
+from tornado.ioloop import IOLoop
+
 from skyportal.tests import api
 from skyportal.models import DBSession, Obj, Thumbnail
+from skyportal.handlers.api import source
 
 
 def test_token_user_post_get_thumbnail(upload_data_token, public_group, ztf_camera):
@@ -262,3 +268,76 @@ def test_cannot_post_thumbnail_invalid_file_type(
     assert status == 400
     assert data['status'] == 'error'
     assert 'cannot identify image file' in data['message']
+
+
+def test_ps1_thumbnail_queued_once(monkeypatch):
+    obj_id = str(uuid.uuid4())
+    DBSession().add(Obj(id=obj_id, ra=234.22, dec=-22.33))
+    DBSession().commit()
+
+    lookups = []
+
+    def fake_add_ps1_thumbnail(obj_id):
+        # stands in for the STScI lookup
+        lookups.append(obj_id)
+        time.sleep(0.5)
+        try:
+            DBSession().add(Thumbnail(obj_id=obj_id, type='ps1'))
+            DBSession().commit()
+        finally:
+            DBSession.remove()
+
+    pushes = []
+
+    class FakeFlow:
+        def push(self, *args, **kwargs):
+            pushes.append(args)
+
+    monkeypatch.setattr(source, 'add_ps1_thumbnail', fake_add_ps1_thumbnail)
+    monkeypatch.setattr(source, 'Flow', FakeFlow)
+    queue = source.PS1ThumbnailQueue(max_workers=4)
+
+    async def main():
+        for _ in range(3):
+            queue.add(obj_id)
+        # queue the Obj again while its thumbnail is being generated
+        await asyncio.sleep(0.2)
+        assert obj_id in queue.pending
+        for _ in range(3):
+            queue.add(obj_id)
+        while queue.draining:
+            await asyncio.sleep(0.05)
+
+    IOLoop.current().run_sync(main, timeout=10)
+
+    assert lookups == [obj_id]
+    assert len(pushes) == 2
+    assert len(queue.pending) == 0
+    DBSession().expire_all()
+    thumbnails = (
+        DBSession()
+        .query(Thumbnail)
+        .filter(Thumbnail.obj_id == obj_id)
+        .filter(Thumbnail.type == 'ps1')
+        .all()
+    )
+    assert len(thumbnails) == 1
+
+    # once it has its thumbnail, the Obj is not processed again
+    async def requeue():
+        queue.add(obj_id)
+        while queue.draining:
+            await asyncio.sleep(0.05)
+
+    IOLoop.current().run_sync(requeue, timeout=10)
+    assert lookups == [obj_id]
+
+
+def test_cannot_queue_ps1_thumbnail_of_unknown_obj(view_only_token):
+    status, data = api(
+        'POST',
+        'internal/ps1_thumbnail',
+        data={'objID': str(uuid.uuid4())},
+        token=view_only_token,
+    )
+    assert status == 400
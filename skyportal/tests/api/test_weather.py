@@ -0,0 +1,32 @@
+import time
+
+import numpy.testing as npt
+
+from skyportal.tests import api
+
+
+def test_weather_refreshed_in_background(view_only_token, p60_telescope):
+    status, data = api(
+        'PATCH',
+        'internal/profile',
+        data={'preferences': {'weather': {'telescopeID': p60_telescope.id}}},
+        token=view_only_token,
+    )
+    assert status == 200
+
+    # the first request starts tracking the telescope; the weather refresher
+    # service then fetches its weather from the test server's stub
+    for _ in range(30):
+        status, data = api('GET', 'weather', token=view_only_token)
+        assert status == 200
+        assert data['data']['telescope_id'] == p60_telescope.id
+        if data['data']['weather'] is not None:
+            break
+        time.sleep(1)
+
+    weather = data['data']['weather']
+    assert weather is not None
+    assert weather['current']['weather'][0]['description'] == 'clear sky'
+    npt.assert_almost_equal(weather['lat'], p60_telescope.lat)
+    npt.assert_almost_equal(weather['lon'], p60_telescope.lon)
+    assert data['data']['weather_retrieved_at'] is not None
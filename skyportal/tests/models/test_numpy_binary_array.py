@@ -0,0 +1,28 @@
+import numpy as np
+import pytest
+
+from skyportal.models import NumpyBinaryArray
+
+
+@pytest.mark.parametrize(
+    'column_type',
+    [NumpyBinaryArray(), NumpyBinaryArray(compress=True)],
+)
+def test_numpy_binary_array_roundtrip(column_type):
+    values = np.linspace(3000.0, 10000.0, 1000)
+    stored = column_type.process_bind_param(values.tolist(), None)
+    loaded = column_type.process_result_value(memoryview(stored), None)
+    np.testing.assert_array_equal(loaded, values)
+    assert loaded.dtype == np.float64
+
+
+def test_numpy_binary_array_keeps_stored_dtype():
+    stored = NumpyBinaryArray(dtype='float32').process_bind_param([1.5, 2.5], None)
+    loaded = NumpyBinaryArray().process_result_value(stored, None)
+    assert loaded.dtype == np.float32
+    np.testing.assert_array_equal(loaded, [1.5, 2.5])
+
+
+def test_numpy_binary_array_null():
+    assert NumpyBinaryArray().process_bind_param(None, None) is None
+    assert NumpyBinaryArray().process_result_value(None, None) is None
@@ -0,0 +1,78 @@
+from skyportal.models import DBSession, Photometry, PhotometrySummary
+
+
+def get_summaries(obj_id):
+    return {
+        s.group_id: s
+        for s in PhotometrySummary.query.filter(
+            PhotometrySummary.obj_id == obj_id, PhotometrySummary.group_id.isnot(None)
+        )
+    }
+
+
+def get_stream_summaries(obj_id):
+    return {
+        s.stream_id: s
+        for s in PhotometrySummary.query.filter(
+            PhotometrySummary.obj_id == obj_id, PhotometrySummary.stream_id.isnot(None)
+        )
+    }
+
+
+def test_photometry_summary_follows_orm_changes(
+    public_source, public_group, public_group2, ztf_camera
+):
+    phot = Photometry(
+        obj_id=public_source.id,
+        instrument_id=ztf_camera.id,
+        mjd=60000.0,
+        flux=1e-10,
+        fluxerr=1e-12,
+        filter='ztfg',
+        owner_id=1,
+        groups=[public_group],
+    )
+    DBSession().add(phot)
+    DBSession().commit()
+
+    summaries = get_summaries(public_source.id)
+    assert summaries[public_group.id].last_detected_mjd == 60000.0
+    assert public_group2.id not in summaries
+
+    phot.groups.append(public_group2)
+    DBSession().commit()
+    assert get_summaries(public_source.id)[public_group2.id].last_detected_mjd == (
+        60000.0
+    )
+
+    DBSession().delete(phot)
+    DBSession().commit()
+    summaries = get_summaries(public_source.id)
+    for summary in summaries.values():
+        assert summary.last_detected_mjd != 60000.0
+
+
+def test_photometry_summary_follows_stream_changes(
+    public_source, public_stream, public_stream2, ztf_camera
+):
+    phot = Photometry(
+        obj_id=public_source.id,
+        instrument_id=ztf_camera.id,
+        mjd=60001.0,
+        flux=1e-10,
+        fluxerr=1e-12,
+        filter='ztfg',
+        owner_id=1,
+        streams=[public_stream],
+    )
+    DBSession().add(phot)
+    DBSession().commit()
+
+    summaries = get_stream_summaries(public_source.id)
+    assert summaries[public_stream.id].last_detected_mjd == 60001.0
+    assert public_stream2.id not in summaries
+
+    phot.streams.append(public_stream2)
+    DBSession().commit()
+    summaries = get_stream_summaries(public_source.id)
+    assert summaries[public_stream2.id].last_detected_mjd == 60001.0
@@ -0,0 +1,62 @@
+import pytest
+import astropy.units as u
+from astropy.time import Time
+
+from skyportal.utils.ephemeris import get_ephemeris, get_observer
+
+
+@pytest.fixture(scope="module")
+def palomar():
+    return get_observer(-116.8650, 33.3563, 1712.0)
+
+
+def astroplan_ephemeris(observer, time):
+    # the calculation Telescope.ephemeris used to make, one event at a time
+    sunrise = observer.sun_rise_time(time, which='next')
+    sunset = observer.sun_set_time(time, which='next')
+    if sunset > sunrise:
+        sunset = observer.sun_set_time(time, which='previous')
+        time = sunset - 30 * u.s
+    return {
+        'sunset': sunset,
+        'sunrise': sunrise,
+        'twilight_evening_nautical': observer.twilight_evening_nautical(
+            time, which='next'
+        ),
+        'twilight_morning_nautical': observer.twilight_morning_nautical(
+            time, which='next'
+        ),
+        'twilight_evening_astronomical': observer.twilight_evening_astronomical(
+            time, which='next'
+        ),
+        'twilight_morning_astronomical': observer.twilight_morning_astronomical(
+            time, which='next'
+        ),
+    }
+
+
+@pytest.mark.parametrize(
+    'time',
+    [
+        '2020-07-22 22:00',  # afternoon
+        '2020-07-23 05:00',  # before midnight
+        '2020-07-23 10:00',  # after midnight
+        '2020-07-23 14:00',  # after sunrise
+        '2020-12-30 19:00',
+    ],
+)
+def test_ephemeris_matches_astroplan(palomar, time):
+    time = Time(time)
+    ephemeris = get_ephemeris(palomar, time)
+    expected = astroplan_ephemeris(palomar, time)
+    for event, value in expected.items():
+        assert abs((ephemeris[event] - value).sec) < 10
+
+
+def test_observer_and_ephemeris_are_shared(palomar):
+    assert get_observer(-116.8650, 33.3563, 1712.0) is palomar
+
+    # any time during the same night gives the same (cached) ephemeris
+    evening = get_ephemeris(palomar, Time('2020-07-23 05:00'))
+    morning = get_ephemeris(palomar, Time('2020-07-23 10:00'))
+    assert evening is morning
@@ -1,18 +1,31 @@
+import asyncio
+import functools
+import re
+import time
 import uuid
+from contextlib import contextmanager
 
 import pytest
 import numpy as np
 import numpy.testing as npt
 import requests
 from requests.exceptions import HTTPError, Timeout, ConnectionError
+from astropy import units as u
+from astropy.coordinates import ICRS, SkyCoord
+from astropy.table import Table
+from astropy_healpix import HEALPix
+from tornado.ioloop import IOLoop
 
 from skyportal.tests import api
 from skyportal.utils.offset import (
+    finder_executor,
     get_nearby_offset_stars,
     get_finding_chart,
     get_ztfref_url,
+    gaia_cone_search,
     _calculate_best_position_for_offset_stars,
 )
+from skyportal.utils import offset
 from skyportal.utils.offset import irsa
 from skyportal.models import Photometry
 
@@ -26,6 +39,165 @@ def test_calculate_best_position_no_photometry():
     npt.assert_almost_equal(dec, -20)
 
 
+def test_gaia_cone_search_uses_tile_cache(tmpdir, monkeypatch):
+    # a fake Gaia catalog around (150, 20), with source IDs built from the
+    # level 12 HEALPix index of each source like Gaia's
+    rng = np.random.default_rng(0)
+    n = 2000
+    ra = 150 + rng.uniform(-0.1, 0.1, n)
+    dec = 20 + rng.uniform(-0.1, 0.1, n)
+    level12 = HEALPix(nside=2 ** 12, order='nested', frame=ICRS())
+    source_id = (
+        level12.lonlat_to_healpix(ra * u.deg, dec * u.deg).astype(np.int64) << 35
+    ) + np.arange(n)
+    catalog = Table(
+        {
+            'source_id': source_id,
+            'ra': ra * u.deg,
+            'dec': dec * u.deg,
+            'ref_epoch': np.full(n, 2016.0),
+            'phot_rp_mean_mag': rng.uniform(10, 22, n),
+            'pmra': np.zeros(n),
+            'pmdec': np.zeros(n),
+            'parallax': rng.uniform(0, 1, n),
+        }
+    )
+
+    queries = []
+
+    class FakeGaiaQuery:
+        def query(self, q, async_job=False):
+            queries.append(q)
+            mask = np.zeros(n, dtype=bool)
+            for lo, hi in re.findall(r'source_id >= (\d+) AND source_id < (\d+)', q):
+                mask |= (source_id >= int(lo)) & (source_id < int(hi))
+            return catalog[mask]
+
+    @contextmanager
+    def fake_gaia_connection():
+        yield FakeGaiaQuery()
+
+    monkeypatch.setattr(offset, 'gaia_connection', fake_gaia_connection)
+
+    dist = SkyCoord(150, 20, unit='deg').separation(SkyCoord(ra, dec, unit='deg')).deg
+    mag = catalog['phot_rp_mean_mag']
+    expected = np.sort(dist[(dist <= 2 / 60) & (mag > 11) & (mag < 20.5)])[:30]
+
+    for _ in range(2):
+        r = gaia_cone_search(
+            150, 20, 2 / 60, 11, 20.5, 30, cache_dir=str(tmpdir), cache_max_items=100
+        )
+        npt.assert_allclose(r['dist'], expected)
+
+    # all tiles were fetched in one query, and then read from the cache
+    assert len(queries) == 1
+
+
+def test_ztfcatalog_does_not_cache_failed_reference_lookup(tmpdir, monkeypatch):
+    lookups = []
+
+    def failing_get_ztfref_footprint(ra, dec, imsize):
+        lookups.append((ra, dec))
+        return '', None
+
+    monkeypatch.setattr(offset, 'get_ztfref_footprint', failing_get_ztfref_footprint)
+
+    # bypass the joblib memoization of the catalog itself
+    get_ztfcatalog = offset.get_ztfcatalog.func
+    for _ in range(2):
+        assert get_ztfcatalog(150, 20, cache_dir=str(tmpdir)) is None
+
+    # the tile was looked up again after the failure
+    assert len(lookups) == 2
+
+
+def test_ztfcatalog_caches_reference_footprints(tmpdir, monkeypatch):
+    # two reference quadrants meeting at ra = 149.985 inside the same sky tile
+    footprints = {
+        'west': [[149.5, 19.5], [149.985, 19.5], [149.985, 20.5], [149.5, 20.5]],
+        'east': [[149.985, 19.5], [150.5, 19.5], [150.5, 20.5], [149.985, 20.5]],
+    }
+    lookups = []
+
+    def fake_get_ztfref_footprint(ra, dec, imsize):
+        lookups.append((ra, dec))
+        name = 'west' if ra < 149.985 else 'east'
+        return f'{name}_refimg.fits', footprints[name]
+
+    catalogs = []
+
+    def fake_get_url(url, *args, **kwargs):
+        catalogs.append(url)
+        return None
+
+    monkeypatch.setattr(offset, 'get_ztfref_footprint', fake_get_ztfref_footprint)
+    monkeypatch.setattr(offset, 'get_url', fake_get_url)
+    assert offset.sky_tiles.lonlat_to_healpix(
+        149.98 * u.deg, 20.03 * u.deg
+    ) == offset.sky_tiles.lonlat_to_healpix(149.99 * u.deg, 20.03 * u.deg)
+
+    get_ztfcatalog = offset.get_ztfcatalog.func
+    for ra in [149.98, 149.982, 149.99, 149.988, 149.98]:
+        get_ztfcatalog(ra, 20.03, cache_dir=str(tmpdir))
+
+    # each quadrant was looked up once, and positions are matched to the
+    # quadrant containing them
+    assert lookups == [(149.98, 20.03), (149.99, 20.03)]
+    assert catalogs == [
+        'west_refpsfcat.fits',
+        'west_refpsfcat.fits',
+        'east_refpsfcat.fits',
+        'east_refpsfcat.fits',
+        'west_refpsfcat.fits',
+    ]
+
+
+def test_finding_chart_does_not_block_ioloop(monkeypatch):
+    def slow_fits_image(*args, **kwargs):
+        time.sleep(1)
+        return None
+
+    def slow_get_nearby_offset_stars(*args, **kwargs):
+        time.sleep(1)
+        return [], '', 0, 0, False
+
+    monkeypatch.setattr(offset, 'fits_image', slow_fits_image)
+    monkeypatch.setattr(offset, 'get_nearby_offset_stars', slow_get_nearby_offset_stars)
+
+    finished = []
+
+    async def finding_chart():
+        # as the finder handler runs it
+        await IOLoop.current().run_in_executor(
+            finder_executor,
+            functools.partial(
+                get_finding_chart,
+                123.0,
+                33.3,
+                'testSource',
+                image_source='dss',
+                fallback_image_source=None,
+            ),
+        )
+        finished.append('finding chart')
+
+    async def cheap_request():
+        await asyncio.sleep(0.1)
+        finished.append('cheap request')
+
+    async def main():
+        t0 = time.time()
+        await asyncio.gather(finding_chart(), cheap_request())
+        return time.time() - t0
+
+    elapsed = IOLoop.current().run_sync(main)
+
+    # the IOLoop kept serving while the chart was generated
+    assert finished == ['cheap request', 'finding chart']
+    # the image was downloaded while the offset stars were looked up
+    assert elapsed < 1.8
+
+
 @pytest.mark.flaky(reruns=2)
 def test_calculate_position_with_evil_inputs(
     upload_data_token, view_only_token, ztf_camera, public_group
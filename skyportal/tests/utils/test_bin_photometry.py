@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+
+from skyportal.plot import bin_photometry
+
+
+def make_photometry(label, mjd, flux, fluxerr):
+    return pd.DataFrame(
+        {
+            'label': label,
+            'mjd': np.asarray(mjd, dtype=float),
+            'flux': np.asarray(flux, dtype=float),
+            'fluxerr': np.asarray(fluxerr, dtype=float),
+            'stacked': False,
+        }
+    )
+
+
+def test_bin_photometry_limits_points():
+    rng = np.random.default_rng(0)
+    data = pd.concat(
+        [
+            make_photometry('a', rng.uniform(0, 100, 500), 1.0, 0.1),
+            make_photometry('a', rng.uniform(0, 100, 200), np.nan, 0.1),
+            make_photometry('b', rng.uniform(0, 100, 300), 2.0, 0.2),
+        ],
+        ignore_index=True,
+    )
+    binned = bin_photometry(data, 30)
+
+    assert list(binned.columns) == list(data.columns)
+    # 3 groups of label and detection status, 10 bins each
+    counts = binned.groupby(['label', binned['flux'].notnull()]).size()
+    assert len(counts) == 3
+    assert (counts <= 10).all()
+    assert len(binned) <= 30
+    # every input point is in one of the bins
+    np.testing.assert_allclose(
+        (binned['fluxerr'] ** -2).sum(), (data['fluxerr'] ** -2).sum()
+    )
+
+
+def test_bin_photometry_keeps_non_detections_apart():
+    data = make_photometry('a', [0.0, 0.1], [1.0, np.nan], [0.5, 0.5])
+    binned = bin_photometry(data, 1)
+
+    assert len(binned) == 2
+    assert binned['flux'].isnull().sum() == 1
+    assert not binned['stacked'].any()
+
+
+def test_bin_photometry_weighted_averages():
+    data = make_photometry('a', [0.0, 1.0, 10.0], [1.0, 3.0, 5.0], [1.0, 2.0, 1.0])
+    binned = bin_photometry(data, 2).sort_values('mjd')
+
+    # the first two points are combined with weights 1 and 1/4
+    np.testing.assert_allclose(binned['flux'], [1.75 / 1.25, 5.0])
+    np.testing.assert_allclose(binned['mjd'], [0.25 / 1.25, 10.0])
+    np.testing.assert_allclose(binned['fluxerr'], [1 / np.sqrt(1.25), 1.0])
+    assert list(binned['stacked']) == [True, False]
@@ -1,11 +1,19 @@
 import shutil
 import os
+import threading
 import time
 from os.path import join as pjoin
 
 import pytest
 
 from skyportal.utils.offset import Cache
+from skyportal.utils.cache import (
+    IDArray,
+    MemoryCache,
+    MemoryQueryResultCache,
+    QueryResultCache,
+    SQLiteQueryResultCache,
+)
 
 
 @pytest.fixture(scope="module")
@@ -93,3 +101,197 @@ def test_cache_no_max_limit(cache_parent_dir):
         cache[str(i)] = b'x'
 
     assert len(cache) == 100
+
+
+def test_cache_index_shared_between_instances(cache_parent_dir):
+    cache_path = pjoin(cache_parent_dir, 'cache_shared')
+    cache = Cache(cache_path, max_items=2)
+    cache['0'] = b'x'
+    cache['1'] = b'x'
+
+    other = Cache(cache_path, max_items=2)
+    assert other['0'] is not None
+    other['2'] = b'x'
+
+    # '1' was the least recently used entry
+    assert cache['1'] is None
+    assert cache['0'] is not None
+    assert len(cache) == 2
+
+
+def test_cache_imports_unindexed_files(cache_parent_dir):
+    cache_path = pjoin(cache_parent_dir, 'cache_unindexed')
+    os.makedirs(cache_path)
+    with open(pjoin(cache_path, 'deadbeef'), 'wb') as f:
+        f.write(b'x')
+
+    cache = Cache(cache_path, max_items=1)
+    assert len(cache) == 1
+
+    cache['some_key'] = b'abc'
+    assert len(cache) == 1
+    assert not os.path.exists(pjoin(cache_path, 'deadbeef'))
+
+
+def test_cache_lock_computes_once(cache):
+    computed = []
+
+    def get_or_compute():
+        with cache.lock('some_key'):
+            fn = cache['some_key']
+            if fn is None:
+                time.sleep(0.1)
+                computed.append(1)
+                cache['some_key'] = b'abc'
+                fn = cache['some_key']
+        with open(fn, 'rb') as f:
+            assert f.read() == b'abc'
+
+    threads = [threading.Thread(target=get_or_compute) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(computed) == 1
+    # temporary files and locks are hidden from the cache
+    assert len(cache) == 1
+    assert len([f for f in os.listdir(cache._cache_dir) if f[0] != '.']) == 1
+
+
+def test_memory_cache():
+    cache = MemoryCache(max_items=2)
+    assert cache['a'] is None
+
+    cache['a'] = 1
+    cache['b'] = 2
+    assert cache['a'] == 1
+
+    # 'b' is the least recently used item
+    cache['c'] = 3
+    assert cache['b'] is None
+    assert cache['c'] == 3
+    assert cache.stats == {'hits': 2, 'misses': 2, 'size': 2}
+
+
+def test_id_array():
+    ids = ['ZTF21aaaaaaa', 'a', '', 'é' * 3]
+    array = IDArray.from_ids(ids)
+    assert len(array) == 4
+    assert array[1] == 'a'
+    assert array[-1] == 'é' * 3
+    assert array[1:10] == ids[1:]
+    with pytest.raises(IndexError):
+        array[4]
+
+    copy = IDArray.from_bytes(array.to_bytes())
+    assert copy[:] == ids
+    assert copy.nbytes == array.nbytes
+
+
+def test_query_result_cache_is_abstract():
+    with pytest.raises(TypeError):
+        QueryResultCache(max_bytes=2 ** 20)
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def make_query_result_cache(request, tmpdir):
+    def make(max_bytes, max_age=None):
+        if request.param == 'memory':
+            return MemoryQueryResultCache(max_bytes, max_age=max_age)
+        return SQLiteQueryResultCache(
+            tmpdir / 'queries.sqlite3', max_bytes, max_age=max_age
+        )
+
+    return make
+
+
+def test_query_result_cache(make_query_result_cache):
+    cache = make_query_result_cache(max_bytes=2 ** 20)
+    assert cache.get('q1') is None
+
+    cache.set('q1', ['a', 'b', 'c'], filter_ids=[1])
+    assert cache.get('q1')[:] == ['a', 'b', 'c']
+
+    stats = cache.stats
+    assert stats['hits'] == 1
+    assert stats['misses'] == 1
+    assert stats['hit_rate'] == 0.5
+    assert stats['size'] == 1
+    assert stats['bytes'] == IDArray.from_ids(['a', 'b', 'c']).nbytes
+
+
+def test_query_result_cache_max_bytes(make_query_result_cache):
+    # room for two entries of 10 IDs
+    nbytes = IDArray.from_ids(['x'] * 10).nbytes
+    cache = make_query_result_cache(max_bytes=2 * nbytes)
+    cache.set('q1', ['x'] * 10)
+    time.sleep(0.01)
+    cache.set('q2', ['x'] * 10)
+    time.sleep(0.01)
+    assert cache.get('q1') is not None
+
+    # 'q2' is the least recently used entry
+    cache.set('q3', ['x'] * 10)
+    assert cache.get('q2') is None
+    assert cache.get('q1') is not None
+    assert cache.get('q3') is not None
+    assert cache.stats['evictions'] == 1
+
+    # too large to cache at all
+    cache.set('q4', ['x'] * 30)
+    assert cache.get('q4') is None
+    assert cache.stats['size'] == 2
+
+
+def test_query_result_cache_max_age(make_query_result_cache):
+    cache = make_query_result_cache(max_bytes=2 ** 20, max_age=1)
+    cache.set('q1', ['a'])
+    assert cache.get('q1') is not None
+    time.sleep(1.5)
+    assert cache.get('q1') is None
+
+
+def test_query_result_cache_invalidate_filters(make_query_result_cache):
+    cache = make_query_result_cache(max_bytes=2 ** 20)
+    cache.set('q1', ['a'], filter_ids=[1, 2])
+    cache.set('q2', ['b'], filter_ids=[2])
+    cache.set('q3', ['c'], filter_ids=[3])
+
+    cache.invalidate_filters([2, 4])
+    assert cache.get('q1') is None
+    assert cache.get('q2') is None
+    assert cache.get('q3') is not None
+    assert cache.stats['invalidations'] == 2
+
+
+def test_sqlite_query_result_cache_shared_between_instances(tmpdir):
+    path = tmpdir / 'queries.sqlite3'
+    cache = SQLiteQueryResultCache(path, max_bytes=2 ** 20)
+    other = SQLiteQueryResultCache(path, max_bytes=2 ** 20)
+
+    cache.set('q1', ['a', 'b'], filter_ids=[1])
+    assert other.get('q1')[:] == ['a', 'b']
+
+    other.invalidate_filters([1])
+    assert cache.get('q1') is None
+
+
+def test_memory_cache_max_bytes():
+    cache = MemoryCache(max_items=10, max_bytes=10, sizeof=len)
+    cache['a'] = b'x' * 4
+    cache['b'] = b'x' * 4
+    assert cache.nbytes == 8
+
+    # 'a' is evicted to make room
+    cache['c'] = b'x' * 4
+    assert cache['a'] is None
+    assert cache['b'] is not None
+    assert cache.nbytes == 8
+
+    # too large to cache at all
+    cache['d'] = b'x' * 11
+    assert cache['d'] is None
+
+    del cache['b']
+    assert cache.nbytes == 4
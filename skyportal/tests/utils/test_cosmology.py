@@ -1,7 +1,9 @@
+import numpy as np
+import numpy.testing as npt
 from astropy import cosmology
 from astropy import units as u
 
-from skyportal.utils.cosmology import establish_cosmology
+from skyportal.utils.cosmology import establish_cosmology, LuminosityDistanceTable
 
 fallback_cosmology = cosmology.Planck18_arXiv_v2
 
@@ -34,3 +36,15 @@ def test_bad_cosmology():
 
     cosmo = establish_cosmology(cfg=cfg, fallback_cosmology=fallback_cosmology)
     assert cosmo.name == fallback_cosmology.name
+
+
+def test_luminosity_distance_table():
+    cosmo = cosmology.WMAP9
+    table = LuminosityDistanceTable(cosmo)
+    # inside and outside of the tabulated redshifts
+    redshift = np.concatenate([np.geomspace(1e-3, 15, 1000), [1e-5, 30.0]])
+    npt.assert_allclose(
+        table.luminosity_distance(redshift),
+        cosmo.luminosity_distance(redshift).to(u.Mpc).value,
+        rtol=1e-6,
+    )
@@ -0,0 +1,56 @@
+import numpy as np
+
+from skyportal.utils.spectrum import resample, resample_spectrum, smooth
+
+
+def test_smooth_ignores_nan():
+    fluxes = np.array([1.0, 2.0, np.nan, 4.0, 5.0])
+    smoothed = smooth(fluxes, 3)
+    np.testing.assert_allclose(smoothed, [1.5, 1.5, 3.0, 4.5, 4.5])
+
+
+def test_resample_keeps_small_spectra():
+    wavelengths = np.array([5000.0, 4000.0, 6000.0])
+    fluxes = np.array([2.0, 1.0, 3.0])
+    w, f, e = resample(wavelengths, fluxes, max_points=10)
+    np.testing.assert_array_equal(w, [4000.0, 5000.0, 6000.0])
+    np.testing.assert_array_equal(f, [1.0, 2.0, 3.0])
+    assert e is None
+
+
+def test_resample_bins_and_crops():
+    wavelengths = np.linspace(3000, 9000, 6001)
+    fluxes = np.ones_like(wavelengths)
+    errors = np.full_like(wavelengths, 0.5)
+    w, f, e = resample(
+        wavelengths,
+        fluxes,
+        errors,
+        min_wavelength=4000,
+        max_wavelength=8000,
+        max_points=100,
+    )
+    assert len(w) == 100
+    assert w.min() >= 4000 and w.max() <= 8000
+    np.testing.assert_allclose(f, 1.0)
+    # 40 or 41 samples per bin
+    assert np.all(e < 0.5 / np.sqrt(39))
+
+
+class FakeSpectrum:
+    id = 1
+    modified = None
+    wavelengths = np.linspace(3000, 9000, 100)
+    fluxes = np.ones(100)
+    errors = None
+
+
+def test_resample_spectrum_returns_stored_arrays_without_resampling():
+    spectrum = FakeSpectrum()
+    for kwargs in [{}, {'max_points': 100}]:
+        w, f, e = resample_spectrum(spectrum, **kwargs)
+        assert w is spectrum.wavelengths
+        assert f is spectrum.fluxes
+
+    w, f, e = resample_spectrum(spectrum, max_points=10)
+    assert len(w) == 10
@@ -1,8 +1,14 @@
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from contextlib import contextmanager
 from pathlib import Path
+import fcntl
 import hashlib
 import os
+import sqlite3
+import tempfile
+import threading
 import time
-import io
 import numpy as np
 
 from baselayer.log import make_log
@@ -10,20 +16,29 @@ from baselayer.log import make_log
 log = make_log('cache')
 
 
-def array_to_bytes(array):
-    """Convert np.array-like object to bytes (for use w/ caching infrastructure).
+class Cache:
+    """File cache with an LRU index, safe to share between processes.
+
+    Entries are stored as files in `cache_dir`, named after a hash of the
+    entry name. The access time of every entry is tracked in a small SQLite
+    index (`.index.sqlite3` in the cache directory) so that hits, inserts
+    and evictions only touch the entries involved instead of listing the
+    whole directory.
 
-    Parameters
-    ----------
-    array : list or numpy array-like object
-        Object to be converted to bytes
+    The index also coordinates processes sharing the cache directory: a
+    file is only ever moved into place or removed while holding the
+    index's write lock, together with the corresponding index update, so
+    the index and the directory always agree. Entries are written to a
+    temporary file first and renamed into place, so readers never see a
+    partially written file.
     """
-    b = io.BytesIO()
-    np.save(b, array)
-    return b.getvalue()
 
+    INDEX_FILENAME = '.index.sqlite3'
+
+    # number of lock files used to serialize computations of entries; keys
+    # are spread over them by hash
+    N_LOCKS = 256
 
-class Cache:
     def __init__(self, cache_dir, max_items=None, max_age=None):
         """
         Parameters
@@ -47,11 +62,93 @@ class Cache:
         self._max_items = max_items
         self._max_age = max_age
 
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(
+            str(self._cache_dir / self.INDEX_FILENAME),
+            timeout=30,
+            isolation_level=None,
+            check_same_thread=False,
+        )
+        self._init_index()
+
+    @contextmanager
+    def _transaction(self):
+        """Hold the index's write lock, shared by all processes using this
+        cache directory, committing the changes made to the index on exit."""
+        with self._lock:
+            self._db.execute('BEGIN IMMEDIATE')
+            try:
+                yield self._db
+                self._db.execute('COMMIT')
+            except BaseException:
+                self._db.execute('ROLLBACK')
+                raise
+
+    def _init_index(self):
+        """Create the index if needed, importing files written before the
+        cache directory had an index."""
+        with self._lock:
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute('PRAGMA synchronous=NORMAL')
+
+        with self._transaction() as db:
+            (version,) = db.execute('PRAGMA user_version').fetchone()
+            if version == 0:
+                for statement in [
+                    'CREATE TABLE entries '
+                    '(filename TEXT PRIMARY KEY, atime REAL NOT NULL)',
+                    'CREATE INDEX entries_atime ON entries (atime)',
+                    # keep track of the number of entries so that
+                    # eviction does not need to count them
+                    'CREATE TABLE stats (n INTEGER NOT NULL)',
+                    'INSERT INTO stats VALUES (0)',
+                    'CREATE TRIGGER entries_insert AFTER INSERT ON entries '
+                    'BEGIN UPDATE stats SET n = n + 1; END',
+                    'CREATE TRIGGER entries_delete AFTER DELETE ON entries '
+                    'BEGIN UPDATE stats SET n = n - 1; END',
+                    'PRAGMA user_version = 1',
+                ]:
+                    db.execute(statement)
+                existing = [
+                    (entry.name, entry.stat().st_mtime)
+                    for entry in os.scandir(self._cache_dir)
+                    if entry.is_file() and not entry.name.startswith('.')
+                ]
+                db.executemany('INSERT OR REPLACE INTO entries VALUES (?, ?)', existing)
+
     def _hash_filename(self, filename):
         m = hashlib.md5()
         m.update(filename.encode('utf-8'))
         return self._cache_dir / f'{m.hexdigest()}'
 
+    @contextmanager
+    def lock(self, name):
+        """Hold an exclusive lock on entry `name`, across threads and
+        processes.
+
+        Wrap the lookup of an entry and the computation of its data on a
+        miss in this lock so that concurrent misses for the same entry only
+        compute it once::
+
+            with cache.lock(name):
+                fn = cache[name]
+                if fn is None:
+                    cache[name] = compute()
+                    fn = cache[name]
+
+        Parameters
+        ----------
+        name : str
+            Name of the entry to lock.
+        """
+        stripe = int(self._hash_filename(name).name[:8], 16) % self.N_LOCKS
+        with open(self._cache_dir / f'.lock-{stripe}', 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
     def __getitem__(self, name):
         """Return item from the cache.
 
@@ -59,7 +156,6 @@ class Cache:
         ----------
         name : str
         """
-        self.clean_cache()
         if name is None:
             return None
 
@@ -68,13 +164,34 @@ class Cache:
             return None
 
         cache_file = self._hash_filename(name)
-        if not cache_file.exists():
-            return None
+        now = time.time()
+
+        with self._lock:
+            row = self._db.execute(
+                'SELECT atime FROM entries WHERE filename = ?', (cache_file.name,)
+            ).fetchone()
+            if row is None:
+                return None
 
-        log(f"hit [{name}]")
-        cache_file.touch()  # Make newest in cache
+            expired = self._max_age is not None and (now - row[0]) > self._max_age
+            if not expired and cache_file.exists():
+                # Make newest in cache
+                self._db.execute(
+                    'UPDATE entries SET atime = ? WHERE filename = ?',
+                    (now, cache_file.name),
+                )
+                log(f"hit [{name}]")
+                return cache_file
 
-        return cache_file
+        with self._transaction() as db:
+            # only evict the entry if no other process has rewritten it since
+            cursor = db.execute(
+                'DELETE FROM entries WHERE filename = ? AND atime = ?',
+                (cache_file.name, row[0]),
+            )
+            if cursor.rowcount > 0:
+                self._remove([cache_file])
+        return None
 
     def __setitem__(self, name, data):
         """Insert item into cache.
@@ -91,8 +208,19 @@ class Cache:
             return
 
         fn = self._hash_filename(name)
-        with open(fn, 'wb') as f:
-            f.write(data)
+        fd, tmp_fn = tempfile.mkstemp(dir=self._cache_dir, prefix=f'.{fn.name}-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            with self._transaction() as db:
+                os.replace(tmp_fn, fn)
+                db.execute(
+                    'INSERT OR REPLACE INTO entries VALUES (?, ?)',
+                    (fn.name, time.time()),
+                )
+        except BaseException:
+            self._remove([tmp_fn])
+            raise
 
         log(f"save [{name}] to [{os.path.basename(fn)}]")
 
@@ -116,25 +244,443 @@ class Cache:
         # fmt: on
 
     def clean_cache(self):
-        # Remove stale cache files
-        cached_files = [
-            (f.stat().st_mtime, f.absolute()) for f in self._cache_dir.glob('*')
-        ]
-        cached_files = sorted(cached_files, key=lambda x: x[0], reverse=True)
+        """Evict expired entries, then the least recently used entries in
+        excess of `max_items`. Only the evicted entries are visited."""
+        with self._transaction() as db:
+            evicted = []
+            if self._max_age is not None:
+                cutoff = time.time() - self._max_age
+                evicted += db.execute(
+                    'SELECT filename FROM entries WHERE atime < ?', (cutoff,)
+                ).fetchall()
+                db.execute('DELETE FROM entries WHERE atime < ?', (cutoff,))
+
+            if self._max_items is not None:
+                (n,) = db.execute('SELECT n FROM stats').fetchone()
+                excess = n - self._max_items
+                if excess > 0:
+                    oldest = db.execute(
+                        'SELECT filename FROM entries ORDER BY atime LIMIT ?',
+                        (excess,),
+                    ).fetchall()
+                    db.executemany('DELETE FROM entries WHERE filename = ?', oldest)
+                    evicted += oldest
+
+            self._remove([self._cache_dir / filename for (filename,) in evicted])
+
+    def __len__(self):
+        with self._lock:
+            (n,) = self._db.execute('SELECT n FROM stats').fetchone()
+        return n
+
+
+class MemoryCache:
+    """In-process LRU cache of Python objects, with hit/miss counters.
+
+    Unlike `Cache`, entries are not shared between processes; use it for
+    values that are cheap to recompute but expensive enough that repeated
+    requests to the same process should not pay for them.
+    """
+
+    def __init__(self, max_items=128, max_bytes=None, sizeof=None):
+        """
+        Parameters
+        ----------
+        max_items : int, optional
+            Maximum number of items held in the cache. If zero, caching will
+            be disabled.
+        max_bytes : int, optional
+            Maximum total size of the items held in the cache, as measured
+            by `sizeof`. Items larger than this are not cached.
+        sizeof : callable, optional
+            Function returning the size of an item in bytes. Required with
+            `max_bytes`.
+        """
+        if max_bytes is not None and sizeof is None:
+            raise ValueError('MemoryCache: max_bytes requires sizeof')
+        self._max_items = max_items
+        self._max_bytes = max_bytes
+        self._sizeof = sizeof
+        self._entries = OrderedDict()
+        self._sizes = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.nbytes = 0
+
+    def __getitem__(self, key):
+        """Return item from the cache, or None if it is not cached.
+
+        Parameters
+        ----------
+        key : hashable
+        """
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key]
+
+    def __setitem__(self, key, value):
+        """Insert item into cache, evicting the least recently used item if
+        the cache is full.
+
+        Parameters
+        ----------
+        key : hashable
+        value : object
+        """
+        if self._max_items == 0:
+            return
+        size = self._sizeof(value) if self._sizeof is not None else 0
+        if self._max_bytes is not None and size > self._max_bytes:
+            return
+
+        with self._lock:
+            self._pop(key)
+            self._entries[key] = value
+            self._sizes[key] = size
+            self.nbytes += size
+            while len(self._entries) > self._max_items or (
+                self._max_bytes is not None and self.nbytes > self._max_bytes
+            ):
+                self._pop(next(iter(self._entries)))
+
+    def __delitem__(self, key):
+        with self._lock:
+            self._pop(key)
+
+    def _pop(self, key):
+        if key in self._entries:
+            del self._entries[key]
+            self.nbytes -= self._sizes.pop(key)
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def stats(self):
+        """Hit and miss counters and the current number of items."""
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self)}
+
+
+class IDArray:
+    """Immutable sequence of string IDs, packed in a single UTF-8 buffer
+    with an array of offsets.
+
+    A list of short strings costs ~60 bytes per item in Python; packed, an
+    ID costs its length plus 8 bytes, and the array converts to and from
+    bytes without pickling.
+    """
+
+    def __init__(self, data, offsets):
+        self._data = data
+        self._offsets = offsets
+
+    @classmethod
+    def from_ids(cls, ids):
+        encoded = [str(id).encode('utf-8') for id in ids]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(e) for e in encoded], out=offsets[1:])
+        return cls(b''.join(encoded), offsets)
+
+    @classmethod
+    def from_bytes(cls, b):
+        (n,) = np.frombuffer(b, dtype=np.int64, count=1)
+        offsets = np.frombuffer(b, dtype=np.int64, count=n + 1, offset=8)
+        return cls(b[8 * (n + 2) :], offsets)
+
+    def to_bytes(self):
+        return np.int64(len(self)).tobytes() + self._offsets.tobytes() + self._data
+
+    @property
+    def nbytes(self):
+        return len(self._data) + self._offsets.nbytes
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('IDArray index out of range')
+        start, end = self._offsets[index], self._offsets[index + 1]
+        return self._data[start:end].decode('utf-8')
+
+
+class QueryResultCache(ABC):
+    """Cache of the ordered IDs matched by listing queries, so that paging
+    through the results of a query does not run it again.
+
+    Entries are `IDArray`s, tagged with the IDs of the filters whose
+    candidates they list so that they can be invalidated when new
+    candidates pass those filters. Hits, misses, evictions and
+    invalidations are counted per process.
+
+    See `MemoryQueryResultCache` and `SQLiteQueryResultCache` for the
+    backends, and `make_query_result_cache` to pick one from the config.
+    """
+
+    def __init__(self, max_bytes, max_age=None):
+        """
+        Parameters
+        ----------
+        max_bytes : int
+            Maximum total size of the cached arrays. If zero, caching will
+            be disabled.
+        max_age : int, optional
+            Maximum age (in seconds) of an entry before it expires.
+        """
+        self._max_bytes = max_bytes
+        self._max_age = max_age
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @abstractmethod
+    def get(self, key):
+        """Return the `IDArray` cached under `key`, or None."""
+
+    @abstractmethod
+    def set(self, key, ids, filter_ids=()):
+        """Cache the IDs `ids` (an `IDArray` or a sequence of IDs) under
+        `key`, as the result of a query on the candidates of `filter_ids`."""
+
+    @abstractmethod
+    def invalidate_filters(self, filter_ids):
+        """Drop the entries listing candidates of any of `filter_ids`."""
+
+    def _count(self, counter, n=1):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + n)
+
+    def _expired(self, created, now):
+        return self._max_age is not None and now - created > self._max_age
+
+    @property
+    def stats(self):
+        """Counters of this process, the hit rate and the cache size."""
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups > 0 else None,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations,
+            **self._size(),
+        }
+
+    @abstractmethod
+    def _size(self):
+        """The number of entries (`size`) and their total size (`bytes`)."""
+
+
+class MemoryQueryResultCache(QueryResultCache):
+    """`QueryResultCache` held in the memory of the process, evicting the
+    least recently used entries beyond `max_bytes`."""
+
+    def __init__(self, max_bytes, max_age=None):
+        super().__init__(max_bytes, max_age=max_age)
+        # key: (creation time, filter IDs, IDArray), least recently used first
+        self._entries = OrderedDict()
+        self._nbytes = 0
+
+    def _pop(self, key):
+        _, _, ids = self._entries.pop(key)
+        self._nbytes -= ids.nbytes
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._expired(entry[0], time.time()):
+                self._pop(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def set(self, key, ids, filter_ids=()):
+        if not isinstance(ids, IDArray):
+            ids = IDArray.from_ids(ids)
+        if ids.nbytes > self._max_bytes:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self._pop(key)
+            self._entries[key] = (time.time(), frozenset(filter_ids), ids)
+            self._nbytes += ids.nbytes
+            while self._nbytes > self._max_bytes:
+                self._pop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate_filters(self, filter_ids):
+        filter_ids = set(filter_ids)
+        with self._lock:
+            invalid = [
+                key
+                for key, (_, entry_filter_ids, _) in self._entries.items()
+                if entry_filter_ids & filter_ids
+            ]
+            for key in invalid:
+                self._pop(key)
+            self.invalidations += len(invalid)
+
+    def _size(self):
+        with self._lock:
+            return {'size': len(self._entries), 'bytes': self._nbytes}
+
+
+class SQLiteQueryResultCache(QueryResultCache):
+    """`QueryResultCache` stored in a local SQLite database, shared by all
+    the processes using the same `path`, evicting the least recently used
+    entries beyond `max_bytes`.
+
+    Entries are stored as blobs, so no file is created per query.
+    """
+
+    def __init__(self, path, max_bytes, max_age=None):
+        super().__init__(max_bytes, max_age=max_age)
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(
+            str(path), timeout=30, isolation_level=None, check_same_thread=False
+        )
+        with self._lock:
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute('PRAGMA synchronous=NORMAL')
+        with self._transaction() as db:
+            for statement in [
+                'CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, '
+                'created REAL NOT NULL, atime REAL NOT NULL, '
+                'nbytes INTEGER NOT NULL, data BLOB NOT NULL)',
+                'CREATE INDEX IF NOT EXISTS entries_atime ON entries (atime)',
+                'CREATE TABLE IF NOT EXISTS entry_filters '
+                '(filter_id INTEGER NOT NULL, key TEXT NOT NULL, '
+                'PRIMARY KEY (filter_id, key))',
+                'CREATE INDEX IF NOT EXISTS entry_filters_key ON entry_filters (key)',
+            ]:
+                db.execute(statement)
+
+    @contextmanager
+    def _transaction(self):
+        """Hold the database's write lock, shared by all processes, committing
+        on exit."""
+        with self._lock:
+            self._db.execute('BEGIN IMMEDIATE')
+            try:
+                yield self._db
+                self._db.execute('COMMIT')
+            except BaseException:
+                self._db.execute('ROLLBACK')
+                raise
+
+    @staticmethod
+    def _delete(db, keys):
+        keys = [(key,) for key in keys]
+        db.executemany('DELETE FROM entries WHERE key = ?', keys)
+        db.executemany('DELETE FROM entry_filters WHERE key = ?', keys)
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                'SELECT created, data FROM entries WHERE key = ?', (key,)
+            ).fetchone()
+        if row is not None and self._expired(row[0], now):
+            with self._transaction() as db:
+                self._delete(db, [key])
+            row = None
+        if row is None:
+            self._count('misses')
+            return None
+
+        with self._lock:
+            self._db.execute('UPDATE entries SET atime = ? WHERE key = ?', (now, key))
+        self._count('hits')
+        return IDArray.from_bytes(row[1])
+
+    def set(self, key, ids, filter_ids=()):
+        if not isinstance(ids, IDArray):
+            ids = IDArray.from_ids(ids)
+        if ids.nbytes > self._max_bytes:
+            return
 
         now = time.time()
+        with self._transaction() as db:
+            self._delete(db, [key])
+            db.execute(
+                'INSERT INTO entries VALUES (?, ?, ?, ?, ?)',
+                (key, now, now, ids.nbytes, ids.to_bytes()),
+            )
+            db.executemany(
+                'INSERT INTO entry_filters VALUES (?, ?)',
+                [(int(filter_id), key) for filter_id in set(filter_ids)],
+            )
+
+            # expired entries, then the least recently used beyond the budget
+            evicted = []
+            if self._max_age is not None:
+                evicted += [
+                    k
+                    for (k,) in db.execute(
+                        'SELECT key FROM entries WHERE created < ?',
+                        (now - self._max_age,),
+                    )
+                ]
+            (total,) = db.execute('SELECT TOTAL(nbytes) FROM entries').fetchone()
+            excess = total - self._max_bytes
+            if excess > 0:
+                for k, nbytes in db.execute(
+                    'SELECT key, nbytes FROM entries ORDER BY atime'
+                ):
+                    if excess <= 0:
+                        break
+                    evicted.append(k)
+                    excess -= nbytes
+            self._delete(db, set(evicted))
+        self._count('evictions', len(set(evicted)))
 
-        if self._max_age is not None:
-            removed_by_time = [
-                filename
-                for (mtime, filename) in cached_files
-                if (now - mtime) > self._max_age
+    def invalidate_filters(self, filter_ids):
+        filter_ids = [int(filter_id) for filter_id in set(filter_ids)]
+        if len(filter_ids) == 0:
+            return
+        with self._transaction() as db:
+            keys = [
+                k
+                for (k,) in db.execute(
+                    'SELECT DISTINCT key FROM entry_filters WHERE filter_id IN '
+                    f'({", ".join("?" * len(filter_ids))})',
+                    filter_ids,
+                )
             ]
-            self._remove(removed_by_time)
+            self._delete(db, keys)
+        self._count('invalidations', len(keys))
 
-        if self._max_items is not None:
-            oldest = cached_files[self._max_items :]
-            self._remove([filename for (mtime, filename) in oldest])
+    def _size(self):
+        with self._lock:
+            n, nbytes = self._db.execute(
+                'SELECT COUNT(*), TOTAL(nbytes) FROM entries'
+            ).fetchone()
+        return {'size': n, 'bytes': int(nbytes)}
 
-    def __len__(self):
-        return len(list(self._cache_dir.glob('*')))
+
+def make_query_result_cache(backend, max_bytes, max_age=None, path=None):
+    """Create the `QueryResultCache` of the given backend: "memory" (per
+    process) or "sqlite" (shared by the processes using the database at
+    `path`)."""
+    if backend == 'memory':
+        return MemoryQueryResultCache(max_bytes, max_age=max_age)
+    if backend == 'sqlite':
+        return SQLiteQueryResultCache(path, max_bytes, max_age=max_age)
+    raise ValueError(f'Unknown query result cache backend: {backend}')
@@ -1,3 +1,6 @@
+import threading
+
+import numpy as np
 from astropy import cosmology
 from astropy import units as u
 
@@ -59,3 +62,46 @@ def establish_cosmology(cfg={}, fallback_cosmology=cosmology.Planck18_arXiv_v2):
     except Exception:
         log(f'Error setting cosmology using {fallback_cosmology.name} as a fallback')
         return fallback_cosmology
+
+
+class LuminosityDistanceTable:
+    """Luminosity distances of a cosmology, interpolated from a table.
+
+    The table is computed on first use, with `n_points` redshifts spaced
+    logarithmically between `z_min` and `z_max`, and interpolated linearly
+    in log-log space, which is accurate to better than one part in 1e6 for
+    the usual cosmologies. Redshifts outside the table are computed exactly.
+    """
+
+    def __init__(self, cosmo, z_min=1e-4, z_max=20, n_points=4000):
+        self.cosmo = cosmo
+        self.z_min = z_min
+        self.z_max = z_max
+        self.n_points = n_points
+        self._table = None
+        self._lock = threading.Lock()
+
+    def _get_table(self):
+        with self._lock:
+            if self._table is None:
+                log_z = np.linspace(
+                    np.log(self.z_min), np.log(self.z_max), self.n_points
+                )
+                log_distance = np.log(
+                    self.cosmo.luminosity_distance(np.exp(log_z)).to(u.Mpc).value
+                )
+                self._table = log_z, log_distance
+            return self._table
+
+    def luminosity_distance(self, redshift):
+        """Luminosity distance in Mpc at each of the positive redshifts in
+        the array `redshift`."""
+        redshift = np.asarray(redshift, dtype=float)
+        log_z, log_distance = self._get_table()
+        distance = np.exp(np.interp(np.log(redshift), log_z, log_distance))
+        outside = (redshift < self.z_min) | (redshift > self.z_max)
+        if outside.any():
+            distance[outside] = (
+                self.cosmo.luminosity_distance(redshift[outside]).to(u.Mpc).value
+            )
+        return distance
@@ -0,0 +1,194 @@
+import functools
+import threading
+from datetime import datetime, timedelta
+
+import astroplan
+import numpy as np
+import timezonefinder
+from astropy import time as ap_time
+from astropy import units as u
+
+from .cache import MemoryCache
+
+
+# Altitude of the center of the Sun at each event, in degrees
+SUN_HORIZONS = {
+    'sun': 0,
+    'nautical': -12,
+    'astronomical': -18,
+}
+
+# Sampling of the Sun's altitude over a night (5 minutes); events are
+# interpolated linearly between samples, as astroplan does
+N_GRID_POINTS = 289
+
+_timezone_finder = None
+_timezone_finder_lock = threading.Lock()
+
+# Ephemerides of a night, keyed by observer location and local date of the
+# evening
+night_ephemerides = MemoryCache(max_items=4096)
+
+# Time grids over a night, with their AltAz frames, keyed by observer
+# location, night and number of samples
+night_frames = MemoryCache(max_items=1024)
+
+
+def timezone_finder():
+    """Return the process-wide `timezonefinder.TimezoneFinder`, loading the
+    timezone data on first use."""
+    global _timezone_finder
+    with _timezone_finder_lock:
+        if _timezone_finder is None:
+            _timezone_finder = timezonefinder.TimezoneFinder(in_memory=True)
+        return _timezone_finder
+
+
+@functools.lru_cache(maxsize=1024)
+def get_observer(lon, lat, elevation):
+    """Return an `astroplan.Observer` at this location, in its local time
+    zone. Observers are shared by all callers in the process."""
+    local_tz = timezone_finder().closest_timezone_at(lng=lon, lat=lat, delta_degree=5)
+    return astroplan.Observer(
+        longitude=lon * u.deg,
+        latitude=lat * u.deg,
+        elevation=elevation * u.m,
+        timezone=local_tz,
+    )
+
+
+def _compute_night_ephemeris(observer, night):
+    noon = observer.timezone.localize(
+        datetime(year=night.year, month=night.month, day=night.day, hour=12)
+    )
+    start = ap_time.Time(noon)
+    times = start + np.linspace(0, 1, N_GRID_POINTS) * u.day
+    altitude = observer.sun_altaz(times).alt.deg
+
+    # all horizons at once: one row per horizon
+    horizons = np.array(list(SUN_HORIZONS.values()), dtype=float)[:, None]
+    above = altitude[None, :] >= horizons
+    crossings = {
+        'set': above[:, :-1] & ~above[:, 1:],
+        'rise': ~above[:, :-1] & above[:, 1:],
+    }
+
+    step = times[1].jd - times[0].jd
+    rows = np.arange(len(horizons))
+    events = {}
+    for direction, crossing in crossings.items():
+        # first crossing of each horizon after noon
+        index = np.argmax(crossing, axis=1)
+        alt0 = altitude[index]
+        alt1 = altitude[index + 1]
+        fraction = (alt0 - horizons[:, 0]) / (alt0 - alt1)
+        jd = times[index].jd + fraction * step
+        jd[~crossing[rows, index]] = np.nan
+        events[direction] = ap_time.Time(jd, format='jd', scale=times.scale)
+
+    ephemeris = {}
+    for i, name in enumerate(SUN_HORIZONS):
+        if name == 'sun':
+            ephemeris['sunset'] = events['set'][i].utc
+            ephemeris['sunrise'] = events['rise'][i].utc
+        else:
+            ephemeris[f'twilight_evening_{name}'] = events['set'][i].utc
+            ephemeris[f'twilight_morning_{name}'] = events['rise'][i].utc
+    return ephemeris
+
+
+def get_night_ephemeris(observer, night):
+    """Sunset, sunrise and twilights of the night starting on the evening of
+    `night` (a local date), as a dict of `astropy.time.Time`.
+
+    The six events are found together from a single sampling of the Sun's
+    altitude from local noon to local noon, and cached per location and
+    night. Events that do not happen that night (e.g. near the poles) are
+    NaN.
+    """
+    key = (observer.longitude.deg, observer.latitude.deg, observer.elevation.value)
+    key = key + (night,)
+    ephemeris = night_ephemerides[key]
+    if ephemeris is None:
+        ephemeris = _compute_night_ephemeris(observer, night)
+        night_ephemerides[key] = ephemeris
+    return ephemeris
+
+
+def get_ephemeris(observer, time):
+    """Ephemeris of the night that `time` falls in, or of the next night if
+    `time` is during the day. Nights run from sunrise to sunrise, so that
+    after sunrise the next night is returned.
+
+    Returns the same events as `get_night_ephemeris`.
+    """
+    # the night starting on the evening of this local date is the one in
+    # progress, unless the Sun has already risen
+    local_time = (time - 12 * u.hour).to_datetime(timezone=observer.timezone)
+    night = local_time.date()
+    ephemeris = get_night_ephemeris(observer, night)
+    if time >= ephemeris['sunrise']:
+        ephemeris = get_night_ephemeris(observer, night + timedelta(days=1))
+    return ephemeris
+
+
+def get_night_frame(observer, time, n_points=50):
+    """Sample the night `time` falls in (see `get_ephemeris`) from sunset to
+    sunrise, for altitude calculations.
+
+    Parameters
+    ----------
+    observer : `astroplan.Observer`
+        The site
+    time : `astropy.time.Time`
+        A time during or before the night
+    n_points : int, optional
+        Number of samples
+
+    Returns
+    -------
+    dict
+        time : `astropy.time.Time`
+            The `n_points` sample times
+        frame : `astropy.coordinates.AltAz`
+            The AltAz frame of the site at those times; transform
+            coordinates to it to get their altitude at every sample
+        sun_altitude : `numpy.ndarray`
+            Altitude of the Sun at each sample, in degrees
+    """
+    ephemeris = get_ephemeris(observer, time)
+    key = (
+        observer.longitude.deg,
+        observer.latitude.deg,
+        observer.elevation.value,
+        ephemeris['sunset'].jd,
+        n_points,
+    )
+    night_frame = night_frames[key]
+    if night_frame is None:
+        times = ap_time.Time(
+            np.linspace(ephemeris['sunset'].unix, ephemeris['sunrise'].unix, n_points),
+            format='unix',
+        )
+        night_frame = {
+            'time': times,
+            'frame': observer.altaz(times),
+            'sun_altitude': observer.sun_altaz(times).alt.deg,
+        }
+        night_frames[key] = night_frame
+    return night_frame
+
+
+def pickering_airmass(altitude, below_horizon=np.inf):
+    """Airmass at the given altitudes (in degrees), using the Pickering
+    (2002) interpolation of the Rayleigh (molecular atmosphere) airmass.
+    The interpolation tends toward 38.7494 as the altitude approaches zero;
+    altitudes below zero get `below_horizon`."""
+    altitude = np.asarray(altitude, dtype=float)
+    above = altitude > 0
+
+    sinarg = np.zeros_like(altitude)
+    airmass = np.full_like(altitude, below_horizon)
+    sinarg[above] = altitude[above] + 244 / (165 + 47 * altitude[above] ** 1.1)
+    airmass[above] = 1.0 / np.sin(np.deg2rad(sinarg[above]))
+    return airmass
@@ -1,7 +1,11 @@
 import io
+import json
 import os
 import datetime
+import queue
 import warnings
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
 from functools import wraps
 
 import pandas as pd
@@ -13,13 +17,15 @@ import seaborn as sns
 import numpy as np
 import numpy.ma as ma
 from scipy.ndimage.filters import gaussian_filter
+from scipy.spatial import Delaunay
 from joblib import Memory
 
 from astropy import units as u
-from astropy.coordinates import SkyCoord
+from astropy.coordinates import ICRS, SkyCoord
+from astropy_healpix import HEALPix
 from astroquery.gaia import Gaia
 from astropy.time import Time
-from astropy.table import Table
+from astropy.table import Table, vstack
 from astropy.utils.exceptions import AstropyWarning
 
 from astropy.wcs import WCS
@@ -39,6 +45,18 @@ log = make_log('finder-chart')
 
 _, cfg = load_env()
 
+# Finder charts and offset star lists are generated on a bounded pool, off the
+# IOLoop; the remote fetches each of them needs (survey image, ZTF reference
+# catalog) run concurrently on a separate pool. Tasks on `fetch_executor`
+# never submit further work to it, so it cannot deadlock.
+finder_executor = ThreadPoolExecutor(
+    max_workers=cfg["misc.finder_chart_max_workers"], thread_name_prefix="finder"
+)
+fetch_executor = ThreadPoolExecutor(
+    max_workers=2 * cfg["misc.finder_chart_max_workers"],
+    thread_name_prefix="finder-fetch",
+)
+
 
 class GaiaQuery:
 
@@ -92,19 +110,28 @@ class GaiaQuery:
                 self.connection = None
                 return False
 
-    def query(self, q):
+    def query(self, q, async_job=False):
+        """Run an ADQL query, with `{main_db}` standing for the Gaia
+        database name. Synchronous jobs are limited to 2000 rows; use
+        `async_job` for queries that may return more."""
         if not self.db_connected or self.connection is None:
             raise HTTPError("GaiaQuery not connected properly.")
 
         # replace the main db name
         q = q.format(main_db=self.main_db)
         if not self.is_backup:
-            job = self.connection.launch_job(q)
+            if async_job:
+                job = self.connection.launch_job_async(q)
+            else:
+                job = self.connection.launch_job(q)
             rez = job.get_results()
             return rez
         else:
             # native return type is pyvo.dal.tap.TAPResults
-            job = self.connection.search(q)
+            if async_job:
+                job = self.connection.run_async(q)
+            else:
+                job = self.connection.search(q)
             return self._standardize_table(job.to_table())
 
     def _standardize_table(self, tab):
@@ -195,6 +222,31 @@ starlist_formats = {
     },
 }
 
+# Idle Gaia connections, so that each query does not pay for a new
+# connection and its connectivity probe
+gaia_connections = queue.LifoQueue(maxsize=cfg["misc.finder_chart_max_workers"])
+
+
+@contextmanager
+def gaia_connection():
+    """Borrow a connected `GaiaQuery` from the pool, creating one if none is
+    idle. Connections that fail a query are discarded instead of being
+    returned to the pool."""
+    try:
+        g = gaia_connections.get_nowait()
+    except queue.Empty:
+        g = GaiaQuery()
+
+    yield g
+
+    # only reached if the block did not raise
+    if g.db_connected:
+        try:
+            gaia_connections.put_nowait(g)
+        except queue.Full:
+            pass
+
+
 JOBLIB_CACHE_SIZE = 100e6  # 100 MB
 offsets_memory = Memory("./cache/offsets/", verbose=0, bytes_limit=JOBLIB_CACHE_SIZE)
 
@@ -214,33 +266,25 @@ def get_url(*args, **kwargs):
         return None
 
 
-@memcache
-def get_ztfref_url(ra, dec, imsize, *args, **kwargs):
-    """
-    From:
-    https://gist.github.com/dmitryduev/634bd2b21a77e2b1de89e0bfd39d14b9
-
-    Returns the URL that points to the ZTF reference image for the
-    requested position
+def get_ztfref_footprint(ra, dec, imsize):
+    """Look up the ZTF reference image covering a position.
 
     Parameters
     ----------
-    source_ra : float
+    ra : float
         Right ascension (J2000) of the source
-    source_dec : float
+    dec : float
         Declination (J2000) of the source
     imsize : float
         Requested image size (on a size) in arcmin
-    *args : optional
-        Extra args (not needed here)
-    **kwargs : optional
-        Extra kwargs (not needed here)
 
     Returns
     -------
     str
-        the URL to download the ZTF image
-
+        the URL to download the ZTF image, or an empty string if there is no
+        reference image at this position or the lookup failed
+    list or None
+        the (ra, dec) of the corners of the reference image, if known
     """
     imsize_deg = imsize / 60
 
@@ -249,7 +293,7 @@ def get_ztfref_url(ra, dec, imsize, *args, **kwargs):
     )
     r = get_url(url_ref_meta)
     if r is None:
-        return ''
+        return '', None
     s = r.content
     c = pd.read_csv(io.StringIO(s.decode('utf-8')))
 
@@ -260,7 +304,14 @@ def get_ztfref_url(ra, dec, imsize, *args, **kwargs):
         ccd = f"{c.loc[0, 'ccdid']:02d}"
     except KeyError:
         log(f"Note: ZTF does not have a reference image at the position {ra} {dec}")
-        return ''
+        return '', None
+
+    try:
+        corners = [
+            [float(c.loc[0, f'ra{i}']), float(c.loc[0, f'dec{i}'])] for i in range(1, 5)
+        ]
+    except KeyError:
+        corners = None
 
     path_ursa_ref = os.path.join(
         irsa['url_data'],
@@ -272,7 +323,49 @@ def get_ztfref_url(ra, dec, imsize, *args, **kwargs):
         f'q{quad}',
         f'ztf_{field}_{filt}_c{ccd}_q{quad}_refimg.fits',
     )
-    return path_ursa_ref
+    return path_ursa_ref, corners
+
+
+@memcache
+def get_ztfref_url(ra, dec, imsize, *args, **kwargs):
+    """
+    From:
+    https://gist.github.com/dmitryduev/634bd2b21a77e2b1de89e0bfd39d14b9
+
+    Returns the URL that points to the ZTF reference image for the
+    requested position
+
+    Parameters
+    ----------
+    source_ra : float
+        Right ascension (J2000) of the source
+    source_dec : float
+        Declination (J2000) of the source
+    imsize : float
+        Requested image size (on a size) in arcmin
+    *args : optional
+        Extra args (not needed here)
+    **kwargs : optional
+        Extra kwargs (not needed here)
+
+    Returns
+    -------
+    str
+        the URL to download the ZTF image
+
+    """
+    return get_ztfref_footprint(ra, dec, imsize)[0]
+
+
+def footprint_contains(corners, ra, dec):
+    """Whether a position is inside the quadrilateral with the given (ra, dec)
+    corners, in degrees."""
+    ra_corners, dec_corners = np.transpose(corners)
+    offsets = SkyCoord(ra_corners * u.deg, dec_corners * u.deg).transform_to(
+        SkyCoord(ra * u.deg, dec * u.deg).skyoffset_frame()
+    )
+    hull = Delaunay(np.column_stack([offsets.lon.deg, offsets.lat.deg]))
+    return bool(hull.find_simplex([0.0, 0.0]) >= 0)
 
 
 # helper dict for seaching for FITS images from various surveys
@@ -306,6 +399,26 @@ source_image_parameters = {
 }
 
 
+# Catalog data is cached locally by HEALPix tile (nested scheme), so that
+# looking for offset stars around sources seen before needs no network
+# access. Gaia source IDs embed the level 12 nested HEALPix index of the
+# source in their upper bits, so the sources of a tile are a contiguous range
+# of IDs.
+TILE_ORDER = 10  # tiles of about 3.4 arcmin
+sky_tiles = HEALPix(nside=2 ** TILE_ORDER, order='nested', frame=ICRS())
+GAIA_TILE_SHIFT = 35 + 2 * (12 - TILE_ORDER)
+GAIA_TILE_COLUMNS = [
+    'source_id',
+    'ra',
+    'dec',
+    'ref_epoch',
+    'phot_rp_mean_mag',
+    'pmra',
+    'pmdec',
+    'parallax',
+]
+
+
 @memcache
 def get_ztfcatalog(ra, dec, cache_dir="./cache/finder_cat/", cache_max_items=1000):
     """Finds the ZTF public catalog data around this position
@@ -323,26 +436,58 @@ def get_ztfcatalog(ra, dec, cache_dir="./cache/finder_cat/", cache_max_items=100
     """
     cache = Cache(cache_dir=cache_dir, max_items=cache_max_items)
 
-    refurl = get_ztfref_url(ra, dec, imsize=5)
+    # look up which reference image covers this position, remembering the
+    # footprints of the reference images found in each sky tile so that
+    # other positions inside them need no lookup. A tile can overlap several
+    # reference images, so positions outside the known footprints are
+    # looked up again.
+    tile = sky_tiles.lonlat_to_healpix(ra * u.deg, dec * u.deg)
+    tile_name = f'ztfref-footprints-{TILE_ORDER}-{tile}'
+    with cache.lock(tile_name):
+        footprints_fn = cache[tile_name]
+        footprints = []
+        if footprints_fn is not None:
+            with open(footprints_fn) as f:
+                footprints = json.load(f)
+        refurl = next(
+            (
+                footprint['url']
+                for footprint in footprints
+                if footprint_contains(footprint['corners'], ra, dec)
+            ),
+            None,
+        )
+        if refurl is None:
+            refurl, corners = get_ztfref_footprint(ra, dec, imsize=5)
+            # an empty URL is a failed lookup, or a position without a
+            # reference image: don't cache it
+            if refurl and corners is not None:
+                footprints.append({'url': refurl, 'corners': corners})
+                cache[tile_name] = json.dumps(footprints).encode()
+    if not refurl:
+        return None
     # the catalog data is in the same directory as the reference images
     caturl = refurl.replace("_refimg.fits", "_refpsfcat.fits")
     catname = os.path.basename(caturl)
-    hdu_fn = cache[catname]
 
-    if hdu_fn is not None:
-        with fits.open(hdu_fn) as hdu:
-            data = hdu[1].data
-    else:
-        response = get_url(caturl, stream=True, allow_redirects=True)
-        if response is None or response.status_code != 200:
-            return None
-        else:
-            with fits.open(io.BytesIO(response.content)) as hdu:
-                buf = io.BytesIO()
-                hdu.writeto(buf)
-                buf.seek(0)
-                cache[catname] = buf.read()
+    # concurrent requests for the same catalog wait for a single download
+    with cache.lock(catname):
+        hdu_fn = cache[catname]
+
+        if hdu_fn is not None:
+            with fits.open(hdu_fn) as hdu:
                 data = hdu[1].data
+        else:
+            response = get_url(caturl, stream=True, allow_redirects=True)
+            if response is None or response.status_code != 200:
+                return None
+            else:
+                with fits.open(io.BytesIO(response.content)) as hdu:
+                    buf = io.BytesIO()
+                    hdu.writeto(buf)
+                    buf.seek(0)
+                    cache[catname] = buf.read()
+                    data = hdu[1].data
 
     ztftable = Table(data)
     ztftable["ra"].unit = u.deg
@@ -354,6 +499,161 @@ def get_ztfcatalog(ra, dec, cache_dir="./cache/finder_cat/", cache_max_items=100
         return None
 
 
+def _fetch_gaia_tiles(tiles, cache):
+    """Query Gaia for all the sources in `tiles`, in a single query, and
+    store each tile in `cache`. Returns the tiles as tables, by tile."""
+    id_ranges = " OR ".join(
+        f"(source_id >= {int(tile) << GAIA_TILE_SHIFT}"
+        f" AND source_id < {(int(tile) + 1) << GAIA_TILE_SHIFT})"
+        for tile in tiles
+    )
+    query_string = f"""
+                  SELECT {', '.join(GAIA_TILE_COLUMNS)}
+                  FROM {{main_db}}.gaia_source
+                  WHERE ({id_ranges})
+                  AND phot_rp_mean_mag IS NOT NULL
+                """
+    with gaia_connection() as g:
+        r = g.query(query_string, async_job=True)
+    r = r[GAIA_TILE_COLUMNS]
+    source_tiles = np.asarray(r['source_id'], dtype=np.int64) >> GAIA_TILE_SHIFT
+
+    tables = {}
+    for tile in tiles:
+        buf = io.BytesIO()
+        r[source_tiles == tile].write(buf, format='fits')
+        cache[f'gaia-{TILE_ORDER}-{tile}'] = buf.getvalue()
+        buf.seek(0)
+        # read back, so cached and freshly fetched tiles look the same
+        tables[tile] = Table.read(buf, format='fits')
+    return tables
+
+
+def gaia_cone_search(
+    ra,
+    dec,
+    radius_degrees,
+    mag_min,
+    mag_max,
+    max_rows,
+    cache_dir="./cache/gaia_tiles/",
+    cache_max_items=20000,
+):
+    """Finds the Gaia sources around this position, answering from the
+    local tile cache and only querying Gaia for tiles not seen before
+
+    Parameters
+    ----------
+    ra : float
+        Right ascension (J2000) of the center
+    dec : float
+        Declination (J2000) of the center
+    radius_degrees : float
+        Search radius in degrees
+    mag_min, mag_max : float
+        Range of RP magnitudes (exclusive) to return
+    max_rows : int
+        Maximum number of sources to return; the closest are kept
+    cache_dir : str, optional
+        Directory to cache the tiles
+    cache_max_items : int, optional
+        How many tiles to keep in the cache
+
+    Returns
+    -------
+    `astropy.table.Table`
+        The sources, sorted by distance to the center (in degrees, column
+        `dist`), with the columns of `GAIA_TILE_COLUMNS`.
+    """
+    cache = Cache(cache_dir=cache_dir, max_items=cache_max_items)
+
+    tiles = sky_tiles.cone_search_lonlat(
+        ra * u.deg, dec * u.deg, radius=radius_degrees * u.deg
+    )
+    tables = {}
+    missing = []
+    for tile in tiles:
+        tile_fn = cache[f'gaia-{TILE_ORDER}-{tile}']
+        if tile_fn is None:
+            missing.append(tile)
+        else:
+            tables[tile] = Table.read(tile_fn, format='fits')
+    if len(missing) > 0:
+        tables.update(_fetch_gaia_tiles(missing, cache))
+
+    r = vstack([tables[tile] for tile in tiles])
+    dist = (
+        SkyCoord(ra, dec, unit=(u.degree, u.degree))
+        .separation(
+            SkyCoord(
+                np.asarray(r['ra']), np.asarray(r['dec']), unit=(u.degree, u.degree)
+            )
+        )
+        .deg
+    )
+    mag = np.ma.filled(r['phot_rp_mean_mag'], np.nan)
+    parallax = np.ma.filled(r['parallax'], np.nan)
+    with np.errstate(invalid='ignore'):
+        keep = (
+            (dist <= radius_degrees)
+            & (mag < mag_max)
+            & (mag > mag_min)
+            & (parallax < 250)
+        )
+    r = r[keep]
+    r['dist'] = dist[keep]
+    r.sort('dist')
+    return r[:max_rows]
+
+
+def prefetch_gaia_tiles(
+    positions,
+    radius_degrees,
+    tiles_per_query=256,
+    cache_dir="./cache/gaia_tiles/",
+    cache_max_items=20000,
+):
+    """Fetches the Gaia tiles needed for cone searches around many
+    positions, so that nearby positions share queries
+
+    The tiles missing from the cache are sorted, which keeps neighbouring
+    tiles together in the nested scheme, and fetched in groups of
+    `tiles_per_query`, concurrently.
+
+    Parameters
+    ----------
+    positions : list of (float, float)
+        Right ascension and declination (J2000) of each cone center
+    radius_degrees : float
+        Largest search radius that will be used, in degrees
+    tiles_per_query : int, optional
+        Maximum number of tiles to fetch in a single Gaia query
+    cache_dir : str, optional
+        Directory to cache the tiles
+    cache_max_items : int, optional
+        How many tiles to keep in the cache
+    """
+    cache = Cache(cache_dir=cache_dir, max_items=cache_max_items)
+
+    tiles = set()
+    for ra, dec in positions:
+        tiles.update(
+            int(tile)
+            for tile in sky_tiles.cone_search_lonlat(
+                ra * u.deg, dec * u.deg, radius=radius_degrees * u.deg
+            )
+        )
+    missing = sorted(
+        tile for tile in tiles if cache[f'gaia-{TILE_ORDER}-{tile}'] is None
+    )
+    groups = [
+        missing[i : i + tiles_per_query]
+        for i in range(0, len(missing), tiles_per_query)
+    ]
+    for _ in fetch_executor.map(lambda group: _fetch_gaia_tiles(group, cache), groups):
+        pass
+
+
 @warningfilter(action="ignore", category=RuntimeWarning)
 def _calculate_best_position_for_offset_stars(
     photometry, fallback=(None, None), how="snr2", max_offset=0.5, sigma_clip=4.0
@@ -675,8 +975,20 @@ def get_nearby_offset_stars(
                   AND parallax < 250
                 """
 
-    g = GaiaQuery()
-    r = g.query(query_string)
+    if use_ztfref:
+        # fetch the ZTF reference catalog while Gaia is being queried
+        ztfcatalog_future = fetch_executor.submit(get_ztfcatalog, source_ra, source_dec)
+
+    # answered from the local tile cache; the query string is returned for
+    # reference
+    r = gaia_cone_search(
+        source_ra,
+        source_dec,
+        radius_degrees,
+        mag_min,
+        mag_limit + fainter_diff,
+        how_many * search_multipler,
+    )
     # get brighter stars at top:
     r.sort("phot_rp_mean_mag")
     queries_issued += 1
@@ -684,7 +996,7 @@ def get_nearby_offset_stars(
     catalog = SkyCoord.guess_from_table(r)
 
     if use_ztfref:
-        ztfcatalog = get_ztfcatalog(source_ra, source_dec)
+        ztfcatalog = ztfcatalog_future.result()
         if ztfcatalog is None:
             log(
                 'Warning: Could not find the ZTF reference catalog'
@@ -867,6 +1179,85 @@ def get_nearby_offset_stars(
     )
 
 
+def get_offset_starlists(
+    targets, starlist_type='Keck', progress=None, **offset_star_kwargs
+):
+    """Finds offset stars for many sources at once, e.g. all the targets of
+       an observing run, and combines their starlists
+
+    The Gaia tiles around all the targets are fetched up front (see
+    `prefetch_gaia_tiles`), then the targets are processed in parallel.
+
+    Parameters
+    ----------
+    targets : list of (str, float, float)
+        Name, right ascension and declination (J2000) of each source
+    starlist_type : str, optional
+        What starlist format should we use?
+    progress : callable, optional
+        Called with the number of targets done and the total number of
+        targets each time a target is done
+    **offset_star_kwargs : dict, optional
+        Other parameters passed to `get_nearby_offset_stars`
+
+    Returns
+    -------
+    (str, list)
+        The combined starlist, and for each target a dictionary with its
+        `name`, its `starlist_info` and `noffsets` as returned by
+        `get_nearby_offset_stars`, or an `error` if its offset stars could
+        not be found.
+    """
+    radius_degrees = offset_star_kwargs.get("radius_degrees", 2 / 60.0)
+    allowed_queries = offset_star_kwargs.get("allowed_queries", 2)
+    # each additional query widens the search radius by 30%
+    prefetch_gaia_tiles(
+        [(ra, dec) for _, ra, dec in targets],
+        radius_degrees * 1.3 ** (allowed_queries - 1),
+    )
+
+    first_line = starlist_formats.get(starlist_type, starlist_formats["Keck"])[
+        "first_line"
+    ]
+    results = [None] * len(targets)
+    with ThreadPoolExecutor(
+        max_workers=cfg["misc.finder_chart_max_workers"],
+        thread_name_prefix="starlist",
+    ) as executor:
+        futures = {
+            executor.submit(
+                get_nearby_offset_stars,
+                ra,
+                dec,
+                name,
+                starlist_type=starlist_type,
+                **offset_star_kwargs,
+            ): i
+            for i, (name, ra, dec) in enumerate(targets)
+        }
+        for n_done, future in enumerate(as_completed(futures), start=1):
+            i = futures[future]
+            name = targets[i][0]
+            try:
+                star_list, _, _, noffsets, _ = future.result()
+            except Exception as e:
+                log(f"Could not find offset stars for {name}: {e}")
+                results[i] = {"name": name, "error": str(e)}
+            else:
+                results[i] = {
+                    "name": name,
+                    "starlist_info": [x for x in star_list if x["str"] != first_line],
+                    "noffsets": noffsets,
+                }
+            if progress is not None:
+                progress(n_done, len(targets))
+
+    lines = [first_line] if first_line else []
+    for result in results:
+        lines.extend(x["str"] for x in result.get("starlist_info", []))
+    return "\n".join(lines), results
+
+
 def fits_image(
     center_ra,
     center_dec,
@@ -923,6 +1314,12 @@ def fits_image(
     def get_hdu(url):
         """Try to get HDU from cache, otherwise fetch."""
         hash_name = f'{center_ra}{center_dec}{imsize}{image_source}'
+
+        # concurrent requests for the same image wait for a single download
+        with cache.lock(hash_name):
+            return fetch_hdu(url, hash_name)
+
+    def fetch_hdu(url, hash_name):
         hdu_fn = cache[hash_name]
 
         # Found entry in cache, return that
@@ -962,6 +1359,7 @@ def get_finding_chart(
     fallback_image_source='dss',
     zscale_contrast=0.045,
     zscale_krej=2.5,
+    offset_stars=None,
     **offset_star_kwargs,
 ):
 
@@ -994,6 +1392,9 @@ def get_finding_chart(
         Contrast parameter for the ZScale interval
     zscale_krej : float, optional
         Krej parameter for the Zscale interval
+    offset_stars : tuple, optional
+        Result of `get_nearby_offset_stars` for this source, if already
+        computed
     **offset_star_kwargs : dict, optional
         Other parameters passed to `get_nearby_offset_stars`
 
@@ -1044,7 +1445,15 @@ def get_finding_chart(
     # set the pixelscale in arcsec (typically about 1 arcsec/pixel)
     pixscale = 60 * imsize / npixels
 
-    hdu = fits_image(source_ra, source_dec, imsize=imsize, image_source=image_source)
+    # download the image while the offset stars are being looked up
+    hdu_future = fetch_executor.submit(
+        fits_image, source_ra, source_dec, imsize=imsize, image_source=image_source
+    )
+    if offset_stars is None:
+        offset_stars = get_nearby_offset_stars(
+            source_ra, source_dec, source_name, **offset_star_kwargs
+        )
+    hdu = hdu_future.result()
 
     # skeleton WCS - this is the field that the user requested
     wcs = WCS(naxis=2)
@@ -1119,6 +1528,7 @@ def get_finding_chart(
                     tick_offset=tick_offset,
                     tick_length=tick_length,
                     fallback_image_source=None,
+                    offset_stars=offset_stars,
                     **offset_star_kwargs,
                 )
 
@@ -1147,9 +1557,7 @@ def get_finding_chart(
         f'{source_name} Finder ({obstime})', fontsize='large', fontweight='bold'
     )
 
-    star_list, _, _, _, used_ztfref = get_nearby_offset_stars(
-        source_ra, source_dec, source_name, **offset_star_kwargs
-    )
+    star_list, _, _, _, used_ztfref = offset_stars
 
     if not isinstance(star_list, list) or len(star_list) == 0:
         return {
@@ -0,0 +1,178 @@
+import numpy as np
+
+from .cache import MemoryCache
+
+
+# Resampled spectra, keyed by spectrum ID, modification time and resampling
+# parameters
+resampled_spectra = MemoryCache(
+    max_items=1024,
+    max_bytes=128 * 2 ** 20,
+    sizeof=lambda arrays: sum(a.nbytes for a in arrays if a is not None),
+)
+
+
+def smooth(fluxes, width):
+    """Smooth fluxes with a boxcar of `width` samples, ignoring non-finite
+    values.
+
+    Parameters
+    ----------
+    fluxes : array-like
+        Fluxes to smooth, sorted by wavelength.
+    width : int
+        Width of the boxcar, in samples.
+
+    Returns
+    -------
+    `numpy.ndarray`
+        The smoothed fluxes, with the same length as `fluxes`. Samples with
+        no finite value within the boxcar are NaN.
+    """
+    fluxes = np.asarray(fluxes, dtype=float)
+    kernel = np.ones(width)
+    finite = np.isfinite(fluxes)
+    total = np.convolve(np.where(finite, fluxes, 0.0), kernel, mode='same')
+    count = np.convolve(finite.astype(float), kernel, mode='same')
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return total / count
+
+
+def resample(
+    wavelengths,
+    fluxes,
+    errors=None,
+    min_wavelength=None,
+    max_wavelength=None,
+    max_points=None,
+):
+    """Restrict a spectrum to a wavelength range and average it onto a
+    regular grid of at most `max_points` wavelength bins.
+
+    Spectra with no more than `max_points` samples in the range are
+    returned at their native sampling. Otherwise the range is divided in
+    `max_points` bins of equal width, and each bin is replaced by the mean
+    wavelength and flux of the finite samples it contains; errors are
+    propagated as the error of the mean. Bins without finite samples are
+    dropped.
+
+    Parameters
+    ----------
+    wavelengths, fluxes : array-like
+        The spectrum.
+    errors : array-like, optional
+        Errors on the fluxes.
+    min_wavelength, max_wavelength : float, optional
+        Wavelength range to keep. Defaults to the full spectrum.
+    max_points : int, optional
+        Maximum number of samples to return.
+
+    Returns
+    -------
+    wavelengths, fluxes, errors : `numpy.ndarray`
+        The resampled spectrum; `errors` is None if no errors were given.
+    """
+    wavelengths = np.asarray(wavelengths, dtype=float)
+    fluxes = np.asarray(fluxes, dtype=float)
+    if errors is not None:
+        errors = np.asarray(errors, dtype=float)
+
+    if len(wavelengths) == 0:
+        return wavelengths, fluxes, errors
+
+    order = np.argsort(wavelengths, kind='stable')
+    lo = wavelengths[order[0]] if min_wavelength is None else min_wavelength
+    hi = wavelengths[order[-1]] if max_wavelength is None else max_wavelength
+    order = order[(wavelengths[order] >= lo) & (wavelengths[order] <= hi)]
+
+    wavelengths = wavelengths[order]
+    fluxes = fluxes[order]
+    if errors is not None:
+        errors = errors[order]
+
+    if max_points is None or len(wavelengths) <= max_points:
+        return wavelengths, fluxes, errors
+
+    edges = np.linspace(lo, hi, max_points + 1)
+    bins = np.clip(np.searchsorted(edges, wavelengths, side='right') - 1, 0, None)
+    bins = np.minimum(bins, max_points - 1)
+
+    finite = np.isfinite(fluxes)
+    bins = bins[finite]
+    count = np.bincount(bins, minlength=max_points)
+    keep = count > 0
+    count = count[keep]
+
+    def mean(values):
+        return np.bincount(bins, weights=values, minlength=max_points)[keep] / count
+
+    binned_errors = None
+    if errors is not None:
+        binned_errors = np.sqrt(mean(errors[finite] ** 2) / count)
+
+    return mean(wavelengths[finite]), mean(fluxes[finite]), binned_errors
+
+
+def resample_spectrum(
+    spectrum,
+    smoothing=None,
+    min_wavelength=None,
+    max_wavelength=None,
+    max_points=None,
+):
+    """Smooth (see `smooth`) and resample (see `resample`) a Spectrum.
+
+    Results are cached in memory until the spectrum is modified. When no
+    smoothing, range or resampling is needed and the spectrum is sorted by
+    wavelength, the stored arrays of the spectrum are returned as they are.
+
+    Parameters
+    ----------
+    spectrum : `skyportal.models.Spectrum`
+        The spectrum to resample.
+    smoothing : int, optional
+        Width of the boxcar to smooth the fluxes with, in samples, before
+        resampling.
+    min_wavelength, max_wavelength, max_points
+        See `resample`.
+
+    Returns
+    -------
+    wavelengths, fluxes, errors : `numpy.ndarray`
+        The resampled spectrum; `errors` is None if the spectrum has no
+        errors.
+    """
+    if (
+        (smoothing is None or smoothing <= 1)
+        and min_wavelength is None
+        and max_wavelength is None
+        and (max_points is None or len(spectrum.wavelengths) <= max_points)
+        and np.all(np.diff(spectrum.wavelengths) >= 0)
+    ):
+        return spectrum.wavelengths, spectrum.fluxes, spectrum.errors
+
+    key = (
+        spectrum.id,
+        spectrum.modified,
+        smoothing,
+        min_wavelength,
+        max_wavelength,
+        max_points,
+    )
+    result = resampled_spectra[key]
+    if result is None:
+        fluxes = spectrum.fluxes
+        if smoothing is not None and smoothing > 1:
+            order = np.argsort(spectrum.wavelengths, kind='stable')
+            fluxes = np.empty(len(order))
+            fluxes[order] = smooth(spectrum.fluxes[order], smoothing)
+        result = resample(
+            spectrum.wavelengths,
+            fluxes,
+            spectrum.errors,
+            min_wavelength=min_wavelength,
+            max_wavelength=max_wavelength,
+            max_points=max_points,
+        )
+        resampled_spectra[key] = result
+    return result
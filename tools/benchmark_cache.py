@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+"""Compare the indexed `skyportal.utils.cache.Cache` against the previous
+implementation, which listed and sorted the whole cache directory on every
+access.
+
+Usage: python tools/benchmark_cache.py [--sizes 1000 100000] [--ops 200]
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+from skyportal.utils.cache import Cache
+
+
+class DirectoryScanCache(Cache):
+    """The cache as it was before it had an index: `clean_cache` stats and
+    sorts every file in the cache directory, and is called on every get and
+    set."""
+
+    def __getitem__(self, name):
+        self.clean_cache()
+        cache_file = self._hash_filename(name)
+        if not cache_file.exists():
+            return None
+        cache_file.touch()
+        return cache_file
+
+    def __setitem__(self, name, data):
+        with open(self._hash_filename(name), 'wb') as f:
+            f.write(data)
+        self.clean_cache()
+
+    def clean_cache(self):
+        cached_files = [
+            (f.stat().st_mtime, f.absolute())
+            for f in self._cache_dir.glob('*')
+            if not f.name.startswith('.')
+        ]
+        cached_files = sorted(cached_files, key=lambda x: x[0], reverse=True)
+        if self._max_items is not None:
+            oldest = cached_files[self._max_items :]
+            self._remove([filename for (mtime, filename) in oldest])
+
+
+def fill(cache_dir, n):
+    """Write `n` small entries directly into `cache_dir`; both
+    implementations pick them up (the indexed cache imports them when its
+    index is created)."""
+    cache = Cache(cache_dir, max_items=None)
+    cache_dir = Path(cache_dir)
+    os.remove(cache_dir / Cache.INDEX_FILENAME)
+    for suffix in ['-wal', '-shm']:
+        path = cache_dir / (Cache.INDEX_FILENAME + suffix)
+        if path.exists():
+            os.remove(path)
+    for i in range(n):
+        with open(cache._hash_filename(f'entry-{i}'), 'wb') as f:
+            f.write(b'x' * 64)
+
+
+def run(cls, n, ops):
+    cache_dir = tempfile.mkdtemp(prefix='skyportal-cache-bench-')
+    try:
+        fill(cache_dir, n)
+        cache = cls(cache_dir, max_items=n)
+
+        t0 = time.perf_counter()
+        for i in range(ops):
+            cache[f'entry-{i}']
+        t_get = (time.perf_counter() - t0) / ops
+
+        t0 = time.perf_counter()
+        for i in range(ops):
+            cache[f'new-entry-{i}'] = b'x' * 64
+        t_set = (time.perf_counter() - t0) / ops
+
+        assert len(os.listdir(cache_dir)) - 3 <= n
+    finally:
+        shutil.rmtree(cache_dir)
+    return t_get, t_set
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 100_000])
+    parser.add_argument('--ops', type=int, default=200)
+    args = parser.parse_args()
+
+    print(f'{"entries":>8} {"implementation":>16} {"get (ms)":>10} {"set (ms)":>10}')
+    for n in args.sizes:
+        for label, cls in [('directory scan', DirectoryScanCache), ('indexed', Cache)]:
+            # the directory scan is too slow to run many operations on large
+            # caches; a handful is enough to measure it
+            ops = args.ops if cls is Cache else max(1, args.ops * 1000 // n)
+            t_get, t_set = run(cls, n, ops)
+            print(f'{n:>8} {label:>16} {t_get * 1e3:>10.3f} {t_set * 1e3:>10.3f}')
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+"""Compare storing spectrum arrays as Postgres float arrays with storing them
+as binary (`NumpyBinaryArray`), uncompressed and zlib-compressed.
+
+For each representation, a temporary table with `--n-spectra` spectra of
+`--n-points` samples each is created in the configured database, and the
+time to load all of them back as NumPy arrays and the size of the table
+(including TOAST) are reported.
+
+Usage: python tools/benchmark_spectrum_storage.py [--n-spectra 50] [--n-points 50000]
+"""
+import time
+
+import numpy as np
+import sqlalchemy as sa
+
+from baselayer.app.env import load_env, parser
+from skyportal.models import init_db, DBSession, NumpyArray, NumpyBinaryArray
+
+
+def run(label, column_type, spectra):
+    if isinstance(column_type, NumpyArray):
+        # float arrays are bound as lists
+        spectra = [[array.tolist() for array in spectrum] for spectrum in spectra]
+
+    table = sa.Table(
+        f'spectrum_storage_benchmark_{label}',
+        sa.MetaData(),
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('wavelengths', column_type),
+        sa.Column('fluxes', column_type),
+        sa.Column('errors', column_type),
+        prefixes=['TEMPORARY'],
+    )
+    connection = DBSession().connection()
+    table.create(connection)
+    connection.execute(
+        table.insert(),
+        [
+            {'wavelengths': wavelengths, 'fluxes': fluxes, 'errors': errors}
+            for wavelengths, fluxes, errors in spectra
+        ],
+    )
+    connection.execute(f'ANALYZE {table.name}')
+
+    t0 = time.perf_counter()
+    rows = connection.execute(
+        sa.select([table.c.wavelengths, table.c.fluxes, table.c.errors])
+    ).fetchall()
+    t_load = time.perf_counter() - t0
+    assert all(isinstance(row['fluxes'], np.ndarray) for row in rows)
+
+    size = connection.execute(
+        sa.text('SELECT pg_total_relation_size(:name)'), {'name': table.name}
+    ).scalar()
+    table.drop(connection)
+    return t_load, size
+
+
+if __name__ == '__main__':
+    parser.description = __doc__.splitlines()[0]
+    parser.add_argument('--n-spectra', type=int, default=50)
+    parser.add_argument('--n-points', type=int, default=50_000)
+    env, cfg = load_env()
+    init_db(**cfg['database'])
+
+    rng = np.random.default_rng(0)
+    spectra = []
+    for _ in range(env.n_spectra):
+        wavelengths = np.linspace(3000, 10000, env.n_points)
+        fluxes = 1e-16 * (1 + 0.1 * rng.standard_normal(env.n_points))
+        errors = 1e-17 * np.abs(rng.standard_normal(env.n_points))
+        spectra.append((wavelengths, fluxes, errors))
+
+    print(f'{env.n_spectra} spectra of {env.n_points} points')
+    print(f'{"storage":>16} {"load (s)":>10} {"size (MB)":>10}')
+    for label, column_type in [
+        ('float_array', NumpyArray()),
+        ('binary', NumpyBinaryArray()),
+        ('binary_zlib', NumpyBinaryArray(compress=True)),
+    ]:
+        t_load, size = run(label, column_type, spectra)
+        print(f'{label:>16} {t_load:>10.3f} {size / 2 ** 20:>10.1f}')
+
+    DBSession().rollback()